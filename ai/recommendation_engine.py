@@ -24,7 +24,8 @@ class RecommendationEngine:
     def recommend_services(
         self,
         customer_id: str,
-        limit: int = 5
+        limit: int = 5,
+        popular_services: Optional[List[Dict]] = None
     ) -> List[Dict]:
         """
         顧客に最適なサービスを推薦
@@ -32,6 +33,7 @@ class RecommendationEngine:
         Args:
             customer_id: 顧客ID
             limit: 推薦するサービスの数
+            popular_services: 集計済みの人気サービス（省略時はここで集計）
         
         Returns:
             推薦サービスのリスト
@@ -78,7 +80,8 @@ class RecommendationEngine:
                 })
         
         # 人気のサービス（予約数が多い）
-        popular_services = self._get_popular_services(limit=limit)
+        if popular_services is None:
+            popular_services = self._get_popular_services(limit=limit)
         for service in popular_services:
             if service["id"] not in [s["id"] for s in recommended]:
                 recommended.append({
@@ -138,7 +141,8 @@ class RecommendationEngine:
         self,
         customer_id: str,
         service_id: Optional[str] = None,
-        limit: int = 5
+        limit: int = 5,
+        popular_products: Optional[List[Dict]] = None
     ) -> List[Dict]:
         """
         顧客に最適な商品を推薦
@@ -147,6 +151,7 @@ class RecommendationEngine:
             customer_id: 顧客ID
             service_id: 関連するサービスID（オプション）
             limit: 推薦する商品の数
+            popular_products: 集計済みの人気商品（省略時はここで集計）
         
         Returns:
             推薦商品のリスト
@@ -181,7 +186,8 @@ class RecommendationEngine:
                         })
         
         # 人気の商品
-        popular_products = self._get_popular_products(limit=limit)
+        if popular_products is None:
+            popular_products = self._get_popular_products(limit=limit)
         for product in popular_products:
             if product["id"] not in [p["id"] for p in recommended]:
                 recommended.append({
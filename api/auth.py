@@ -3,31 +3,42 @@
 JWTトークンを使用した店舗認証
 """
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import Client
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
-from api.database import get_db
+from api.database import Client, get_db
 from api.logger import logger
 
-# パスワードハッシュ用のコンテキスト
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """
+    パスワードハッシュ用のコンテキスト
+
+    passlib/bcryptの読み込みはログインと店舗登録でしか使わないため、初回利用時まで遅延する
+    """
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # HTTP Bearer認証
 security = HTTPBearer()
 
+# 認証済みリクエストごとに取得する店舗情報の列
+SHOP_SESSION_COLUMNS = "id, email, name, admin_email, admin_name"
+# ログイン時の照合に使う列
+SHOP_LOGIN_COLUMNS = SHOP_SESSION_COLUMNS + ", password_hash"
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """パスワードを検証"""
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return get_pwd_context().verify(plain_password, hashed_password)
     except Exception as e:
         logger.error(f"パスワード検証エラー: {str(e)}")
         return False
@@ -35,11 +46,13 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     """パスワードをハッシュ化"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """JWTアクセストークンを生成"""
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -53,6 +66,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 def verify_token(token: str) -> Optional[dict]:
     """JWTトークンを検証"""
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         return payload
@@ -68,7 +83,7 @@ async def authenticate_shop(email: str, password: str, db: Client) -> Optional[d
     """店舗の認証"""
     try:
         # 店舗を検索
-        result = db.table("shops").select("*").eq("email", email).eq("is_active", True).execute()
+        result = db.table("shops").select(SHOP_LOGIN_COLUMNS).eq("email", email).eq("is_active", True).execute()
         
         if not result.data or len(result.data) == 0:
             return None
@@ -114,7 +129,7 @@ async def get_current_shop(
     
     try:
         token = credentials.credentials
-        logger.debug(f"トークン受信: {token[:20]}...")
+        logger.debug("トークン受信: %s...", token[:20])
         payload = verify_token(token)
         
         if payload is None:
@@ -126,7 +141,7 @@ async def get_current_shop(
             raise credentials_exception
         
         # 店舗の存在確認とアクティブ状態の確認
-        result = db.table("shops").select("*").eq("id", shop_id).eq("is_active", True).execute()
+        result = db.table("shops").select(SHOP_SESSION_COLUMNS).eq("id", shop_id).eq("is_active", True).execute()
         
         if not result.data or len(result.data) == 0:
             raise HTTPException(
@@ -0,0 +1,156 @@
+"""
+店舗単位のインメモリキャッシュ
+公開カタログなど、匿名アクセスが多く更新の少ないデータを店舗ごとに保持する
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+
+
+class _CacheEntry:
+    """キャッシュエントリ"""
+
+    def __init__(self, value: Any, expires_at: float):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class _Build:
+    """構築中の店舗の状態（構築を待つリクエストがいなくなれば破棄する）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = 0
+        # 構築中に破棄された場合に古い値を保存しないための世代番号
+        self.generation = 0
+
+
+class TenantCache:
+    """
+    店舗IDをキーとするキャッシュ
+
+    書き込み系APIから invalidate() で破棄され、次の読み取りで再構築される。
+    別プロセスでの更新に追従するため、ttl_seconds経過後も再構築する。
+    同じ店舗の再構築は同時に1回だけ行い、他のリクエストはその結果を待つ。
+    builderがNoneを返した場合（存在しない店舗など）はnegative_ttl_secondsだけ保持する。
+    保持する店舗数は max_entries までで、超えた場合は期限切れ・使われていない順に捨てる
+    （構築中の状態は構築が終われば捨てるため、匿名のリクエストで任意のIDを渡されてもメモリは増え続けない）。
+    存在しない店舗の結果は別の max_negative_entries 件までの領域に保持し、実在する店舗の値を追い出さない。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        negative_ttl_seconds: int = 30,
+        max_entries: Optional[int] = None,
+        max_negative_entries: Optional[int] = None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries or settings.TENANT_CACHE_MAX_ENTRIES
+        self.max_negative_entries = max_negative_entries or settings.TENANT_CACHE_MAX_NEGATIVE_ENTRIES
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        # 存在しない店舗（builderがNoneを返した店舗）の結果
+        self._missing: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._builds: Dict[str, _Build] = {}
+
+    def _get_valid(self, shop_id: str) -> Optional[_CacheEntry]:
+        with self._lock:
+            for entries in (self._entries, self._missing):
+                entry = entries.get(shop_id)
+                if entry is None:
+                    continue
+                if entry.expires_at <= time.monotonic():
+                    del entries[shop_id]
+                    return None
+                entries.move_to_end(shop_id)
+                return entry
+            return None
+
+    def _store(self, shop_id: str, entry: _CacheEntry) -> None:
+        # self._lock を保持して呼ぶ
+        if entry.value is None:
+            entries, other, limit = self._missing, self._entries, self.max_negative_entries
+        else:
+            entries, other, limit = self._entries, self._missing, self.max_entries
+        other.pop(shop_id, None)
+        entries[shop_id] = entry
+        entries.move_to_end(shop_id)
+        if len(entries) > limit:
+            now = time.monotonic()
+            for key in [key for key, cached in entries.items() if cached.expires_at <= now]:
+                del entries[key]
+            while len(entries) > limit:
+                entries.popitem(last=False)
+
+    def get_or_build(self, shop_id: str, builder: Callable[[], Any]) -> Any:
+        """
+        キャッシュから値を取得し、なければbuilderで構築して保存
+
+        Args:
+            shop_id: 店舗ID
+            builder: 値を構築する関数
+
+        Returns:
+            キャッシュされた値
+        """
+        entry = self._get_valid(shop_id)
+        if entry is not None:
+            return entry.value
+
+        with self._lock:
+            build = self._builds.get(shop_id)
+            if build is None:
+                build = self._builds[shop_id] = _Build()
+            build.waiters += 1
+
+        try:
+            with build.lock:
+                # 待っている間に他のリクエストが構築済みの場合はそれを使う
+                entry = self._get_valid(shop_id)
+                if entry is not None:
+                    return entry.value
+
+                generation = build.generation
+                value = builder()
+                with self._lock:
+                    if build.generation == generation:
+                        ttl = self.ttl_seconds if value is not None else self.negative_ttl_seconds
+                        self._store(shop_id, _CacheEntry(value, time.monotonic() + ttl))
+                return value
+        finally:
+            with self._lock:
+                build.waiters -= 1
+                if build.waiters == 0 and self._builds.get(shop_id) is build:
+                    del self._builds[shop_id]
+
+    def invalidate(self, shop_id: str) -> None:
+        """店舗のキャッシュを破棄"""
+        with self._lock:
+            build = self._builds.get(shop_id)
+            if build is not None:
+                build.generation += 1
+            self._entries.pop(shop_id, None)
+            self._missing.pop(shop_id, None)
+
+    def clear(self) -> None:
+        """全店舗のキャッシュを破棄"""
+        with self._lock:
+            for build in self._builds.values():
+                build.generation += 1
+            self._entries.clear()
+            self._missing.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._missing)
+
+
+# 公開予約カタログ用キャッシュ（店舗ID → 構築済みカタログ）
+catalog_cache = TenantCache(settings.CATALOG_CACHE_TTL_SECONDS)
@@ -0,0 +1,172 @@
+"""
+クーポンの使用枠（トークン）のインメモリキャッシュ
+使用回数に上限のあるクーポンの残り回数をプロセス内で保持し、
+タイムセールなどで同じコードに注文が集中したときに、残りを超える注文をデータベースに送らずに断る
+
+使用回数の上限はデータベースの条件付きの加算（place_order）で保証され、このキャッシュは前段の絞り込みだけを行う。
+残り回数は読み取り時点の値のため、他のプロセスでの使用分はttl_seconds経過後の再取得で反映される。
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+
+
+class _CouponEntry:
+    """クーポン1件の残り回数"""
+
+    def __init__(self, remaining: Optional[int], expires_at: float):
+        # Noneの場合は上限なし（絞り込まない）
+        self.remaining = remaining
+        # 使用枠を確保し、注文の結果を待っている数
+        self.in_flight = 0
+        self.expires_at = expires_at
+
+
+class CouponToken:
+    """
+    確保した使用枠
+
+    注文の結果に応じて commit()（使用された）か release()（使用されなかった）のどちらかを1回だけ呼ぶ。
+    """
+
+    def __init__(self, cache: "CouponTokenCache", entry: Optional[_CouponEntry]):
+        self._cache = cache
+        self._entry = entry
+        self._settled = entry is None
+
+    def commit(self) -> None:
+        """使用枠を消費する"""
+        self._settle(used=True)
+
+    def release(self) -> None:
+        """使用枠を返す"""
+        self._settle(used=False)
+
+    def _settle(self, used: bool) -> None:
+        with self._cache._lock:
+            if self._settled:
+                return
+            self._settled = True
+            self._entry.in_flight -= 1
+            if used and self._entry.remaining is not None:
+                self._entry.remaining = max(0, self._entry.remaining - 1)
+
+
+class CouponTokenCache:
+    """
+    (店舗ID, クーポンコード) をキーとする使用枠のキャッシュ
+
+    - ttl_seconds以内にhot_threshold回以上使われたコードだけ、残り回数を取得して保持する
+      （あまり使われないコードでは取得のクエリを増やさない）
+    - 残り回数から結果待ちの注文数を引いた数だけ使用枠を確保でき、使い切った場合は reserve() がNoneを返す
+    - データベースが上限到達を返した場合は mark_exhausted() でttl_secondsの間すべて断る
+    """
+
+    MAX_TRACKED_CODES = 10000
+
+    def __init__(self, ttl_seconds: float, hot_threshold: int):
+        self.ttl_seconds = ttl_seconds
+        self.hot_threshold = hot_threshold
+        self._entries: Dict[Tuple[str, str], _CouponEntry] = {}
+        # 残り回数を保持していないコードの (使用回数, 数え始めた時刻)
+        self._hits: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _get_valid(self, key: Tuple[str, str], now: float) -> Optional[_CouponEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > now:
+            return entry
+        return None
+
+    def _is_hot(self, key: Tuple[str, str], now: float) -> bool:
+        if len(self._hits) >= self.MAX_TRACKED_CODES:
+            # 数え始めてからttl_secondsを過ぎたコードを捨てる（一度しか使われないコードで増え続けないように）
+            self._hits = {
+                k: v for k, v in self._hits.items() if now - v[1] <= self.ttl_seconds
+            }
+        count, since = self._hits.get(key, (0, now))
+        if now - since > self.ttl_seconds:
+            count, since = 0, now
+        count += 1
+        if count >= self.hot_threshold:
+            self._hits.pop(key, None)
+            return True
+        self._hits[key] = (count, since)
+        return False
+
+    def reserve(
+        self,
+        shop_id: str,
+        code: str,
+        loader: Callable[[], Optional[dict]]
+    ) -> Optional[CouponToken]:
+        """
+        使用枠を確保
+
+        Args:
+            shop_id: 店舗ID
+            code: クーポンコード
+            loader: クーポンの usage_limit / usage_count を取得する関数（存在しない場合はNone）
+
+        Returns:
+            確保した使用枠（残りがない場合はNone）
+        """
+        key = (shop_id, code)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._get_valid(key, now)
+            if entry is None and not self._is_hot(key, now):
+                return CouponToken(self, None)
+
+        if entry is None:
+            coupon = loader()
+            if coupon is None:
+                # 存在しないコードのエラーはデータベースに任せる
+                return CouponToken(self, None)
+            remaining = None
+            if coupon.get("usage_limit") is not None:
+                remaining = max(0, coupon["usage_limit"] - (coupon.get("usage_count") or 0))
+            with self._lock:
+                # 取得している間に他のリクエストが保存した値があればそれを使う（結果待ちの数を引き継ぐため）
+                entry = self._get_valid(key, now)
+                if entry is None:
+                    entry = self._entries[key] = _CouponEntry(remaining, now + self.ttl_seconds)
+
+        with self._lock:
+            if entry.remaining is not None and entry.remaining - entry.in_flight <= 0:
+                return None
+            entry.in_flight += 1
+            return CouponToken(self, entry)
+
+    def mark_exhausted(self, shop_id: str, code: str) -> None:
+        """上限に達したコードとして保持する"""
+        key = (shop_id, code)
+        with self._lock:
+            entry = self._get_valid(key, time.monotonic())
+            if entry is None:
+                entry = self._entries[key] = _CouponEntry(0, time.monotonic() + self.ttl_seconds)
+            entry.remaining = 0
+
+    def invalidate(self, shop_id: str) -> None:
+        """店舗のクーポンの残り回数を破棄（クーポンの更新・削除後に再取得させる）"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == shop_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """すべての残り回数を破棄"""
+        with self._lock:
+            self._entries.clear()
+            self._hits.clear()
+
+
+# 注文作成で使うクーポンの使用枠キャッシュ
+coupon_tokens = CouponTokenCache(
+    settings.COUPON_TOKEN_TTL_SECONDS,
+    settings.COUPON_TOKEN_HOT_THRESHOLD
+)
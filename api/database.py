@@ -1,14 +1,20 @@
 """
 データベース接続とセッション管理
 """
-from supabase import Client
-from typing import Generator
+from typing import TYPE_CHECKING, Any, Callable, Generator, Iterator, List, Optional, Tuple
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from api.supabase_client import supabase
 
+if TYPE_CHECKING:
+    from supabase import Client
+else:
+    # supabaseパッケージの読み込みをコールドスタートから外すため、
+    # 実行時の型注釈（ルートの依存関数の引数など）にはAnyを使う
+    Client = Any
+
 
 def get_db() -> Generator[Client, None, None]:
     """
@@ -33,8 +39,61 @@ def get_service_db() -> Generator[Client, None, None]:
         pass
 
 
+def row_exists(db: Client, table: str, **filters: Any) -> bool:
+    """
+    条件に一致する行が存在するかを確認する
 
+    存在確認のためだけに全列を取得しないよう、id列を1行だけ取得する。
 
+    Args:
+        db: データベースクライアント
+        table: テーブル名
+        **filters: 列名=値 の等価条件（所有権チェックには shop_id を含める）
+    """
+    query = db.table(table).select("id")
+    for column, value in filters.items():
+        query = query.eq(column, value)
+    return bool(query.limit(1).execute().data)
 
 
+def iter_keyset_pages(
+    build_query: Callable[[], Any],
+    order_column: str,
+    chunk_size: int = 500,
+    start_after: Optional[Tuple[Any, str]] = None
+) -> Iterator[List[dict]]:
+    """
+    キーセットページネーションでクエリ結果をチャンクごとに取得する
+
+    OFFSETを使わず (order_column, id) の組で次ページの開始位置を指定するため、
+    行数が増えても各チャンクの取得コストとメモリ使用量は一定に保たれる。
+
+    Args:
+        build_query: フィルタ済みのselectクエリを毎回新しく生成する関数
+            （order_columnとidを取得列に含めること）
+        order_column: 並び順に使う列（NULLを含まない列を指定する）
+        chunk_size: 1回のリクエストで取得する行数
+        start_after: この (order_columnの値, id) の次の行から取得する（中断した処理の再開用）
+
+    Yields:
+        取得した行のリスト
+    """
+    last_key = start_after
+    while True:
+        query = build_query()
+        if last_key is not None:
+            last_value, last_id = last_key
+            query = query.or_(
+                f'{order_column}.gt."{last_value}",'
+                f'and({order_column}.eq."{last_value}",id.gt.{last_id})'
+            )
+        result = query.order(order_column).order("id").limit(chunk_size).execute()
+        rows = result.data or []
+        if not rows:
+            return
+
+        yield rows
 
+        if len(rows) < chunk_size:
+            return
+        last_key = (rows[-1][order_column], rows[-1]["id"])
@@ -0,0 +1,160 @@
+"""
+Supabaseクライアントの計測ラッパー
+.execute() ごとにテーブル・操作・絞り込み条件・行数・データ量・所要時間を記録し、
+スロークエリとN+1パターンを警告する
+
+データ量はPostgRESTとの間で実際に送受信したバイト数で、HTTPトランスポート（api.http_transport）が数える
+（結果を計測のためにシリアライズし直すことはしない。HTTPを使わないインメモリクライアントでは0になる）
+"""
+import time
+from contextvars import ContextVar
+from typing import Any, List, Optional
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from api.logger import logger
+from api.metrics import current_request_db_stats, metrics_registry, record_db_call
+
+
+# クエリの種類を決めるビルダーメソッド
+OPERATIONS = {"select", "insert", "update", "upsert", "delete"}
+# 絞り込み条件として記録するビルダーメソッド（値は個人情報を含みうるため列名のみ記録）
+FILTER_METHODS = {
+    "eq", "neq", "gt", "gte", "lt", "lte", "like", "ilike", "is_", "in_",
+    "contains", "contained_by", "range_gt", "range_gte", "range_lt", "range_lte",
+    "text_search", "match", "or_", "filter",
+}
+
+
+# 実行中のクエリの送受信バイト数（executeの間だけ設定される）
+_transferred_bytes: ContextVar[Optional[List[int]]] = ContextVar("db_transferred_bytes", default=None)
+
+
+def add_transferred_bytes(size: int) -> None:
+    """実行中のクエリの送受信バイト数に加算（クエリの実行中でなければ何もしない）"""
+    counter = _transferred_bytes.get()
+    if counter is not None:
+        counter[0] += size
+
+
+class QueryInfo:
+    """1クエリ分の計測情報（メソッドチェーンの間で共有する）"""
+
+    def __init__(self, table: str, operation: str = "select"):
+        self.table = table
+        self.operation = operation
+        self.filters: List[str] = []
+
+    def describe(self) -> str:
+        filters = ", ".join(self.filters) if self.filters else "なし"
+        return f"{self.table}.{self.operation} 条件: {filters}"
+
+
+class InstrumentedQuery:
+    """クエリビルダーのプロキシ（メソッドチェーンを維持したままexecuteを計測）"""
+
+    def __init__(self, builder: Any, info: QueryInfo):
+        self._builder = builder
+        self._info = info
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._builder, name)
+        # not_ のようにビルダーを返すプロパティ
+        if hasattr(attr, "execute"):
+            return InstrumentedQuery(attr, self._info)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self._track(name, args)
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                return InstrumentedQuery(result, self._info)
+            return result
+
+        return call
+
+    def _track(self, name: str, args: tuple) -> None:
+        if name in OPERATIONS:
+            self._info.operation = name
+        elif name in FILTER_METHODS:
+            if name in ("or_", "match"):
+                self._info.filters.append(name.rstrip("_"))
+            elif args:
+                self._info.filters.append(f"{args[0]}:{name.rstrip('_')}")
+
+    def execute(self):
+        info = self._info
+        start = time.perf_counter()
+        failed = True
+        rows = 0
+        transferred = [0]
+        token = _transferred_bytes.set(transferred)
+        try:
+            result = self._builder.execute()
+            failed = False
+            data = getattr(result, "data", None)
+            if isinstance(data, list):
+                rows = len(data)
+            elif data is not None:
+                rows = 1
+            return result
+        finally:
+            duration = time.perf_counter() - start
+            _transferred_bytes.reset(token)
+            payload_bytes = transferred[0]
+            metrics_registry.observe_db_query(
+                info.table, info.operation, duration, rows, payload_bytes, failed
+            )
+            self._check_query(info, duration, rows, payload_bytes)
+
+    def _check_query(self, info: QueryInfo, duration: float, rows: int, payload_bytes: int) -> None:
+        """スロークエリとN+1パターンを検出して警告"""
+        elapsed_ms = duration * 1000
+        if elapsed_ms >= settings.DB_SLOW_QUERY_MS:
+            logger.warning(
+                "スロークエリ: %s 行数: %d データ量: %dbytes 所要時間: %.1fms",
+                info.describe(), rows, payload_bytes, elapsed_ms
+            )
+
+        table_calls = record_db_call(info.table)
+        if table_calls > settings.DB_N_PLUS_ONE_THRESHOLD:
+            stats = current_request_db_stats()
+            if stats is not None and info.table not in stats.warned_tables:
+                stats.warned_tables.add(info.table)
+                logger.warning(
+                    "N+1の可能性: %s %s で %s へのクエリが%d回を超えました（直近: %s）",
+                    stats.method, stats.path, info.table,
+                    settings.DB_N_PLUS_ONE_THRESHOLD, info.describe()
+                )
+
+
+class InstrumentedClient:
+    """
+    Supabaseクライアントのプロキシ
+
+    table()/rpc() で作られたクエリの実行を計測する。
+    storageやauthなどその他の属性は元のクライアントをそのまま返す。
+    """
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        """ラップしている元のクライアント"""
+        return self._client
+
+    def table(self, table_name: str) -> InstrumentedQuery:
+        return InstrumentedQuery(self._client.table(table_name), QueryInfo(table_name))
+
+    def from_(self, table_name: str) -> InstrumentedQuery:
+        return self.table(table_name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None) -> InstrumentedQuery:
+        return InstrumentedQuery(self._client.rpc(fn, params or {}), QueryInfo(f"rpc:{fn}", "rpc"))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
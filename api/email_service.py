@@ -64,6 +64,60 @@ class EmailService:
                 missing.append("SMTP_PASSWORD")
             logger.warning(f"メール送信サービスが無効です。以下の環境変数が設定されていません: {', '.join(missing)}")
     
+    def _smtp_log_fields(self) -> dict:
+        """ログに構造化フィールドとして付与するSMTP設定（パスワードは含めない）"""
+        return {
+            "smtp_host": self.smtp_host,
+            "smtp_port": self.smtp_port,
+            "smtp_user": self.smtp_user,
+            "email_from": self.email_from
+        }
+    
+    def build_message(
+        self,
+        to_email: str,
+        subject: str,
+        body_html: str,
+        body_text: Optional[str] = None
+    ) -> MIMEMultipart:
+        """送信するメールを作成"""
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = self.email_from
+        msg['To'] = to_email
+        
+        if body_text:
+            part1 = MIMEText(body_text, 'plain', 'utf-8')
+            msg.attach(part1)
+        
+        part2 = MIMEText(body_html, 'html', 'utf-8')
+        msg.attach(part2)
+        return msg
+    
+    def connect(self) -> smtplib.SMTP:
+        """
+        SMTPサーバーに接続してログイン
+        
+        一斉送信などで同じ接続を使って複数のメールを送る場合に使う（呼び出し側で quit() する）。
+        """
+        # SSL接続（ポート465など）
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.smtp_host, self.smtp_port)
+        # STARTTLS接続（ポート587など）
+        elif self.use_tls:
+            server = smtplib.SMTP(self.smtp_host, self.smtp_port)
+            server.starttls()
+        # 暗号化なし（非推奨、テスト用のみ）
+        else:
+            logger.warning("暗号化なしでメール送信を試行します（非推奨）")
+            server = smtplib.SMTP(self.smtp_host, self.smtp_port)
+        try:
+            server.login(self.smtp_user, self.smtp_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
     def send_email(
         self,
         to_email: str,
@@ -92,101 +146,69 @@ class EmailService:
             if not self.smtp_password:
                 missing.append("SMTP_PASSWORD")
             logger.error(
-                f"メール送信が無効です。SMTP設定が不足しています。送信先: {to_email}, 件名: {subject}\n"
-                f"不足している設定: {', '.join(missing) if missing else 'なし'}\n"
-                f"現在の設定 - HOST: {self.smtp_host or '未設定'}, PORT: {self.smtp_port}, "
-                f"USER: {self.smtp_user or '未設定'}, FROM: {self.email_from or '未設定'}"
+                "メール送信が無効です。SMTP設定が不足しています: %s",
+                ", ".join(missing) if missing else "なし",
+                extra={"to_email": to_email, "subject": subject, **self._smtp_log_fields()}
             )
             return False
         
         try:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.email_from
-            msg['To'] = to_email
-            
-            if body_text:
-                part1 = MIMEText(body_text, 'plain', 'utf-8')
-                msg.attach(part1)
-            
-            part2 = MIMEText(body_html, 'html', 'utf-8')
-            msg.attach(part2)
+            msg = self.build_message(to_email, subject, body_html, body_text)
             
             connection_type = "SSL" if self.use_ssl else ("STARTTLS" if self.use_tls else "なし")
-            logger.info(f"メール送信を試行します。送信先: {to_email}, 件名: {subject}, SMTP: {self.smtp_host}:{self.smtp_port} ({connection_type})")
+            logger.info(
+                "メール送信を試行します。送信先: %s, 件名: %s, 接続: %s",
+                to_email, subject, connection_type,
+                extra={"smtp_host": self.smtp_host, "smtp_port": self.smtp_port}
+            )
             
-            # SSL接続（ポート465など）
-            if self.use_ssl:
-                with smtplib.SMTP_SSL(self.smtp_host, self.smtp_port) as server:
-                    server.login(self.smtp_user, self.smtp_password)
-                    server.send_message(msg)
-            # STARTTLS接続（ポート587など）
-            elif self.use_tls:
-                with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                    server.starttls()
-                    server.login(self.smtp_user, self.smtp_password)
-                    server.send_message(msg)
-            # 暗号化なし（非推奨、テスト用のみ）
-            else:
-                logger.warning("暗号化なしでメール送信を試行します（非推奨）")
-                with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                    server.login(self.smtp_user, self.smtp_password)
-                    server.send_message(msg)
+            with self.connect() as server:
+                server.send_message(msg)
             
-            logger.info(f"メール送信成功。送信先: {to_email}, 件名: {subject}")
+            logger.info("メール送信成功。送信先: %s, 件名: %s", to_email, subject)
             return True
         except smtplib.SMTPAuthenticationError as e:
             logger.error(
-                f"SMTP認証エラー: {str(e)}\n"
-                f"送信先: {to_email}, 件名: {subject}\n"
-                f"SMTP設定 - HOST: {self.smtp_host}, PORT: {self.smtp_port}, USER: {self.smtp_user}\n"
-                f"ユーザー名またはパスワードが正しくない可能性があります。"
+                "SMTP認証エラー（ユーザー名またはパスワードが正しくない可能性があります）: %s", e,
+                extra={"to_email": to_email, "subject": subject, **self._smtp_log_fields()}
             )
             return False
         except smtplib.SMTPConnectError as e:
             logger.error(
-                f"SMTP接続エラー: {str(e)}\n"
-                f"送信先: {to_email}, 件名: {subject}\n"
-                f"SMTPサーバー({self.smtp_host}:{self.smtp_port})に接続できません。\n"
-                f"ファイアウォールやネットワーク設定を確認してください。"
+                "SMTP接続エラー（ファイアウォールやネットワーク設定を確認してください）: %s", e,
+                extra={"to_email": to_email, "subject": subject, **self._smtp_log_fields()}
             )
             return False
         except smtplib.SMTPRecipientsRefused as e:
             logger.error(
-                f"SMTP受信者拒否エラー: {str(e)}\n"
-                f"送信先: {to_email}, 件名: {subject}\n"
-                f"メールアドレスが無効または拒否されています。"
+                "SMTP受信者拒否エラー（メールアドレスが無効または拒否されています）: %s", e,
+                extra={"to_email": to_email, "subject": subject}
             )
             return False
         except smtplib.SMTPSenderRefused as e:
             logger.error(
-                f"SMTP送信者拒否エラー: {str(e)}\n"
-                f"送信先: {to_email}, 件名: {subject}\n"
-                f"送信者アドレス({self.email_from})が拒否されています。"
+                "SMTP送信者拒否エラー（送信者アドレスが拒否されています）: %s", e,
+                extra={"to_email": to_email, "subject": subject, "email_from": self.email_from}
             )
             return False
         except smtplib.SMTPDataError as e:
             logger.error(
-                f"SMTPデータエラー: {str(e)}\n"
-                f"送信先: {to_email}, 件名: {subject}\n"
-                f"メールデータが拒否されました。"
+                "SMTPデータエラー（メールデータが拒否されました）: %s", e,
+                extra={"to_email": to_email, "subject": subject}
             )
             return False
         except smtplib.SMTPException as e:
             logger.error(
-                f"SMTPエラー: {str(e)}\n"
-                f"送信先: {to_email}, 件名: {subject}\n"
-                f"SMTP設定 - HOST: {self.smtp_host}, PORT: {self.smtp_port}"
+                "SMTPエラー: %s", e,
+                extra={"to_email": to_email, "subject": subject, **self._smtp_log_fields()}
             )
             return False
         except Exception as e:
             logger.error(
-                f"メール送信エラー: {type(e).__name__}: {str(e)}\n"
-                f"送信先: {to_email}, 件名: {subject}\n"
-                f"SMTP設定 - HOST: {self.smtp_host}, PORT: {self.smtp_port}, USER: {self.smtp_user}"
+                "メール送信エラー: %s: %s", type(e).__name__, e,
+                exc_info=e,
+                extra={"to_email": to_email, "subject": subject, **self._smtp_log_fields()}
             )
-            import traceback
-            logger.error(f"エラー詳細: {traceback.format_exc()}")
             return False
     
     def send_reservation_confirmation(
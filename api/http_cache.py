@@ -0,0 +1,155 @@
+"""
+HTTPキャッシュ（ETag / Last-Modified）ユーティリティ
+更新頻度の低いカタログ系エンドポイントで条件付きリクエストに304を返す
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+from api.database import Client
+
+
+# 認証付きエンドポイント用: ブラウザには保存させるが毎回再検証させる
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def public_cache_control(max_age: int) -> str:
+    """公開エンドポイント用のCache-Controlを生成"""
+    return f"public, max-age={max_age}, stale-while-revalidate={max_age}"
+
+
+class CacheValidator:
+    """ETagとLast-Modifiedの組"""
+
+    def __init__(self, etag: str, last_modified: Optional[datetime] = None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """PostgRESTのタイムスタンプ文字列をUTCのdatetimeに変換"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def build_etag(*parts) -> str:
+    """
+    バリデータの構成要素から弱いETagを生成
+
+    レスポンス圧縮でバイト列が変わるため、弱いETag（W/）とする。
+    """
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def get_table_validator(
+    db: Client,
+    table: str,
+    shop_id: str,
+    request: Request,
+    resource: str = ""
+) -> CacheValidator:
+    """
+    店舗のテーブル内容からキャッシュバリデータを生成
+
+    最終更新日時（updated_atの最大値）と件数を1件だけ取得する軽量クエリで求めるため、
+    本体のデータ取得とシリアライズをせずに変更有無を判定できる。
+    updated_atはトリガーで更新され、物理削除は件数の変化で検出する。
+    クエリパラメータ（ページ・絞り込み条件）もETagに含める。
+
+    Args:
+        db: Supabaseクライアント
+        table: テーブル名
+        shop_id: 店舗ID
+        request: リクエスト
+        resource: 同じテーブルを使う別表現（カテゴリ一覧など）を区別するための識別子
+
+    Returns:
+        CacheValidator
+    """
+    result = db.table(table).select("updated_at", count="exact").eq(
+        "shop_id", shop_id
+    ).order("updated_at", desc=True).limit(1).execute()
+
+    latest = result.data[0].get("updated_at") if result.data else None
+    query = sorted(request.query_params.multi_items())
+    etag = build_etag(table, resource, shop_id, latest, result.count, query)
+    return CacheValidator(etag, parse_timestamp(latest))
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Matchの弱い比較"""
+    if if_none_match.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def _not_modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    """If-Modified-Since以降に更新されていなければTrue"""
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP日付は秒単位のため、比較も秒単位で行う
+    return last_modified.replace(microsecond=0) <= since
+
+
+def apply_cache_headers(response: Response, validator: CacheValidator, cache_control: str) -> None:
+    """レスポンスにETag・Last-Modified・Cache-Controlを設定"""
+    response.headers["ETag"] = validator.etag
+    if validator.last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(
+            validator.last_modified.astimezone(timezone.utc), usegmt=True
+        )
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified_response(
+    request: Request,
+    validator: CacheValidator,
+    cache_control: str
+) -> Optional[Response]:
+    """
+    条件付きリクエストを評価し、変更がなければ304レスポンスを返す
+
+    If-None-Matchがある場合はそちらを優先し、If-Modified-Sinceは無視する（RFC 9110）。
+
+    Returns:
+        304レスポンス、または本体を返す必要がある場合None
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        matched = _etag_matches(if_none_match, validator.etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        matched = (
+            if_modified_since is not None
+            and validator.last_modified is not None
+            and _not_modified_since(if_modified_since, validator.last_modified)
+        )
+
+    if not matched:
+        return None
+
+    response = Response(status_code=304)
+    apply_cache_headers(response, validator, cache_control)
+    return response
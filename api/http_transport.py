@@ -0,0 +1,236 @@
+"""
+PostgREST向けHTTPトランスポート
+接続プールのサイズ・キープアライブ・タイムアウト・HTTP/2を設定し、
+一時的な5xxや接続リセットをジッター付きの指数バックオフで再試行する
+
+同期クライアントのため、asyncのルートから呼ばれたクエリのバックオフはイベントループ全体を止める。
+1リクエストで待つ合計秒数はイベントループ上では SUPABASE_RETRY_BUDGET_EVENT_LOOP、
+それ以外（スレッドプール・スクリプト）では SUPABASE_RETRY_BUDGET を上限とする
+
+supabase/httpxの読み込みを伴うため、クライアント作成時（api.supabase_client）にのみ読み込む
+"""
+import asyncio
+import random
+import time
+from typing import Dict, Optional, Union
+
+import httpx
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient
+from supabase import Client as SupabaseBaseClient
+from supabase.lib.client_options import ClientOptions
+
+from config import settings
+from api.db_instrumentation import add_transferred_bytes
+from api.logger import logger
+from api.metrics import metrics_registry
+
+try:
+    import h2  # noqa: F401  HTTP/2にはh2パッケージが必要
+except ImportError:  # 未インストールの場合はHTTP/1.1のみ使用
+    h2 = None
+
+
+# 再実行しても結果が変わらないメソッド（送信後の切断・502/504でも再試行する）
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# PostgRESTがDBに接続できなかったことを示し、クエリは実行されていないため全メソッドで再試行する
+RETRY_ANY_METHOD_STATUSES = {503}
+# ゲートウェイ由来で、処理されたかどうか分からないため冪等なメソッドのみ再試行する
+RETRY_IDEMPOTENT_STATUSES = {502, 504}
+# 接続が確立できなかった（リクエストは送信されていない）エラー
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+# 送信後に接続が切れたエラー（キープアライブ中にサーバー側で閉じられた接続など）
+RESET_ERRORS = (httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """フルジッター付きの指数バックオフ（0〜min(cap, base * 2^attempt) 秒）"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _on_event_loop() -> bool:
+    """イベントループのスレッドから呼ばれているか"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _retry_after(response: httpx.Response, cap: float) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return min(cap, max(0.0, float(value)))
+    except ValueError:
+        return None
+
+
+class CountingStream(httpx.SyncByteStream):
+    """レスポンスの本文を読みながらバイト数を数え、閉じたときに実行中のクエリのデータ量に加算する"""
+
+    def __init__(self, stream: httpx.SyncByteStream, request_bytes: int):
+        self._stream = stream
+        self._size = request_bytes
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._size += len(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            add_transferred_bytes(self._size)
+        self._stream.close()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """
+    一時的な障害を再試行するトランスポート
+
+    - 接続エラー: 全メソッドで再試行（リクエストは送信されていない）
+    - 接続リセット・502/504: 冪等なメソッドのみ再試行
+    - 503: 全メソッドで再試行（Retry-Afterがあればその秒数だけ待つ）
+
+    待機の合計が上限（retry_budget、イベントループ上では loop_retry_budget）に達したら再試行をやめる
+    """
+
+    def __init__(
+        self,
+        transport: httpx.BaseTransport,
+        max_retries: int,
+        backoff_base: float,
+        backoff_cap: float,
+        retry_budget: float,
+        loop_retry_budget: float
+    ):
+        self._transport = transport
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_budget = retry_budget
+        self.loop_retry_budget = loop_retry_budget
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in IDEMPOTENT_METHODS
+        # イベントループ上での待機はループ全体を止めるため、短い上限を使う
+        budget = self.loop_retry_budget if _on_event_loop() else self.retry_budget
+        waited = 0.0
+        attempt = 0
+        while True:
+            exhausted = attempt >= self.max_retries or waited >= budget
+            try:
+                response = self._transport.handle_request(request)
+            except CONNECT_ERRORS as e:
+                if exhausted:
+                    raise
+                reason, delay = "connect_error", None
+                error = e
+            except RESET_ERRORS as e:
+                if not idempotent or exhausted:
+                    raise
+                reason, delay = "connection_reset", None
+                error = e
+            else:
+                status = response.status_code
+                retryable = status in RETRY_ANY_METHOD_STATUSES or (
+                    idempotent and status in RETRY_IDEMPOTENT_STATUSES
+                )
+                if not retryable or exhausted:
+                    request_bytes = int(request.headers.get("content-length") or 0)
+                    response.stream = CountingStream(response.stream, request_bytes)
+                    return response
+                reason, delay = f"http_{status}", _retry_after(response, self.backoff_cap)
+                error = None
+                response.close()
+
+            if delay is None:
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+            delay = min(delay, budget - waited)
+            waited += delay
+            attempt += 1
+            metrics_registry.observe_db_retry(reason)
+            logger.warning(
+                "PostgRESTへのリクエストを再試行します: %s %s 理由: %s 回数: %d/%d 待機: %.3f秒",
+                request.method, request.url.path, reason, attempt, self.max_retries, delay,
+                extra={"error": str(error)} if error else None
+            )
+            time.sleep(delay)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+def build_timeout() -> httpx.Timeout:
+    """1リクエストごとのタイムアウト（接続・読み取り・書き込み・プール待ち）"""
+    return httpx.Timeout(
+        connect=settings.SUPABASE_CONNECT_TIMEOUT,
+        read=settings.SUPABASE_READ_TIMEOUT,
+        write=settings.SUPABASE_WRITE_TIMEOUT,
+        pool=settings.SUPABASE_POOL_TIMEOUT
+    )
+
+
+def build_transport() -> RetryTransport:
+    """接続プールの設定と再試行を組み込んだトランスポートを作成"""
+    http2 = settings.SUPABASE_HTTP2 and h2 is not None
+    if settings.SUPABASE_HTTP2 and h2 is None:
+        logger.warning("h2が未インストールのため、PostgRESTへの接続はHTTP/1.1を使用します")
+    transport = httpx.HTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SUPABASE_POOL_KEEPALIVE_EXPIRY
+        )
+    )
+    return RetryTransport(
+        transport,
+        max_retries=settings.SUPABASE_MAX_RETRIES,
+        backoff_base=settings.SUPABASE_RETRY_BACKOFF,
+        backoff_cap=settings.SUPABASE_RETRY_BACKOFF_MAX,
+        retry_budget=settings.SUPABASE_RETRY_BUDGET,
+        loop_retry_budget=settings.SUPABASE_RETRY_BUDGET_EVENT_LOOP
+    )
+
+
+class TunedPostgrestClient(SyncPostgrestClient):
+    """設定済みのトランスポートでセッションを作るPostgRESTクライアント"""
+
+    def create_session(
+        self,
+        base_url: str,
+        headers: Dict[str, str],
+        timeout: Union[int, float, httpx.Timeout],
+    ) -> SyncClient:
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=build_timeout(),
+            transport=build_transport()
+        )
+
+
+class TunedSupabaseClient(SupabaseBaseClient):
+    """PostgRESTへのリクエストにTunedPostgrestClientを使うSupabaseクライアント"""
+
+    @staticmethod
+    def _init_postgrest_client(
+        rest_url: str,
+        headers: Dict[str, str],
+        schema: str,
+        timeout: Union[int, float, httpx.Timeout] = None,
+    ) -> SyncPostgrestClient:
+        return TunedPostgrestClient(rest_url, headers=headers, schema=schema)
+
+
+def create_tuned_client(supabase_url: str, supabase_key: str) -> TunedSupabaseClient:
+    """
+    接続プール・タイムアウト・再試行を設定したSupabaseクライアントを作成
+
+    httpx.Clientはスレッドセーフなため、1つのクライアントをスレッド間で共有して接続を再利用する
+    """
+    return TunedSupabaseClient(supabase_url, supabase_key, ClientOptions())
@@ -1,13 +1,22 @@
 """
 ロギング設定
-アプリケーション全体のログ管理
+アプリケーション全体のログ管理（JSON構造化ログ・バックグラウンド書き込み・リクエストID相関）
 """
+import atexit
+import copy
 import logging
+import queue
+import random
 import sys
+from contextvars import ContextVar
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from typing import Optional
 import os
 
+import orjson
+
 # Vercel環境かどうかをチェック（複数の方法で確認）
 # 根本的な原因: Vercel環境では読み取り専用ファイルシステムのため、ディレクトリ作成は常に失敗します
 # 解決策: 常にtry-exceptで囲み、Vercel環境の検出が失敗してもエラーにならないようにする
@@ -77,10 +86,111 @@ if not IS_VERCEL:
 # Vercel環境では何もしない（log_dirとlog_fileはNoneのまま）
 
 
-def setup_logger(name: str = "yoyaku", level: int = logging.INFO) -> logging.Logger:
+# ログ出力形式（json: 1行1オブジェクトの構造化ログ / text: 従来の人が読む形式）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+# DEBUGログを出力する割合（0.0〜1.0）。大量に出るデバッグログの負荷を抑える
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# リクエストIDの相関用（RequestIdMiddlewareがリクエストごとに設定）
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# LogRecordの標準属性（これ以外の属性はextraとしてJSONに出力する）
+_RESERVED_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id", "sample_rate"}
+
+_listener: Optional[QueueListener] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """ログ呼び出し時点のリクエストIDをレコードに付与"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    ログのサンプリング
+
+    DEBUGレベルはdebug_sample_rateの割合だけ通過させる。
+    extra={"sample_rate": 0.01} を指定したレコードはその割合で通過させる。
+    """
+
+    def __init__(self, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None and record.levelno <= logging.DEBUG:
+            rate = self.debug_sample_rate
+        if rate is None or rate >= 1.0:
+            return True
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1オブジェクトのJSON形式でログを出力"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode("utf-8")
+
+
+class _AsyncQueueHandler(QueueHandler):
+    """
+    呼び出し元スレッドではメッセージの確定だけを行い、整形と書き込みはQueueListenerに任せる
+
+    標準のQueueHandler.prepareは呼び出し元でフォーマッター全体を実行するため置き換える。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # 引数は後で変更される可能性があるため、ここで文字列に確定させる
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # トレースバックのフレームを別スレッドに渡さないよう、ここで文字列化する
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _build_formatter() -> logging.Formatter:
+    if LOG_FORMAT == "text":
+        return logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+    return JsonFormatter()
+
+
+def setup_logger(name: str = "yoyaku", level: int = LOG_LEVEL) -> logging.Logger:
     """
     ロガーをセットアップ
     
+    ログ呼び出し側はキューに積むだけで戻り、標準出力・ファイルへの書き込みは
+    バックグラウンドのQueueListenerが行う。
+    
     Args:
         name: ロガー名
         level: ログレベル
@@ -88,23 +198,25 @@ def setup_logger(name: str = "yoyaku", level: int = logging.INFO) -> logging.Log
     Returns:
         設定されたロガー
     """
+    global _listener
+    
     logger = logging.getLogger(name)
     logger.setLevel(level)
+    logger.propagate = False
     
     # 既存のハンドラーをクリア
     logger.handlers.clear()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
     
-    # フォーマッターの設定
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    formatter = _build_formatter()
     
     # コンソールハンドラー（常に追加）
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # ファイルハンドラー（ローカル環境のみ、かつディレクトリ作成が成功した場合のみ）
     if log_file is not None and log_dir is not None:
@@ -112,23 +224,32 @@ def setup_logger(name: str = "yoyaku", level: int = logging.INFO) -> logging.Log
             file_handler = logging.FileHandler(log_file, encoding='utf-8')
             file_handler.setLevel(logging.DEBUG)
             file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            handlers.append(file_handler)
         except (OSError, PermissionError):
             # ファイルハンドラーの作成に失敗した場合はスキップ
             pass
     
+    queue_handler = _AsyncQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+    queue_handler.addFilter(RequestIdFilter())
+    logger.addHandler(queue_handler)
+    
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    
     return logger
 
 
-# デフォルトロガー
-logger = setup_logger()
-
-
-
-
-
-
+def shutdown_logging() -> None:
+    """キューに残っているログを書き出してバックグラウンドスレッドを停止"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
+atexit.register(shutdown_logging)
 
 
+# デフォルトロガー
+logger = setup_logger()
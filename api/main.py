@@ -1,19 +1,24 @@
 """
 FastAPIアプリケーションのメインファイル
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import sys
 import os
 from pathlib import Path
+from typing import Optional
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
 from api.logger import logger
+from api.auth import verify_admin_api_key
 from api.exceptions import YoyakuException
+from api.middleware import CompressionMiddleware, MetricsMiddleware, RequestIdMiddleware
+from api.metrics import metrics_registry
+from api.pg_pool import postgres_pool
 from api.routes import (
     reservations,
     customers,
@@ -23,7 +28,10 @@ from api.routes import (
     orders,
     coupons,
     campaigns,
-    storage
+    promotions,
+    storage,
+    exports,
+    public
 )
 from api.routes import recommendations
 from api.routes import settings as settings_router
@@ -34,12 +42,19 @@ from api.routes import auth
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """アプリケーションのライフサイクル管理"""
+    # スケジューラーはコールドスタートを短くするよう起動処理の中で読み込む
+    from marketing.campaign_scheduler import campaign_scheduler
+    
     # 起動時の処理
     logger.info(f"Starting {settings.PROJECT_NAME} v{settings.VERSION}")
     logger.info(f"API prefix: {settings.API_V1_PREFIX}")
+    if settings.CAMPAIGN_SCHEDULER_ENABLED:
+        campaign_scheduler.start()
     yield
     # 終了時の処理
     logger.info(f"Shutting down {settings.PROJECT_NAME}")
+    await campaign_scheduler.stop()
+    await postgres_pool.close()
 
 
 # FastAPIアプリケーションの作成
@@ -47,7 +62,9 @@ app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description="予約管理システムのAPI",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # 標準のJSONエンコーダーより高速なorjsonでシリアライズ
+    default_response_class=ORJSONResponse
 )
 
 # CORS設定
@@ -59,12 +76,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# レスポンス圧縮（Accept-Encodingに応じてbrotli/gzip）
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE
+)
+
+# リクエスト計測（圧縮を含めた処理時間を計測するため、圧縮より外側に置く）
+app.add_middleware(MetricsMiddleware)
+
+# リクエストID（最も外側に置き、計測・例外ログを含むすべてのログに付与）
+app.add_middleware(RequestIdMiddleware)
+
 
 # エラーハンドラー
 @app.exception_handler(YoyakuException)
 async def yoyaku_exception_handler(request, exc: YoyakuException):
     """カスタム例外ハンドラー"""
-    logger.error(f"YoyakuException: {exc.detail}")
+    logger.error("YoyakuException: %s", exc.detail)
     return JSONResponse(
         status_code=exc.status_code,
         content={"message": exc.detail}
@@ -77,7 +106,7 @@ async def global_exception_handler(request, exc):
     import traceback
     error_detail = str(exc)
     error_traceback = traceback.format_exc()
-    logger.error(f"Unhandled exception: {error_detail}\n{error_traceback}")
+    logger.error("Unhandled exception: %s", error_detail, exc_info=exc)
     
     # 開発環境では詳細なエラー情報を返す
     import os
@@ -144,6 +173,27 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(
+    x_admin_api_key: Optional[str] = Header(None, alias="X-Admin-API-Key"),
+    authorization: Optional[str] = Header(None)
+):
+    """Prometheus形式のメトリクスを出力（システム管理者のみ）"""
+    # Prometheusの bearer_token でも送れるよう、Authorization: Bearer <ADMIN_API_KEY> も受け付ける
+    api_key = x_admin_api_key
+    if api_key is None and authorization and authorization.lower().startswith("bearer "):
+        api_key = authorization[len("bearer "):].strip()
+    if not verify_admin_api_key(api_key):
+        raise HTTPException(
+            status_code=403,
+            detail="メトリクスの参照にはシステム管理者の権限が必要です。X-Admin-API-Keyヘッダーを設定してください。"
+        )
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # ルーターの登録
 app.include_router(
     reservations.router,
@@ -193,12 +243,24 @@ app.include_router(
     tags=["campaigns"]
 )
 
+app.include_router(
+    promotions.router,
+    prefix=f"{settings.API_V1_PREFIX}/promotions",
+    tags=["promotions"]
+)
+
 app.include_router(
     storage.router,
     prefix=f"{settings.API_V1_PREFIX}/storage",
     tags=["storage"]
 )
 
+app.include_router(
+    exports.router,
+    prefix=f"{settings.API_V1_PREFIX}/exports",
+    tags=["exports"]
+)
+
 app.include_router(
     recommendations.router,
     prefix=f"{settings.API_V1_PREFIX}/recommendations",
@@ -223,6 +285,12 @@ app.include_router(
     tags=["auth"]
 )
 
+app.include_router(
+    public.router,
+    prefix=f"{settings.API_V1_PREFIX}/public",
+    tags=["public"]
+)
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,905 @@
+"""
+インメモリのSupabaseクライアント
+アプリが使うクエリビルダーのサブセット（select/insert/update/upsert/delete、絞り込み条件、
+並び替え、件数、埋め込みselect）をメモリ上で実装し、外部サービスなしでテストやベンチマークを実行する
+
+SUPABASE_BACKEND=memory で通常のクライアントの代わりに使用される。
+"""
+import os
+import re
+import threading
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from postgrest.exceptions import APIError
+
+
+# スキーマの既定値のうち、行の作成時に生成する値
+DEFAULT_UUID = "uuid"
+DEFAULT_NOW = "now"
+DEFAULT_SERIAL = "serial"
+
+
+# ==================== 値の変換と比較 ====================
+
+_TIMESTAMP_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:?\d{2})?$")
+
+
+def _to_db_value(value: Any) -> Any:
+    """PostgRESTとの送受信と同じくJSONで表せる値に変換"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _to_db_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_to_db_value(item) for item in value]
+    return value
+
+
+@lru_cache(maxsize=65536)
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    """日時らしい文字列をUTCのdatetimeに変換（タイムゾーンなしはUTCとみなす）"""
+    if not _TIMESTAMP_PATTERN.match(value):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _comparable(value: Any) -> Any:
+    """比較・並び替え用の値（日時文字列はdatetimeとして比較する）"""
+    if isinstance(value, str):
+        parsed = _parse_timestamp(value)
+        if parsed is not None:
+            return parsed
+    return value
+
+
+def _coerce(value: Any, like: Any) -> Any:
+    """条件の値を列の値の型に合わせる（or_などの文字列条件用）"""
+    if not isinstance(value, str) or isinstance(like, str):
+        return value
+    if isinstance(like, bool):
+        return value.lower() == "true"
+    if isinstance(like, (int, float)):
+        try:
+            return type(like)(value) if "." not in value else float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _equals(left: Any, right: Any) -> bool:
+    if left == right:
+        return True
+    right = _coerce(right, left)
+    return left == right or _comparable(left) == _comparable(right)
+
+
+def _compare(left: Any, right: Any) -> int:
+    a = _comparable(left)
+    b = _comparable(_coerce(right, left))
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        a, b = str(left), str(right)
+        return (a > b) - (a < b)
+
+
+@lru_cache(maxsize=1024)
+def _like_pattern(pattern: str, case_insensitive: bool) -> "re.Pattern":
+    regex = "".join(
+        ".*" if char in "%*" else "." if char == "_" else re.escape(char)
+        for char in pattern
+    )
+    return re.compile(f"^{regex}$", re.DOTALL | (re.IGNORECASE if case_insensitive else 0))
+
+
+def _evaluate(operator: str, value: Any, criteria: Any) -> Optional[bool]:
+    """
+    1つの条件を評価（SQLと同じ3値論理）
+
+    Returns:
+        True / False、列の値がNULLで判定できない場合None
+    """
+    if operator == "is":
+        if criteria is None or str(criteria).lower() == "null":
+            return value is None
+        return value is (str(criteria).lower() == "true")
+    if value is None:
+        return None
+    if operator == "eq":
+        return _equals(value, criteria)
+    if operator == "neq":
+        return not _equals(value, criteria)
+    if operator == "gt":
+        return _compare(value, criteria) > 0
+    if operator == "gte":
+        return _compare(value, criteria) >= 0
+    if operator == "lt":
+        return _compare(value, criteria) < 0
+    if operator == "lte":
+        return _compare(value, criteria) <= 0
+    if operator in ("like", "ilike"):
+        return bool(_like_pattern(str(criteria), operator == "ilike").match(str(value)))
+    if operator == "in":
+        return any(_equals(value, item) for item in criteria)
+    if operator == "cs":
+        if isinstance(value, dict) and isinstance(criteria, dict):
+            return all(value.get(key) == item for key, item in criteria.items())
+        if isinstance(value, list):
+            return all(item in value for item in criteria)
+        return False
+    raise APIError({"code": "PGRST100", "message": f"未対応の演算子です: {operator}"})
+
+
+Predicate = Callable[[dict], Optional[bool]]
+
+
+def _negate(predicate: Predicate) -> Predicate:
+    def negated(row: dict) -> Optional[bool]:
+        result = predicate(row)
+        return None if result is None else not result
+    return negated
+
+
+def _column_predicate(column: str, operator: str, criteria: Any) -> Predicate:
+    return lambda row: _evaluate(operator, row.get(column), criteria)
+
+
+# ==================== PostgRESTの文字列構文 ====================
+
+def _split_top_level(text: str) -> List[str]:
+    """括弧と引用符の外側にあるカンマで分割"""
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if current:
+        parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"')
+    return value
+
+
+def _parse_criteria(operator: str, value: str) -> Any:
+    if operator == "in":
+        inner = value[1:-1] if value.startswith("(") and value.endswith(")") else value
+        return [_unquote(item) for item in _split_top_level(inner)]
+    if operator == "is":
+        return None if value.lower() == "null" else value
+    return _unquote(value)
+
+
+def _parse_condition(expression: str) -> Predicate:
+    """`列.演算子.値` または `and(...)` / `or(...)` を述語に変換"""
+    negated = expression.startswith("not.")
+    if negated:
+        expression = expression[4:]
+
+    for logic in ("and", "or"):
+        if expression.startswith(f"{logic}(") and expression.endswith(")"):
+            predicate = _logic_predicate(logic, expression[len(logic) + 1:-1])
+            return _negate(predicate) if negated else predicate
+
+    try:
+        column, rest = expression.split(".", 1)
+        if rest.startswith("not."):
+            negated = not negated
+            rest = rest[4:]
+        operator, value = rest.split(".", 1)
+    except ValueError:
+        raise APIError({"code": "PGRST100", "message": f"条件を解析できません: {expression}"})
+
+    predicate = _column_predicate(column, operator, _parse_criteria(operator, value))
+    return _negate(predicate) if negated else predicate
+
+
+def _logic_predicate(logic: str, body: str) -> Predicate:
+    predicates = [_parse_condition(part) for part in _split_top_level(body)]
+
+    def evaluate(row: dict) -> Optional[bool]:
+        results = [predicate(row) for predicate in predicates]
+        if logic == "and":
+            if False in results:
+                return False
+            return None if None in results else True
+        if True in results:
+            return True
+        return None if None in results else False
+
+    return evaluate
+
+
+class Embed:
+    """埋め込みselect（`alias:table!hint(columns)`）"""
+
+    def __init__(self, alias: str, table: str, hint: Optional[str], inner: bool, columns: list):
+        self.alias = alias
+        self.table = table
+        self.hint = hint
+        self.inner = inner
+        self.columns = columns
+
+
+@lru_cache(maxsize=512)
+def _parse_columns(columns: str) -> tuple:
+    """select句を列名（alias, column）と埋め込み（Embed）のタプルに変換"""
+    parsed = []
+    for item in _split_top_level(columns or "*"):
+        if "(" in item and item.endswith(")"):
+            head, body = item[:item.index("(")], item[item.index("(") + 1:-1]
+            alias, _, target = head.rpartition(":")
+            target, _, hint = target.partition("!")
+            inner = hint == "inner"
+            if hint in ("inner", "left"):
+                hint = ""
+            parsed.append(Embed(alias or target, target, hint or None, inner, list(_parse_columns(body))))
+            continue
+        alias, _, column = item.rpartition(":")
+        column = column.split("::", 1)[0]
+        parsed.append((alias or column, column))
+    return tuple(parsed)
+
+
+def _singular(table: str) -> str:
+    if table.endswith("ies"):
+        return table[:-3] + "y"
+    if table.endswith("s"):
+        return table[:-1]
+    return table
+
+
+# ==================== スキーマ ====================
+
+class TableSchema:
+    """1テーブル分の列の既定値と一意制約"""
+
+    def __init__(self):
+        # 列名 → 既定値（DEFAULT_UUID / DEFAULT_NOW / DEFAULT_SERIAL はその都度生成）
+        self.columns: Dict[str, Any] = {}
+        self.unique: List[Tuple[str, ...]] = []
+
+
+_CREATE_TABLE = re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*)\)\s*$", re.IGNORECASE | re.DOTALL)
+_ADD_COLUMN = re.compile(r"ALTER\s+TABLE\s+(\w+)\s+ADD\s+COLUMN\s+(?:IF\s+NOT\s+EXISTS\s+)?(.*)$", re.IGNORECASE | re.DOTALL)
+_TABLE_UNIQUE = re.compile(r"^(?:CONSTRAINT\s+\w+\s+)?UNIQUE\s*\(([^)]*)\)", re.IGNORECASE)
+_DEFAULT = re.compile(r"\bDEFAULT\s+('(?:[^']|'')*'|[\w.]+(?:\(\))?)", re.IGNORECASE)
+_CONSTRAINT_KEYWORDS = {"PRIMARY", "UNIQUE", "CONSTRAINT", "FOREIGN", "CHECK", "EXCLUDE"}
+
+
+def _parse_default(definition: str) -> Any:
+    if re.search(r"\bSERIAL\b", definition, re.IGNORECASE):
+        return DEFAULT_SERIAL
+    match = _DEFAULT.search(definition)
+    if not match:
+        return None
+    literal = match.group(1)
+    upper = literal.upper()
+    if upper in ("NOW()", "CURRENT_TIMESTAMP"):
+        return DEFAULT_NOW
+    if "UUID" in upper:
+        return DEFAULT_UUID
+    if upper in ("TRUE", "FALSE"):
+        return upper == "TRUE"
+    if upper == "NULL":
+        return None
+    if literal.startswith("'"):
+        return literal[1:-1].replace("''", "'")
+    try:
+        return float(literal) if "." in literal else int(literal)
+    except ValueError:
+        return None
+
+
+def _add_column(schema: TableSchema, definition: str) -> None:
+    name = definition.split(None, 1)[0].strip('"')
+    schema.columns[name] = _parse_default(definition)
+    if re.search(r"\bUNIQUE\b", definition, re.IGNORECASE):
+        schema.unique.append((name,))
+
+
+def load_schema(paths: Iterable[str]) -> Dict[str, TableSchema]:
+    """
+    SQLファイルのCREATE TABLE / ALTER TABLE ADD COLUMN から列の既定値と一意制約を読み込む
+
+    本番と同じく、挿入時に省略した列を既定値（なければNULL）で埋めるために使う。
+    """
+    schemas: Dict[str, TableSchema] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            sql = re.sub(r"--[^\n]*", "", f.read())
+        # 関数本体（$$ ... $$）内のセミコロンで分割しないよう先に除去する
+        sql = re.sub(r"\$\$.*?\$\$", "", sql, flags=re.DOTALL)
+        for statement in sql.split(";"):
+            statement = statement.strip()
+            created = _CREATE_TABLE.match(statement)
+            if created:
+                schema = schemas.setdefault(created.group(1), TableSchema())
+                for definition in _split_top_level(created.group(2)):
+                    unique = _TABLE_UNIQUE.match(definition)
+                    if unique:
+                        schema.unique.append(tuple(column.strip() for column in unique.group(1).split(",")))
+                    elif definition.split(None, 1)[0].upper() not in _CONSTRAINT_KEYWORDS:
+                        _add_column(schema, definition)
+                continue
+            added = _ADD_COLUMN.match(statement)
+            if added:
+                _add_column(schemas.setdefault(added.group(1), TableSchema()), added.group(2).strip())
+    return schemas
+
+
+def default_schema_files() -> List[str]:
+    """database/schema.sql と database/migrations/*.sql（ファイル名順）"""
+    database_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database")
+    migrations_dir = os.path.join(database_dir, "migrations")
+    paths = [os.path.join(database_dir, "schema.sql")]
+    if os.path.isdir(migrations_dir):
+        paths.extend(
+            os.path.join(migrations_dir, name)
+            for name in sorted(os.listdir(migrations_dir))
+            if name.endswith(".sql")
+        )
+    return [path for path in paths if os.path.exists(path)]
+
+
+# ==================== テーブルとインデックス ====================
+
+class _EqIndex:
+    """1列分の等価インデックス（値 → 行IDの集合）"""
+
+    def __init__(self, column: str):
+        self.column = column
+        self.buckets: Dict[Any, Set[int]] = {}
+        # ハッシュできない値（配列・JSON）の行は常に候補に含める
+        self.unhashable: Set[int] = set()
+
+    @staticmethod
+    def _key(value: Any) -> Any:
+        return _comparable(value)
+
+    def add(self, rowid: int, row: dict) -> None:
+        try:
+            self.buckets.setdefault(self._key(row.get(self.column)), set()).add(rowid)
+        except TypeError:
+            self.unhashable.add(rowid)
+
+    def discard(self, rowid: int, row: dict) -> None:
+        try:
+            bucket = self.buckets.get(self._key(row.get(self.column)))
+        except TypeError:
+            self.unhashable.discard(rowid)
+            return
+        if bucket is not None:
+            bucket.discard(rowid)
+            if not bucket:
+                del self.buckets[self._key(row.get(self.column))]
+
+    def lookup(self, value: Any) -> Set[int]:
+        try:
+            bucket = self.buckets.get(self._key(value), set())
+        except TypeError:
+            return set(self.unhashable)
+        return bucket | self.unhashable if self.unhashable else bucket
+
+
+class MemoryTable:
+    """1テーブル分の行と等価インデックス"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: Dict[int, dict] = {}
+        self.indexes: Dict[str, _EqIndex] = {}
+        self._next_rowid = 0
+        self.serial = 0
+        self.index("id")
+
+    def index(self, column: str) -> _EqIndex:
+        """列のインデックスを取得（初回のeq条件で作成し、以降は書き込み時に維持する）"""
+        index = self.indexes.get(column)
+        if index is None:
+            index = self.indexes[column] = _EqIndex(column)
+            for rowid, row in self.rows.items():
+                index.add(rowid, row)
+        return index
+
+    def add(self, row: dict) -> int:
+        rowid = self._next_rowid
+        self._next_rowid += 1
+        self.rows[rowid] = row
+        for index in self.indexes.values():
+            index.add(rowid, row)
+        return rowid
+
+    def replace(self, rowid: int, row: dict) -> None:
+        previous = self.rows[rowid]
+        for index in self.indexes.values():
+            index.discard(rowid, previous)
+            index.add(rowid, row)
+        self.rows[rowid] = row
+
+    def remove(self, rowid: int) -> dict:
+        row = self.rows.pop(rowid)
+        for index in self.indexes.values():
+            index.discard(rowid, row)
+        return row
+
+
+class MemoryResponse:
+    """execute()の結果（postgrestのAPIResponseと同じ data / count を持つ）"""
+
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+# ==================== クエリビルダー ====================
+
+class MemoryQuery:
+    """1テーブルに対するクエリビルダー（メソッドチェーンでselfを返す）"""
+
+    def __init__(self, client: "MemorySupabaseClient", table: str):
+        self._client = client
+        self._table = table
+        self._operation = "select"
+        self._columns = "*"
+        self._count: Optional[str] = None
+        self._payload: Any = None
+        self._returning = "representation"
+        self._on_conflict: Tuple[str, ...] = ("id",)
+        self._ignore_duplicates = False
+        self._predicates: List[Predicate] = []
+        self._eq: List[Tuple[str, Any]] = []
+        self._order: List[Tuple[str, bool, Optional[bool]]] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._single: Optional[str] = None
+        self._negate_next = False
+
+    # ---------- 操作 ----------
+
+    def select(self, *columns: str, count: Optional[str] = None) -> "MemoryQuery":
+        self._columns = ",".join(columns) if columns else "*"
+        self._count = _value_of(count)
+        return self
+
+    def insert(self, json: Any, *, count: Optional[str] = None, returning: Any = "representation",
+               upsert: bool = False) -> "MemoryQuery":
+        self._operation = "upsert" if upsert else "insert"
+        self._payload = json
+        self._count = _value_of(count)
+        self._returning = _value_of(returning)
+        return self
+
+    def upsert(self, json: Any, *, count: Optional[str] = None, returning: Any = "representation",
+               ignore_duplicates: bool = False, on_conflict: str = "") -> "MemoryQuery":
+        self.insert(json, count=count, returning=returning, upsert=True)
+        self._ignore_duplicates = ignore_duplicates
+        if on_conflict:
+            self._on_conflict = tuple(column.strip() for column in on_conflict.split(","))
+        return self
+
+    def update(self, json: dict, *, count: Optional[str] = None, returning: Any = "representation") -> "MemoryQuery":
+        self._operation = "update"
+        self._payload = json
+        self._count = _value_of(count)
+        self._returning = _value_of(returning)
+        return self
+
+    def delete(self, *, count: Optional[str] = None, returning: Any = "representation") -> "MemoryQuery":
+        self._operation = "delete"
+        self._count = _value_of(count)
+        self._returning = _value_of(returning)
+        return self
+
+    # ---------- 絞り込み条件 ----------
+
+    @property
+    def not_(self) -> "MemoryQuery":
+        """次の条件を否定する"""
+        self._negate_next = True
+        return self
+
+    def _add(self, column: str, operator: str, criteria: Any) -> "MemoryQuery":
+        criteria = _to_db_value(criteria)
+        predicate = _column_predicate(column, operator, criteria)
+        if self._negate_next:
+            predicate = _negate(predicate)
+            self._negate_next = False
+        elif operator == "eq":
+            self._eq.append((column, criteria))
+        self._predicates.append(predicate)
+        return self
+
+    def eq(self, column: str, value: Any) -> "MemoryQuery":
+        return self._add(column, "eq", value)
+
+    def neq(self, column: str, value: Any) -> "MemoryQuery":
+        return self._add(column, "neq", value)
+
+    def gt(self, column: str, value: Any) -> "MemoryQuery":
+        return self._add(column, "gt", value)
+
+    def gte(self, column: str, value: Any) -> "MemoryQuery":
+        return self._add(column, "gte", value)
+
+    def lt(self, column: str, value: Any) -> "MemoryQuery":
+        return self._add(column, "lt", value)
+
+    def lte(self, column: str, value: Any) -> "MemoryQuery":
+        return self._add(column, "lte", value)
+
+    def like(self, column: str, pattern: str) -> "MemoryQuery":
+        return self._add(column, "like", pattern)
+
+    def ilike(self, column: str, pattern: str) -> "MemoryQuery":
+        return self._add(column, "ilike", pattern)
+
+    def is_(self, column: str, value: Any) -> "MemoryQuery":
+        return self._add(column, "is", value)
+
+    def in_(self, column: str, values: Iterable[Any]) -> "MemoryQuery":
+        return self._add(column, "in", list(values))
+
+    def contains(self, column: str, value: Any) -> "MemoryQuery":
+        return self._add(column, "cs", value)
+
+    def match(self, query: Dict[str, Any]) -> "MemoryQuery":
+        for column, value in query.items():
+            self.eq(column, value)
+        return self
+
+    def filter(self, column: str, operator: str, criteria: Any) -> "MemoryQuery":
+        if isinstance(criteria, str):
+            criteria = _parse_criteria(operator, criteria)
+        return self._add(column, operator, criteria)
+
+    def or_(self, filters: str, reference_table: Optional[str] = None) -> "MemoryQuery":
+        predicate = _logic_predicate("or", filters)
+        if self._negate_next:
+            predicate = _negate(predicate)
+            self._negate_next = False
+        self._predicates.append(predicate)
+        return self
+
+    # ---------- 並び替え・件数 ----------
+
+    def order(self, column: str, *, desc: bool = False, nullsfirst: Optional[bool] = None,
+              foreign_table: Optional[str] = None) -> "MemoryQuery":
+        self._order.append((column, desc, nullsfirst))
+        return self
+
+    def limit(self, size: int, *, foreign_table: Optional[str] = None) -> "MemoryQuery":
+        self._limit = size
+        return self
+
+    def offset(self, size: int) -> "MemoryQuery":
+        self._offset = size
+        return self
+
+    def range(self, start: int, end: int, foreign_table: Optional[str] = None) -> "MemoryQuery":
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def single(self) -> "MemoryQuery":
+        self._single = "single"
+        return self
+
+    def maybe_single(self) -> "MemoryQuery":
+        self._single = "maybe"
+        return self
+
+    # ---------- 実行 ----------
+
+    def execute(self) -> MemoryResponse:
+        with self._client.lock:
+            handler = getattr(self, f"_execute_{self._operation}")
+            return handler(self._client.get_table(self._table))
+
+    def _matches(self, row: dict) -> bool:
+        for predicate in self._predicates:
+            if predicate(row) is not True:
+                return False
+        return True
+
+    def _candidates(self, table: MemoryTable) -> Iterable[int]:
+        """eq条件のインデックスで候補行を絞る（最も件数の少ない条件を使う）"""
+        best: Optional[Set[int]] = None
+        for column, value in self._eq:
+            rowids = table.index(column).lookup(value)
+            if best is None or len(rowids) < len(best):
+                best = rowids
+        # 候補がテーブルの半分を超える場合は挿入順に全件走査した方が速い
+        if best is None or len(best) * 2 > len(table.rows):
+            return list(table.rows)
+        return sorted(best)
+
+    def _matched_rowids(self, table: MemoryTable) -> List[int]:
+        return [rowid for rowid in self._candidates(table) if self._matches(table.rows[rowid])]
+
+    def _sorted(self, rows: List[dict]) -> List[dict]:
+        # 後ろの並び順から安定ソートを重ねる（NULLは昇順で最後・降順で最初）
+        for column, desc, nullsfirst in reversed(self._order):
+            nulls_first = desc if nullsfirst is None else nullsfirst
+            present = [row for row in rows if row.get(column) is not None]
+            missing = [row for row in rows if row.get(column) is None]
+            present.sort(key=lambda row: _comparable(row[column]), reverse=desc)
+            rows = missing + present if nulls_first else present + missing
+        return rows
+
+    def _execute_select(self, table: MemoryTable) -> MemoryResponse:
+        rows = [table.rows[rowid] for rowid in self._matched_rowids(table)]
+        if self._order:
+            rows = self._sorted(rows)
+
+        parsed = _parse_columns(self._columns)
+        has_inner = any(isinstance(item, Embed) and item.inner for item in parsed)
+        if has_inner:
+            projected = [self._client.project(self._table, row, parsed) for row in rows]
+            rows = [row for row in projected if row is not None]
+
+        total = len(rows)
+        end = None if self._limit is None else self._offset + self._limit
+        rows = rows[self._offset:end]
+        if not has_inner:
+            rows = [self._client.project(self._table, row, parsed) for row in rows]
+        return self._respond(rows, total)
+
+    def _execute_insert(self, table: MemoryTable) -> MemoryResponse:
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        new_rows = [self._client.with_defaults(table, _to_db_value(dict(row))) for row in payload]
+        for row in new_rows:
+            self._client.check_unique(table, row)
+        for row in new_rows:
+            table.add(row)
+        return self._respond([dict(row) for row in new_rows], len(new_rows))
+
+    def _execute_upsert(self, table: MemoryTable) -> MemoryResponse:
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        written = []
+        for item in payload:
+            item = _to_db_value(dict(item))
+            existing = self._client.find_conflict(table, item, self._on_conflict)
+            if existing is None:
+                row = self._client.with_defaults(table, item)
+                self._client.check_unique(table, row)
+                table.add(row)
+                written.append(dict(row))
+            elif not self._ignore_duplicates:
+                row = self._client.touch({**table.rows[existing], **item}, item)
+                table.replace(existing, row)
+                written.append(dict(row))
+        return self._respond(written, len(written))
+
+    def _execute_update(self, table: MemoryTable) -> MemoryResponse:
+        changes = _to_db_value(dict(self._payload))
+        updated = []
+        for rowid in self._matched_rowids(table):
+            row = self._client.touch({**table.rows[rowid], **changes}, changes)
+            self._client.check_unique(table, row, ignore=rowid)
+            table.replace(rowid, row)
+            updated.append(dict(row))
+        return self._respond(updated, len(updated))
+
+    def _execute_delete(self, table: MemoryTable) -> MemoryResponse:
+        deleted = [table.remove(rowid) for rowid in self._matched_rowids(table)]
+        return self._respond(deleted, len(deleted))
+
+    def _respond(self, rows: List[dict], total: int) -> MemoryResponse:
+        count = total if self._count else None
+        if self._operation != "select" and self._returning == "minimal":
+            return MemoryResponse([], count)
+        if self._single == "single":
+            if len(rows) != 1:
+                raise APIError({
+                    "code": "PGRST116",
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                    "details": f"The result contains {len(rows)} rows"
+                })
+            return MemoryResponse(rows[0], count)
+        if self._single == "maybe":
+            if len(rows) > 1:
+                raise APIError({
+                    "code": "PGRST116",
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                    "details": f"The result contains {len(rows)} rows"
+                })
+            return MemoryResponse(rows[0] if rows else None, count)
+        return MemoryResponse(rows, count)
+
+
+class MemoryRpc:
+    """登録済みの関数を呼び出すrpcビルダー"""
+
+    def __init__(self, client: "MemorySupabaseClient", fn: str, params: dict):
+        self._client = client
+        self._fn = fn
+        self._params = params
+
+    def execute(self) -> MemoryResponse:
+        function = self._client.functions.get(self._fn)
+        if function is None:
+            raise APIError({
+                "code": "PGRST202",
+                "message": f"Could not find the function public.{self._fn} in the schema cache"
+            })
+        with self._client.lock:
+            return MemoryResponse(_to_db_value(function(self._client, self._params)))
+
+
+def _value_of(option: Any) -> Any:
+    """postgrestの列挙型オプション（CountMethod / ReturnMethod）を文字列に変換"""
+    return getattr(option, "value", option)
+
+
+# ==================== クライアント ====================
+
+class MemorySupabaseClient:
+    """
+    Supabaseクライアント互換のインメモリ実装
+
+    - 挿入時に省略した列はスキーマの既定値（なければNULL）で埋める
+      スキーマのないテーブルでは id（UUID）・created_at・updated_at のみ設定する
+    - update時はupdated_atを更新する（本番のトリガーと同じ）
+    - eq条件の列には初回利用時に等価インデックスを作成する
+    - 一意制約はidとスキーマのUNIQUE制約に対して検証する
+    - rpcは register_function で登録したPython関数を呼び出す
+    """
+
+    def __init__(self, schema: Optional[Dict[str, TableSchema]] = None):
+        self.lock = threading.RLock()
+        self.tables: Dict[str, MemoryTable] = {}
+        self.functions: Dict[str, Callable[["MemorySupabaseClient", dict], Any]] = {}
+        self.schema = schema or {}
+
+    @classmethod
+    def from_schema_files(cls, paths: Optional[Iterable[str]] = None) -> "MemorySupabaseClient":
+        """SQLファイル（省略時はリポジトリのスキーマとマイグレーション）からスキーマを読み込んで作成"""
+        return cls(load_schema(default_schema_files() if paths is None else paths))
+
+    def table(self, table_name: str) -> MemoryQuery:
+        return MemoryQuery(self, table_name)
+
+    def from_(self, table_name: str) -> MemoryQuery:
+        return self.table(table_name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None) -> MemoryRpc:
+        return MemoryRpc(self, fn, params or {})
+
+    def register_function(self, name: str, function: Callable[["MemorySupabaseClient", dict], Any]) -> None:
+        """rpcで呼び出す関数を登録（function(client, params) が行のリストを返す）"""
+        self.functions[name] = function
+
+    def get_table(self, table_name: str) -> MemoryTable:
+        table = self.tables.get(table_name)
+        if table is None:
+            table = self.tables[table_name] = MemoryTable(table_name)
+        return table
+
+    def reset(self) -> None:
+        """全テーブルのデータを破棄（登録済みの関数は残す）"""
+        with self.lock:
+            self.tables.clear()
+
+    # ---------- 書き込み時の処理 ----------
+
+    def with_defaults(self, table: MemoryTable, row: dict) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        schema = self.schema.get(table.name)
+        if schema is None:
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("created_at", now)
+            row.setdefault("updated_at", now)
+            return row
+
+        for column, default in schema.columns.items():
+            if column in row:
+                continue
+            if default == DEFAULT_UUID:
+                row[column] = str(uuid.uuid4())
+            elif default == DEFAULT_NOW:
+                row[column] = now
+            elif default == DEFAULT_SERIAL:
+                table.serial += 1
+                row[column] = table.serial
+            else:
+                row[column] = default
+        return row
+
+    @staticmethod
+    def touch(row: dict, changes: dict) -> dict:
+        if "updated_at" in row and "updated_at" not in changes:
+            row["updated_at"] = datetime.now(timezone.utc).isoformat()
+        return row
+
+    def find_conflict(self, table: MemoryTable, row: dict, columns: Tuple[str, ...]) -> Optional[int]:
+        if any(row.get(column) is None for column in columns):
+            return None
+        rowids = table.index(columns[0]).lookup(row[columns[0]])
+        for rowid in rowids:
+            existing = table.rows[rowid]
+            if all(_equals(existing.get(column), row[column]) for column in columns):
+                return rowid
+        return None
+
+    def check_unique(self, table: MemoryTable, row: dict, ignore: Optional[int] = None) -> None:
+        schema = self.schema.get(table.name)
+        for columns in [("id",)] + (schema.unique if schema else []):
+            existing = self.find_conflict(table, row, columns)
+            if existing is not None and existing != ignore:
+                raise APIError({
+                    "code": "23505",
+                    "message": f'duplicate key value violates unique constraint "{table.name}_{"_".join(columns)}_key"',
+                    "details": f"Key ({', '.join(columns)}) already exists."
+                })
+
+    # ---------- 埋め込みselect ----------
+
+    def project(self, table_name: str, row: dict, columns: tuple) -> Optional[dict]:
+        """
+        select句に従って行を整形
+
+        埋め込みは `<単数形>_id` 列による多対一、または相手側の `<自テーブル単数形>_id` による一対多として解決する。
+        !inner の埋め込みが空の場合はNoneを返す。
+        """
+        result: Dict[str, Any] = {}
+        for item in columns:
+            if isinstance(item, Embed):
+                related = self._embed(table_name, row, item)
+                if item.inner and not related:
+                    return None
+                result[item.alias] = related
+            elif item[1] == "*":
+                result.update(row)
+            else:
+                result[item[0]] = row.get(item[1])
+        return result
+
+    def _embed(self, table_name: str, row: dict, embed: Embed) -> Any:
+        target = self.get_table(embed.table)
+        foreign_key = embed.hint or f"{_singular(embed.table)}_id"
+        if foreign_key in row:
+            value = row.get(foreign_key)
+            if value is None:
+                return None
+            for rowid in sorted(target.index("id").lookup(value)):
+                return self.project(embed.table, target.rows[rowid], tuple(embed.columns))
+            return None
+
+        back_reference = f"{_singular(table_name)}_id"
+        related = []
+        for rowid in sorted(target.index(back_reference).lookup(row.get("id"))):
+            projected = self.project(embed.table, target.rows[rowid], tuple(embed.columns))
+            if projected is not None:
+                related.append(projected)
+        return related
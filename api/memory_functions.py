@@ -0,0 +1,396 @@
+"""
+インメモリクライアント用のデータベース関数
+database/migrations のPL/pgSQL関数と同じ処理をPythonで実装し、rpcで呼び出せるよう登録する
+
+rpcはクライアントのロックを保持したまま実行されるため、
+検証をすべて終えてから書き込むことで、エラー時に変更が残らない（トランザクションと同じ結果になる）
+"""
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from postgrest.exceptions import APIError
+
+from api.memory_client import MemorySupabaseClient
+from api.utils import calculate_discount
+
+
+def _raise(hint: str, message: str) -> None:
+    """PL/pgSQLの RAISE EXCEPTION ... USING HINT と同じ形のエラー"""
+    raise APIError({"code": "P0001", "message": message, "hint": hint, "details": None})
+
+
+def _find(client: MemorySupabaseClient, table: str, **filters: Any) -> Any:
+    query = client.table(table).select("*")
+    for column, value in filters.items():
+        query = query.eq(column, value)
+    rows = query.limit(1).execute().data
+    return rows[0] if rows else None
+
+
+def _timestamp(value: Any) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def place_order(client: MemorySupabaseClient, params: Dict[str, Any]) -> List[dict]:
+    """place_order（database/migrations/add_place_order_function.sql）"""
+    shop_id = params["p_shop_id"]
+    customer_id = params["p_customer_id"]
+    items = params.get("p_items") or []
+    reservation_id = params.get("p_reservation_id")
+    coupon_code = params.get("p_coupon_code")
+
+    if _find(client, "customers", id=customer_id, shop_id=shop_id) is None:
+        _raise("customer_not_found", "顧客が見つかりません")
+    if reservation_id and _find(client, "reservations", id=reservation_id, shop_id=shop_id) is None:
+        _raise("reservation_not_found", "予約が見つかりません")
+
+    total = 0
+    stock: Dict[str, int] = {}
+    for item in items:
+        quantity = item["quantity"]
+        total += quantity * item["unit_price"]
+        product_id = item.get("product_id")
+        if product_id:
+            product = _find(client, "products", id=product_id, shop_id=shop_id)
+            if product is None:
+                _raise("product_not_found", f"商品 {product_id} が見つかりません")
+            if product.get("stock_quantity") is not None:
+                remaining = stock.get(product_id, product["stock_quantity"])
+                if remaining < quantity:
+                    _raise("insufficient_stock", f"商品 {item.get('name')} の在庫が不足しています")
+                stock[product_id] = remaining - quantity
+        service_id = item.get("service_id")
+        if service_id and _find(client, "services", id=service_id, shop_id=shop_id) is None:
+            _raise("service_not_found", f"サービス {service_id} が見つかりません")
+
+    coupon = None
+    coupon_discount = 0
+    if coupon_code:
+        coupon = _find(client, "coupons", code=coupon_code, shop_id=shop_id)
+        if coupon is None:
+            _raise("coupon_not_found", "クーポンが見つかりません")
+        now = datetime.now(timezone.utc)
+        if not coupon.get("is_active"):
+            _raise("coupon_inactive", "このクーポンは無効です")
+        if now < _timestamp(coupon["valid_from"]) or now > _timestamp(coupon["valid_until"]):
+            _raise("coupon_expired", "このクーポンの有効期限が切れています")
+        if coupon.get("usage_limit") is not None and (coupon.get("usage_count") or 0) >= coupon["usage_limit"]:
+            _raise("coupon_usage_limit", "このクーポンの使用回数制限に達しています")
+        if coupon.get("min_purchase_amount") is not None and total < coupon["min_purchase_amount"]:
+            _raise("coupon_min_purchase", f"このクーポンは{coupon['min_purchase_amount']}円以上の購入でご利用いただけます")
+        coupon_discount = calculate_discount(
+            total, coupon["coupon_type"], coupon["discount_value"], coupon.get("max_discount_amount")
+        )
+
+    campaign_id = params.get("p_campaign_id")
+    if campaign_id:
+        campaign = _find(client, "campaigns", id=campaign_id, shop_id=shop_id)
+        if campaign is None:
+            _raise("campaign_not_found", "キャンペーンが見つかりません")
+        now = datetime.now(timezone.utc)
+        if (campaign.get("status") != "active" or not campaign.get("is_active")
+                or now < _timestamp(campaign["start_date"]) or now > _timestamp(campaign["end_date"])):
+            _raise("campaign_inactive", "キャンペーンは現在アクティブではありません")
+
+    discount = min(coupon_discount + max(params.get("p_campaign_discount") or 0, 0), total)
+
+    for product_id, quantity in stock.items():
+        client.table("products").update({"stock_quantity": quantity}).eq("id", product_id).execute()
+
+    order = client.table("orders").insert({
+        "shop_id": shop_id,
+        "customer_id": customer_id,
+        "reservation_id": reservation_id,
+        "items": items,
+        "total_amount": total,
+        "discount_amount": discount,
+        "final_amount": max(0, total - discount),
+        "status": "pending",
+        "payment_method": params.get("p_payment_method"),
+        "notes": params.get("p_notes"),
+        "coupon_id": coupon["id"] if coupon_discount > 0 else None,
+        "campaign_id": campaign_id
+    }).execute().data[0]
+
+    if coupon_discount > 0:
+        client.table("coupon_usages").insert({
+            "shop_id": shop_id,
+            "coupon_id": coupon["id"],
+            "customer_id": customer_id,
+            "order_id": order["id"],
+            "discount_amount": coupon_discount
+        }).execute()
+        client.table("coupons").update({
+            "usage_count": (coupon.get("usage_count") or 0) + 1
+        }).eq("id", coupon["id"]).execute()
+
+    return [order]
+
+
+PAID_ORDER_STATUSES = ("paid", "processing", "completed")
+FINAL_ORDER_STATUSES = ("cancelled", "refunded")
+
+
+def _apply_promotion_daily_stats(
+    client: MemorySupabaseClient, order: dict, sign: int, status: str, stat_date: str
+) -> None:
+    """apply_promotion_daily_stats（database/migrations/add_promotion_daily_stats.sql）"""
+    for promotion_type, promotion_id in (("coupon", order.get("coupon_id")), ("campaign", order.get("campaign_id"))):
+        if not promotion_id:
+            continue
+        stats = _find(
+            client, "promotion_daily_stats",
+            promotion_type=promotion_type, promotion_id=promotion_id, stat_date=stat_date
+        )
+        if stats is None:
+            stats = client.table("promotion_daily_stats").insert({
+                "shop_id": order["shop_id"],
+                "promotion_type": promotion_type,
+                "promotion_id": promotion_id,
+                "stat_date": stat_date
+            }).execute().data[0]
+        if sign > 0:
+            changes = {
+                "orders": stats["orders"] + 1,
+                "revenue": stats["revenue"] + order["final_amount"],
+                "discount_amount": stats["discount_amount"] + order["discount_amount"]
+            }
+        else:
+            counter = "refunded_orders" if status == "refunded" else "cancelled_orders"
+            changes = {
+                counter: stats[counter] + 1,
+                "refunded_amount": stats["refunded_amount"] + order["final_amount"]
+            }
+        client.table("promotion_daily_stats").update(changes).eq(
+            "promotion_type", promotion_type
+        ).eq("promotion_id", promotion_id).eq("stat_date", stat_date).execute()
+
+
+def set_order_status(client: MemorySupabaseClient, params: Dict[str, Any]) -> List[dict]:
+    """set_order_status（database/migrations/add_promotion_daily_stats.sql）"""
+    status = params["p_status"]
+    existing = _find(client, "orders", id=params["p_order_id"], shop_id=params["p_shop_id"])
+    if existing is None:
+        _raise("order_not_found", "注文が見つかりません")
+
+    was_paid = existing.get("status") in PAID_ORDER_STATUSES
+    is_paid = status in PAID_ORDER_STATUSES
+    if existing.get("status") in FINAL_ORDER_STATUSES:
+        _raise("order_status_final", "キャンセル・返金済みの注文のステータスは変更できません")
+    if status == "refunded" and not was_paid:
+        _raise("order_not_paid", "支払い前の注文は返金できません")
+
+    changes = {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}
+    if params.get("p_payment_method") is not None:
+        changes["payment_method"] = params["p_payment_method"]
+    if params.get("p_payment_id") is not None:
+        changes["payment_id"] = params["p_payment_id"]
+    order = client.table("orders").update(changes).eq("id", existing["id"]).execute().data[0]
+
+    if status == "cancelled":
+        returned: Dict[str, int] = {}
+        for item in order.get("items") or []:
+            if item.get("product_id"):
+                returned[item["product_id"]] = returned.get(item["product_id"], 0) + item["quantity"]
+        for product_id, quantity in returned.items():
+            product = _find(client, "products", id=product_id, shop_id=params["p_shop_id"])
+            if product is not None and product.get("stock_quantity") is not None:
+                client.table("products").update({
+                    "stock_quantity": product["stock_quantity"] + quantity,
+                    "updated_at": changes["updated_at"]
+                }).eq("id", product_id).execute()
+
+    if was_paid != is_paid:
+        stat_date = datetime.now(ZoneInfo(params.get("p_timezone") or "Asia/Tokyo")).date().isoformat()
+        _apply_promotion_daily_stats(client, order, 1 if is_paid else -1, status, stat_date)
+
+    return [order]
+
+
+def _latest(values: List[Any]) -> Any:
+    """日時の最大値（None は除く、すべて None なら None）"""
+    values = [value for value in values if value is not None]
+    return max(values, key=_timestamp) if values else None
+
+
+def _same_time(left: Any, right: Any) -> bool:
+    if left is None or right is None:
+        return left is None and right is None
+    return _timestamp(left) == _timestamp(right)
+
+
+def adjust_customer_visit_stats(client: MemorySupabaseClient, params: Dict[str, Any]) -> List[dict]:
+    """adjust_customer_visit_stats（database/migrations/add_customer_visit_stats_functions.sql）"""
+    customer_id = params["p_customer_id"]
+    delta = params["p_delta"]
+    customer = _find(client, "customers", id=customer_id)
+    if customer is None:
+        return []
+
+    if delta > 0:
+        visit_at = params["p_visit_at"]
+        changes = {
+            "total_visits": (customer.get("total_visits") or 0) + delta,
+            "last_visit": _latest([customer.get("last_visit"), visit_at])
+        }
+    else:
+        completed = client.table("reservations").select("reservation_datetime").eq(
+            "customer_id", customer_id
+        ).eq("status", "completed").execute().data
+        changes = {
+            "total_visits": max((customer.get("total_visits") or 0) + delta, 0),
+            "last_visit": _latest([row.get("reservation_datetime") for row in completed])
+        }
+    updated = client.table("customers").update(changes).eq("id", customer_id).execute().data[0]
+    return [{"total_visits": updated["total_visits"], "last_visit": updated["last_visit"]}]
+
+
+def backfill_customer_visit_stats(client: MemorySupabaseClient, params: Dict[str, Any]) -> List[dict]:
+    """backfill_customer_visit_stats（database/migrations/add_customer_visit_stats_functions.sql）"""
+    shop_id = params.get("p_shop_id")
+    reservations = client.table("reservations").select("customer_id, reservation_datetime").eq("status", "completed")
+    customers = client.table("customers").select("id, total_visits, last_visit")
+    if shop_id is not None:
+        reservations = reservations.eq("shop_id", shop_id)
+        customers = customers.eq("shop_id", shop_id)
+
+    visits: Dict[str, List[Any]] = {}
+    for row in reservations.execute().data:
+        visits.setdefault(row["customer_id"], []).append(row.get("reservation_datetime"))
+
+    updated_count = 0
+    for customer in customers.execute().data:
+        times = visits.get(customer["id"], [])
+        total_visits, last_visit = len(times), _latest(times)
+        if customer.get("total_visits") == total_visits and _same_time(customer.get("last_visit"), last_visit):
+            continue
+        client.table("customers").update({
+            "total_visits": total_visits,
+            "last_visit": last_visit
+        }).eq("id", customer["id"]).execute()
+        updated_count += 1
+    return [{"updated_count": updated_count}]
+
+
+# pg_trgm の % 演算子の既定のしきい値（pg_trgm.similarity_threshold）
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+SEARCH_CUSTOMER_COLUMNS = (
+    "id", "name", "name_kana", "email", "phone", "is_active", "total_visits", "last_visit"
+)
+
+
+def _trigrams(text: str) -> set:
+    """pg_trgm と同じトライグラム（英数字の単語ごとに前に空白2つ・後に空白1つを付けて3文字ずつ切り出す）"""
+    grams = set()
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _similarity(value: Optional[str], query: str) -> float:
+    """pg_trgm の similarity()"""
+    left, right = _trigrams(value or ""), _trigrams(query)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def _digits(value: Optional[str]) -> str:
+    return re.sub(r"[^0-9]", "", value or "")
+
+
+def search_customers(client: MemorySupabaseClient, params: Dict[str, Any]) -> List[dict]:
+    """search_customers（database/migrations/add_customer_search_index.sql）"""
+    query = (params.get("p_query") or "").strip().lower()
+    if not query:
+        return []
+    query_digits = _digits(params.get("p_query"))
+    customers = client.table("customers").select("*").eq("shop_id", params["p_shop_id"]).execute().data
+
+    results = []
+    for customer in customers:
+        if not params.get("p_include_inactive") and not customer.get("is_active"):
+            continue
+        texts = [(customer.get(column) or "").lower() for column in ("name", "name_kana", "email")]
+        matched = (
+            any(query in text for text in texts)
+            or (query_digits != "" and query_digits in _digits(customer.get("phone")))
+            or _similarity(customer.get("name"), query) >= TRIGRAM_SIMILARITY_THRESHOLD
+            or _similarity(customer.get("name_kana"), query) >= TRIGRAM_SIMILARITY_THRESHOLD
+        )
+        if not matched:
+            continue
+        score = max(
+            _similarity(customer.get("name"), query),
+            _similarity(customer.get("name_kana"), query),
+            _similarity(customer.get("email"), query),
+            _similarity(_digits(customer.get("phone")), query_digits) if query_digits else 0.0
+        )
+        if any(text.startswith(query) for text in texts):
+            score += 1
+        row = {column: customer.get(column) for column in SEARCH_CUSTOMER_COLUMNS}
+        row["score"] = score
+        results.append(row)
+
+    # スコアの高い順、最終来店日時の新しい順（未来店は最後）、IDの順
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    results.sort(key=lambda row: row["id"])
+    results.sort(key=lambda row: _timestamp(row["last_visit"]) if row["last_visit"] else oldest, reverse=True)
+    results.sort(key=lambda row: row["score"], reverse=True)
+    return results[:params.get("p_limit") or 10]
+
+
+def get_customer_summary(client: MemorySupabaseClient, params: Dict[str, Any]) -> List[dict]:
+    """get_customer_summary（database/migrations/add_customer_summary_function.sql）"""
+    shop_id = params["p_shop_id"]
+    limit = params.get("p_limit") or 5
+    customer = _find(client, "customers", id=params["p_customer_id"], shop_id=shop_id)
+    if customer is None:
+        return []
+
+    reservations = client.table("reservations").select("*").eq("customer_id", customer["id"]).eq(
+        "shop_id", shop_id
+    ).order("reservation_datetime", desc=True).execute().data
+    orders = client.table("orders").select("*").eq("customer_id", customer["id"]).eq(
+        "shop_id", shop_id
+    ).order("created_at", desc=True).execute().data
+    now = datetime.now(timezone.utc)
+
+    return [{
+        "customer": {**customer, "total_visits": customer.get("total_visits") or 0},
+        "recent_reservations": reservations[:limit],
+        "recent_orders": orders[:limit],
+        "order_stats": {
+            "order_count": len(orders),
+            "lifetime_spend": sum(
+                order.get("final_amount") or 0 for order in orders if order.get("status") in ("paid", "completed")
+            ),
+            "last_order_at": _latest([order.get("created_at") for order in orders])
+        },
+        "reservation_stats": {
+            "total_reservations": len(reservations),
+            "upcoming_reservations": sum(
+                1 for reservation in reservations
+                if reservation.get("status") in ("pending", "confirmed")
+                and _timestamp(reservation["reservation_datetime"]) > now
+            ),
+            "cancelled_reservations": sum(1 for reservation in reservations if reservation.get("status") == "cancelled"),
+            "no_show_reservations": sum(1 for reservation in reservations if reservation.get("status") == "no_show")
+        }
+    }]
+
+
+def register_memory_functions(client: MemorySupabaseClient) -> MemorySupabaseClient:
+    """データベース関数をインメモリクライアントに登録"""
+    client.register_function("place_order", place_order)
+    client.register_function("set_order_status", set_order_status)
+    client.register_function("adjust_customer_visit_stats", adjust_customer_visit_stats)
+    client.register_function("backfill_customer_visit_stats", backfill_customer_visit_stats)
+    client.register_function("search_customers", search_customers)
+    client.register_function("get_customer_summary", get_customer_summary)
+    return client
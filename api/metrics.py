@@ -0,0 +1,296 @@
+"""
+リクエストメトリクス
+ルートごとのレイテンシ・リクエスト数・エラー率・DB呼び出し回数と、
+テーブルごとのDBクエリ所要時間・行数・データ量を集計し、Prometheusのテキスト形式で出力する
+"""
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+
+# レイテンシ（秒）のヒストグラム境界
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1リクエストあたりのDB呼び出し回数のヒストグラム境界
+DB_CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# DBクエリ1回あたりの所要時間（秒）のヒストグラム境界
+DB_QUERY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# パーセンタイル算出に使う直近サンプル数（ルートごと）
+RESERVOIR_SIZE = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+METRIC_PREFIX = "yoyaku"
+
+
+class RequestDbStats:
+    """1リクエスト内のDB呼び出し状況"""
+
+    def __init__(self, method: str = "", path: str = ""):
+        self.method = method
+        self.path = path
+        self.calls = 0
+        self.table_calls: Dict[str, int] = {}
+        # N+1の警告を出したテーブル（1リクエストにつき1回だけ警告する）
+        self.warned_tables: Set[str] = set()
+
+
+# 現在のリクエストのDB呼び出し状況（リクエスト外ではNone）
+_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+def start_db_call_tracking(method: str = "", path: str = ""):
+    """現在のコンテキストでDB呼び出しの計測を開始し、リセット用のトークンを返す"""
+    return _request_db_stats.set(RequestDbStats(method, path))
+
+
+def stop_db_call_tracking(token) -> int:
+    """計測を終了し、計測中のDB呼び出し回数を返す"""
+    stats = _request_db_stats.get()
+    _request_db_stats.reset(token)
+    return stats.calls if stats else 0
+
+
+def current_request_db_stats() -> Optional[RequestDbStats]:
+    """現在のリクエストのDB呼び出し状況（リクエスト外ではNone）"""
+    return _request_db_stats.get()
+
+
+def record_db_call(table: str) -> int:
+    """
+    DB呼び出しを1回記録
+
+    Returns:
+        現在のリクエストでこのテーブルに発行したクエリ数（リクエスト外の呼び出しは0）
+    """
+    stats = _request_db_stats.get()
+    if stats is None:
+        return 0
+    stats.calls += 1
+    count = stats.table_calls.get(table, 0) + 1
+    stats.table_calls[table] = count
+    return count
+
+
+class Histogram:
+    """累積バケット方式のヒストグラム"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, 累積件数) のリスト（+Infを含む）"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((_format_value(bound), total))
+        result.append(("+Inf", self.count))
+        return result
+
+
+class RouteStats:
+    """1ルート分の集計値"""
+
+    def __init__(self):
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_calls = Histogram(DB_CALL_BUCKETS)
+        self.recent: Deque[float] = deque(maxlen=RESERVOIR_SIZE)
+
+    @property
+    def total(self) -> int:
+        return self.latency.count
+
+    def quantiles(self) -> List[Tuple[float, float]]:
+        """直近サンプルからパーセンタイルを算出"""
+        samples = sorted(self.recent)
+        if not samples:
+            return []
+        last = len(samples) - 1
+        return [(q, samples[min(last, int(round(q * last)))]) for q in QUANTILES]
+
+
+class QueryStats:
+    """テーブル・操作ごとのDBクエリ集計値"""
+
+    def __init__(self):
+        self.errors = 0
+        self.rows = 0
+        self.payload_bytes = 0
+        self.duration = Histogram(DB_QUERY_BUCKETS)
+
+
+class MetricsRegistry:
+    """ルート（メソッドとパステンプレート）およびDBクエリ（テーブルと操作）ごとのメトリクスを保持"""
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._queries: Dict[Tuple[str, str], QueryStats] = {}
+        self._db_retries: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe_request(
+        self,
+        method: str,
+        route: str,
+        status_code: int,
+        duration: float,
+        db_calls: int
+    ) -> None:
+        """1リクエスト分の計測結果を記録"""
+        with self._lock:
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = RouteStats()
+            status = str(status_code)
+            stats.requests[status] = stats.requests.get(status, 0) + 1
+            if status_code >= 500:
+                stats.errors += 1
+            stats.latency.observe(duration)
+            stats.db_calls.observe(db_calls)
+            stats.recent.append(duration)
+
+    def observe_db_query(
+        self,
+        table: str,
+        operation: str,
+        duration: float,
+        rows: int,
+        payload_bytes: int,
+        failed: bool = False
+    ) -> None:
+        """DBクエリ1回分の計測結果を記録"""
+        with self._lock:
+            stats = self._queries.get((table, operation))
+            if stats is None:
+                stats = self._queries[(table, operation)] = QueryStats()
+            if failed:
+                stats.errors += 1
+            stats.rows += rows
+            stats.payload_bytes += payload_bytes
+            stats.duration.observe(duration)
+
+    def observe_db_retry(self, reason: str) -> None:
+        """PostgRESTへのリクエストの再試行を1回記録"""
+        with self._lock:
+            self._db_retries[reason] = self._db_retries.get(reason, 0) + 1
+
+    def reset(self) -> None:
+        """全メトリクスを破棄"""
+        with self._lock:
+            self._routes.clear()
+            self._queries.clear()
+            self._db_retries.clear()
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式で出力"""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines: List[str] = []
+
+            name = f"{METRIC_PREFIX}_http_requests_total"
+            lines.append(f"# HELP {name} ルートごとのリクエスト数")
+            lines.append(f"# TYPE {name} counter")
+            for (method, route), stats in routes:
+                for status, count in sorted(stats.requests.items()):
+                    lines.append(f"{name}{_labels(method=method, route=route, status=status)} {count}")
+
+            name = f"{METRIC_PREFIX}_http_request_errors_total"
+            lines.append(f"# HELP {name} ルートごとの5xxレスポンス数")
+            lines.append(f"# TYPE {name} counter")
+            for (method, route), stats in routes:
+                lines.append(f"{name}{_labels(method=method, route=route)} {stats.errors}")
+
+            name = f"{METRIC_PREFIX}_http_request_error_ratio"
+            lines.append(f"# HELP {name} ルートごとの5xxレスポンスの割合（起動後の累計）")
+            lines.append(f"# TYPE {name} gauge")
+            for (method, route), stats in routes:
+                ratio = stats.errors / stats.total if stats.total else 0.0
+                lines.append(f"{name}{_labels(method=method, route=route)} {_format_value(ratio)}")
+
+            name = f"{METRIC_PREFIX}_http_request_duration_seconds"
+            lines.append(f"# HELP {name} ルートごとのレイテンシ")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), stats in routes:
+                _append_histogram(lines, name, stats.latency, method=method, route=route)
+
+            name = f"{METRIC_PREFIX}_http_request_latency_seconds"
+            lines.append(f"# HELP {name} ルートごとのレイテンシのパーセンタイル（直近{RESERVOIR_SIZE}件）")
+            lines.append(f"# TYPE {name} summary")
+            for (method, route), stats in routes:
+                for quantile, value in stats.quantiles():
+                    labels = _labels(method=method, route=route, quantile=_format_value(quantile))
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+                labels = _labels(method=method, route=route)
+                lines.append(f"{name}_sum{labels} {_format_value(stats.latency.sum)}")
+                lines.append(f"{name}_count{labels} {stats.latency.count}")
+
+            name = f"{METRIC_PREFIX}_db_calls_per_request"
+            lines.append(f"# HELP {name} 1リクエストあたりのデータベース呼び出し回数")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), stats in routes:
+                _append_histogram(lines, name, stats.db_calls, method=method, route=route)
+
+            queries = sorted(self._queries.items())
+
+            name = f"{METRIC_PREFIX}_db_query_duration_seconds"
+            lines.append(f"# HELP {name} テーブル・操作ごとのDBクエリ所要時間")
+            lines.append(f"# TYPE {name} histogram")
+            for (table, operation), stats in queries:
+                _append_histogram(lines, name, stats.duration, table=table, operation=operation)
+
+            for metric, help_text, attr in (
+                ("db_query_errors_total", "テーブル・操作ごとの失敗したDBクエリ数", "errors"),
+                ("db_query_rows_total", "テーブル・操作ごとの取得・更新行数", "rows"),
+                ("db_query_payload_bytes_total", "テーブル・操作ごとのPostgRESTとの送受信データ量（バイト数）", "payload_bytes"),
+            ):
+                name = f"{METRIC_PREFIX}_{metric}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for (table, operation), stats in queries:
+                    lines.append(f"{name}{_labels(table=table, operation=operation)} {getattr(stats, attr)}")
+
+            name = f"{METRIC_PREFIX}_db_http_retries_total"
+            lines.append(f"# HELP {name} PostgRESTへのリクエストの再試行回数（理由別）")
+            lines.append(f"# TYPE {name} counter")
+            for reason, count in sorted(self._db_retries.items()):
+                lines.append(f"{name}{_labels(reason=reason)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _append_histogram(lines: List[str], name: str, histogram: Histogram, **labels: str) -> None:
+    for le, count in histogram.cumulative():
+        lines.append(f"{name}_bucket{_labels(**labels, le=le)} {count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {_format_value(histogram.sum)}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+
+# アプリケーション全体で共有するレジストリ
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,305 @@
+"""
+ASGIミドルウェア
+レスポンス圧縮・リクエスト計測・リクエストID付与など、全ルート共通のHTTP処理
+"""
+import re
+import time
+import uuid
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.logger import request_id_var
+from api.metrics import (
+    MetricsRegistry,
+    metrics_registry,
+    start_db_call_tracking,
+    stop_db_call_tracking
+)
+
+try:
+    import brotli
+except ImportError:  # brotliが未インストールの場合はgzipのみ使用
+    brotli = None
+
+
+# 既に圧縮済みのため再圧縮しないContent-Type
+UNCOMPRESSIBLE_CONTENT_TYPES = (
+    "application/gzip",
+    "application/zip",
+    "image/",
+    "video/",
+    "audio/",
+)
+
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Accept-Encodingヘッダーから使用する圧縮方式を決定
+
+    q値が0の方式は除外し、brotliが利用可能ならbrをgzipより優先する。
+
+    Args:
+        accept_encoding: Accept-Encodingヘッダーの値
+
+    Returns:
+        "br"、"gzip"、または圧縮しない場合None
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    def is_accepted(encoding: str) -> bool:
+        return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+    if brotli is not None and is_accepted("br"):
+        return "br"
+    if is_accepted("gzip"):
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """gzip/brotliのストリーミング圧縮を共通インターフェースで扱う"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        """チャンクを圧縮し、クライアントへ送れる分をフラッシュして返す"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        """残りのデータを圧縮してストリームを閉じる"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """
+    レスポンス圧縮ミドルウェア
+
+    Accept-Encodingに応じてbrotliまたはgzipで圧縮する。
+    minimum_size未満のレスポンス、既にContent-Encodingが設定されたレスポンス、
+    圧縮済みのContent-Typeは圧縮しない。ストリーミングレスポンスにも対応。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding is not None:
+                responder = _CompressionResponder(
+                    self.app,
+                    _Compressor(encoding, self.gzip_level, self.brotli_quality),
+                    self.minimum_size
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressionResponder:
+    """1リクエスト分のレスポンスを圧縮して送信する"""
+
+    def __init__(self, app: ASGIApp, compressor: _Compressor, minimum_size: int) -> None:
+        self.app = app
+        self.compressor = compressor
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # ヘッダーはボディの大きさを確認してから送信する
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or content_type.startswith(UNCOMPRESSIBLE_CONTENT_TYPES)
+            )
+            return
+
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+
+            if not more_body and len(body) < self.minimum_size:
+                # 小さなレスポンスは圧縮しない
+                self.passthrough = True
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            headers["Content-Encoding"] = self.compressor.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+                message["body"] = self.compressor.compress(body)
+            else:
+                message["body"] = self.compressor.finish(body)
+                headers["Content-Length"] = str(len(message["body"]))
+
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        # ストリーミングレスポンスの2番目以降のチャンク
+        if more_body:
+            message["body"] = self.compressor.compress(body)
+        else:
+            message["body"] = self.compressor.finish(body)
+        await self.send(message)
+
+
+# どのルートにも一致しなかったリクエストのラベル（任意のパスでラベルが増え続けないようにまとめる）
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    リクエスト計測ミドルウェア
+
+    ルート（パステンプレート）ごとにレイテンシ・ステータス・DB呼び出し回数を記録する。
+    レイテンシはレスポンス本体の送信完了まで（ストリーミングを含む）を計測する。
+    """
+
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry = metrics_registry) -> None:
+        self.app = app
+        self.registry = registry
+        self._route_paths: Dict[object, str] = {}
+
+    def _route_path(self, scope: Scope) -> str:
+        """ルーティング後のscopeからパステンプレートを取得"""
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            app = scope.get("app")
+            for route in getattr(app, "routes", []):
+                if getattr(route, "endpoint", getattr(route, "app", None)) is endpoint:
+                    path = route.path
+                    break
+            else:
+                path = UNMATCHED_ROUTE
+            self._route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        token = start_db_call_tracking(scope["method"], scope["path"])
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 未処理の例外は外側のServerErrorMiddlewareで500になるため、500として記録する
+            db_calls = stop_db_call_tracking(token)
+            self.registry.observe_request(
+                scope["method"],
+                self._route_path(scope),
+                status_code,
+                time.perf_counter() - start,
+                db_calls
+            )
+
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# クライアントから受け取るリクエストIDの形式（ログへの不正な文字列の混入を防ぐ）
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+
+class RequestIdMiddleware:
+    """
+    リクエストIDミドルウェア
+
+    X-Request-IDヘッダーがあればそれを、なければ新しいIDを採番してログに付与し、
+    レスポンスヘッダーにも返す。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER)
+        if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = request_id
+            await send(message)
+
+        # リクエストごとのタスク内でのみ有効な値のため、外側の例外ハンドラーのログにも
+        # 付与されるよう、処理後もリセットしない
+        request_id_var.set(request_id)
+        await self.app(scope, receive, send_wrapper)
@@ -42,6 +42,12 @@ class CampaignStatus(str, Enum):
     ENDED = "ended"
 
 
+class PromotionKind(str, Enum):
+    """割引の種類"""
+    COUPON = "coupon"
+    CAMPAIGN = "campaign"
+
+
 # ベースモデル
 class BaseDBModel(BaseModel):
     """データベースモデルのベースクラス"""
@@ -0,0 +1,161 @@
+"""
+Postgresへの直接接続（asyncpgの接続プール）
+DATABASE_URLが設定されている場合のみ使用し、集計などの重いクエリをPostgRESTを経由せずに実行する
+
+asyncpgは接続ごとにプリペアドステートメントをキャッシュするため、
+クエリは定数のSQL文字列（値はすべて$nのパラメータ）で実行する
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+import sys
+import os
+
+import orjson
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from api.logger import logger
+from api.metrics import metrics_registry
+
+
+def _load_asyncpg():
+    """asyncpgを読み込む（未インストールの場合はNone、コールドスタートを短くするため初回利用時に読み込む）"""
+    try:
+        import asyncpg
+    except ImportError:
+        return None
+    return asyncpg
+
+
+def _json_dumps(value: Any) -> str:
+    return orjson.dumps(value).decode()
+
+
+def _to_python(value: Any) -> Any:
+    """PostgRESTの結果と揃えるため、UUIDは文字列で返す"""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def record_to_dict(record: Any) -> Dict[str, Any]:
+    """asyncpgのRecordを辞書に変換"""
+    return {key: _to_python(value) for key, value in record.items()}
+
+
+async def _init_connection(connection: Any) -> None:
+    """JSON/JSONBをPythonのオブジェクトとして読み書きする"""
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(
+            type_name, encoder=_json_dumps, decoder=orjson.loads, schema="pg_catalog"
+        )
+
+
+class PostgresPool:
+    """
+    asyncpgの接続プール
+
+    初回利用時に作成する。接続できない場合やasyncpgが未インストールの場合はNoneを返し、
+    呼び出し側はPostgRESTにフォールバックする。プールは作成したイベントループでしか使えないため、
+    ループが変わった場合（スクリプトでasyncio.runを繰り返した場合など）は作り直す。
+    """
+
+    def __init__(self):
+        self._pool = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._retry_at = 0.0
+        self._warned_missing = False
+
+    @property
+    def configured(self) -> bool:
+        """直接接続が設定されているか（インメモリバックエンドではPostgresに接続しない）"""
+        return bool(settings.DATABASE_URL) and settings.SUPABASE_BACKEND != "memory"
+
+    async def get_pool(self):
+        """接続プールを取得（使えない場合はNone）"""
+        if not self.configured:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._pool is not None and self._loop is loop:
+            return self._pool
+        if time.monotonic() < self._retry_at:
+            return None
+
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+            self._pool = None
+        async with self._lock:
+            if self._pool is not None:
+                return self._pool
+            asyncpg = _load_asyncpg()
+            if asyncpg is None:
+                if not self._warned_missing:
+                    logger.warning("asyncpgが未インストールのため、重いクエリもPostgREST経由で実行します")
+                    self._warned_missing = True
+                self._retry_at = float("inf")
+                return None
+            try:
+                self._pool = await asyncpg.create_pool(
+                    dsn=settings.DATABASE_URL,
+                    min_size=settings.DATABASE_POOL_MIN_SIZE,
+                    max_size=settings.DATABASE_POOL_MAX_SIZE,
+                    statement_cache_size=settings.DATABASE_STATEMENT_CACHE_SIZE,
+                    command_timeout=settings.DATABASE_COMMAND_TIMEOUT,
+                    init=_init_connection
+                )
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                self._retry_at = time.monotonic() + settings.DATABASE_RETRY_INTERVAL
+                logger.error(
+                    "Postgresへの接続プールを作成できませんでした。%.0f秒間PostgREST経由で実行します: %s",
+                    settings.DATABASE_RETRY_INTERVAL, str(e)
+                )
+                return None
+            logger.info(
+                "Postgresへの接続プールを作成しました (min=%d, max=%d)",
+                settings.DATABASE_POOL_MIN_SIZE, settings.DATABASE_POOL_MAX_SIZE
+            )
+            return self._pool
+
+    async def fetch(self, name: str, sql: str, *args: Any) -> Optional[List[Dict[str, Any]]]:
+        """
+        SQLを実行して結果を辞書のリストで返す
+
+        Args:
+            name: メトリクス・ログ用のクエリ名
+            sql: 定数のSQL（プリペアドステートメントとしてキャッシュされる）
+
+        Returns:
+            結果の行（接続プールが使えない場合はNone）
+        """
+        pool = await self.get_pool()
+        if pool is None:
+            return None
+
+        start = time.perf_counter()
+        failed = True
+        rows: List[Dict[str, Any]] = []
+        try:
+            records = await pool.fetch(sql, *args)
+            rows = [record_to_dict(record) for record in records]
+            failed = False
+            return rows
+        finally:
+            duration = time.perf_counter() - start
+            metrics_registry.observe_db_query(f"pg:{name}", "sql", duration, len(rows), 0, failed)
+            if duration * 1000 >= settings.DB_SLOW_QUERY_MS:
+                logger.warning(
+                    "スロークエリ: pg:%s 行数: %d 所要時間: %.1fms", name, len(rows), duration * 1000
+                )
+
+    async def close(self) -> None:
+        """接続プールを閉じる（アプリケーション終了時）"""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            await pool.close()
+
+
+postgres_pool = PostgresPool()
@@ -0,0 +1,46 @@
+"""
+クーポン・キャンペーンの日次集計の読み取り
+集計行は注文の支払い・キャンセル・返金時に set_order_status 関数で更新される
+（database/migrations/add_promotion_daily_stats.sql）。統計は注文を走査せず集計行だけを読む
+"""
+from datetime import date
+from typing import Dict, List, Optional
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.database import Client
+
+STATS_COLUMNS = (
+    "stat_date, orders, revenue, discount_amount, cancelled_orders, refunded_orders, refunded_amount"
+)
+COUNTER_COLUMNS = (
+    "orders", "revenue", "discount_amount", "cancelled_orders", "refunded_orders", "refunded_amount"
+)
+
+
+def load_promotion_daily_stats(
+    db: Client,
+    shop_id: str,
+    promotion_type: str,
+    promotion_id: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> List[Dict]:
+    """クーポン・キャンペーンの日次集計を日付順に取得（期間は両端を含む）"""
+    query = db.table("promotion_daily_stats").select(STATS_COLUMNS).eq(
+        "promotion_type", promotion_type
+    ).eq("promotion_id", promotion_id).eq("shop_id", shop_id)
+    if start_date:
+        query = query.gte("stat_date", start_date.isoformat())
+    if end_date:
+        query = query.lte("stat_date", end_date.isoformat())
+    result = query.order("stat_date").execute()
+    return result.data or []
+
+
+def summarize_promotion_stats(daily: List[Dict]) -> Dict[str, int]:
+    """日次集計の合計（net_revenue は売上から取り消し分を引いた金額）"""
+    totals = {column: sum(row.get(column) or 0 for row in daily) for column in COUNTER_COLUMNS}
+    totals["net_revenue"] = totals["revenue"] - totals["refunded_amount"]
+    return totals
@@ -0,0 +1,395 @@
+"""
+クーポン・キャンペーンの割引ルール
+クーポン・キャンペーンの行を、期間・使用回数・最低購入金額・対象サービス・対象顧客のチェックを並べた
+ルールオブジェクトにコンパイルし、注文内容（Basket）に対して評価する
+
+クーポンの検証API・注文作成・CampaignManagerは同じルールで判定する。
+店舗の有効なクーポンとキャンペーンはコンパイル済みの状態でキャッシュし、
+注文内容をすべての割引に対して評価する処理はメモリ上の1回の走査で済む。
+"""
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import sys
+import os
+import unicodedata
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from api.catalog_cache import TenantCache
+from api.database import Client
+from api.models import CampaignStatus, PromotionKind
+from api.utils import as_utc, calculate_discount
+
+
+class Basket:
+    """評価する注文内容"""
+
+    def __init__(
+        self,
+        total_amount: int,
+        service_ids: Optional[Iterable[str]] = None,
+        customer_id: Optional[str] = None,
+        customer_visits: Optional[int] = None
+    ):
+        self.total_amount = total_amount
+        self.service_ids = frozenset(service_ids or ())
+        self.customer_id = customer_id
+        # 新規顧客限定のルールで使う来店回数（不明な場合はNone、新規顧客限定のルールは対象外になる）
+        self.customer_visits = customer_visits
+
+
+class RuleResult:
+    """ルールの評価結果"""
+
+    def __init__(self, eligible: bool, message: str, discount_amount: int = 0):
+        self.eligible = eligible
+        self.message = message
+        self.discount_amount = discount_amount
+
+
+# チェック関数: 条件を満たさない場合にメッセージを返す
+Check = Callable[[Basket, datetime], Optional[str]]
+
+
+class PromotionRule:
+    """
+    コンパイル済みの割引ルール
+
+    行に設定されている条件のチェックだけを持ち、評価時は順に実行して最初に満たさない条件のメッセージを返す。
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        row: dict,
+        starts_at: datetime,
+        ends_at: datetime,
+        checks: List[Check],
+        discount_type: Optional[str],
+        discount_value: Optional[int],
+        max_discount_amount: Optional[int],
+        success_message: str,
+        needs_customer_history: bool = False
+    ):
+        self.kind = kind
+        self.row = row
+        self.id = row.get("id")
+        self.code = row.get("code")
+        self.name = row.get("name")
+        # 有効期間（UTC）
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self._checks = checks
+        self._discount_type = discount_type
+        self._discount_value = discount_value or 0
+        self._max_discount_amount = max_discount_amount
+        self._success_message = success_message
+        # Trueの場合、Basket.customer_visits を渡して評価する
+        self.needs_customer_history = needs_customer_history
+        self._usage_count = row.get("usage_count") or 0
+
+    def evaluate(self, basket: Basket, now: Optional[datetime] = None) -> RuleResult:
+        """注文内容に適用できるかを判定し、割引金額を計算"""
+        now = now or datetime.now(timezone.utc)
+        for check in self._checks:
+            message = check(basket, now)
+            if message:
+                return RuleResult(False, message)
+        discount_amount = calculate_discount(
+            basket.total_amount,
+            self._discount_type,
+            self._discount_value,
+            self._max_discount_amount
+        )
+        return RuleResult(True, self._success_message, discount_amount)
+
+    @property
+    def usage_count(self) -> int:
+        return self._usage_count
+
+    def record_use(self) -> None:
+        """このプロセスでの使用を反映（次の再コンパイルまでの使用回数チェックに使う）"""
+        self._usage_count += 1
+
+
+def _always(message: str) -> Check:
+    return lambda basket, now: message
+
+
+def _period(start: datetime, end: datetime, before_message: str, after_message: str) -> Check:
+    def check(basket: Basket, now: datetime) -> Optional[str]:
+        if now < start:
+            return before_message
+        if now > end:
+            return after_message
+        return None
+    return check
+
+
+def _usage_limit(rule_ref: List[PromotionRule], limit: int, message: str) -> Check:
+    # 使用回数はコンパイル後も record_use() で増えるため、ルールから読む
+    return lambda basket, now: message if rule_ref[0].usage_count >= limit else None
+
+
+def _min_amount(amount: int, message: str) -> Check:
+    return lambda basket, now: message if basket.total_amount < amount else None
+
+
+def _applicable_services(service_ids: frozenset, message: str) -> Check:
+    # サービスを含まない注文（商品のみなど）は対象外にしない（従来のクーポン検証と同じ扱い）
+    def check(basket: Basket, now: datetime) -> Optional[str]:
+        if basket.service_ids and not basket.service_ids & service_ids:
+            return message
+        return None
+    return check
+
+
+def _new_customers_only(message: str, unknown_message: str) -> Check:
+    # 来店回数が分からない（顧客が指定されていない）場合は新規顧客か判断できないため対象外にする
+    def check(basket: Basket, now: datetime) -> Optional[str]:
+        if basket.customer_visits is None:
+            return unknown_message
+        return message if basket.customer_visits > 0 else None
+    return check
+
+
+def _customer_ids(customer_ids: frozenset, message: str) -> Check:
+    return lambda basket, now: message if basket.customer_id not in customer_ids else None
+
+
+def compile_coupon(row: dict) -> PromotionRule:
+    """クーポンの行をルールにコンパイル"""
+    checks: List[Check] = []
+    rule_ref: List[PromotionRule] = []
+    starts_at = as_utc(row["valid_from"])
+    ends_at = as_utc(row["valid_until"])
+
+    if not row.get("is_active", False):
+        checks.append(_always("このクーポンは無効です"))
+    checks.append(_period(
+        starts_at,
+        ends_at,
+        "このクーポンはまだ有効ではありません",
+        "このクーポンの有効期限が切れています"
+    ))
+    if row.get("usage_limit") is not None:
+        checks.append(_usage_limit(rule_ref, row["usage_limit"], "このクーポンの使用回数制限に達しています"))
+    if row.get("min_purchase_amount") is not None:
+        checks.append(_min_amount(
+            row["min_purchase_amount"],
+            f"最低購入金額 {row['min_purchase_amount']}円以上でご利用いただけます"
+        ))
+    if row.get("applicable_services"):
+        checks.append(_applicable_services(
+            frozenset(row["applicable_services"]),
+            "このクーポンは選択されたサービスには適用できません"
+        ))
+
+    rule = PromotionRule(
+        PromotionKind.COUPON.value,
+        row,
+        starts_at,
+        ends_at,
+        checks,
+        row.get("coupon_type"),
+        row.get("discount_value"),
+        row.get("max_discount_amount"),
+        "クーポンが適用されました"
+    )
+    rule_ref.append(rule)
+    return rule
+
+
+def compile_campaign(row: dict) -> PromotionRule:
+    """キャンペーンの行をルールにコンパイル"""
+    checks: List[Check] = []
+    starts_at = as_utc(row["start_date"])
+    ends_at = as_utc(row["end_date"])
+
+    if row.get("status") != CampaignStatus.ACTIVE.value or not row.get("is_active"):
+        checks.append(_always("キャンペーンは現在アクティブではありません"))
+    checks.append(_period(
+        starts_at,
+        ends_at,
+        "キャンペーンの期間外です",
+        "キャンペーンの期間外です"
+    ))
+
+    target_audience = row.get("target_audience") or {}
+    needs_customer_history = bool(target_audience.get("new_customers_only"))
+    if needs_customer_history:
+        checks.append(_new_customers_only(
+            "このキャンペーンは新規顧客限定です",
+            "このキャンペーンは新規顧客限定のため、顧客の指定が必要です"
+        ))
+    if target_audience.get("customer_ids"):
+        checks.append(_customer_ids(
+            frozenset(target_audience["customer_ids"]),
+            "このキャンペーンの対象外です"
+        ))
+
+    conditions = row.get("conditions") or {}
+    min_amount = conditions.get("min_purchase_amount")
+    if min_amount:
+        checks.append(_min_amount(min_amount, f"最低購入金額 {min_amount}円以上でご利用いただけます"))
+
+    return PromotionRule(
+        PromotionKind.CAMPAIGN.value,
+        row,
+        starts_at,
+        ends_at,
+        checks,
+        row.get("discount_type"),
+        row.get("discount_value"),
+        None,
+        "キャンペーンが適用されました",
+        needs_customer_history=needs_customer_history
+    )
+
+
+class ShopPromotions:
+    """
+    店舗のコンパイル済みクーポン・キャンペーン
+
+    有効なクーポン・キャンペーンは開始日時の順に並べた索引に入れ、
+    評価時は二分探索で開始済みのものだけを取り出す（開始前の予約済みのクーポン・キャンペーンは走査しない）。
+    """
+
+    def __init__(self, coupons: List[PromotionRule], campaigns: List[PromotionRule]):
+        # クーポンID → クーポン（get_coupon_rule() で取得した無効なクーポンも追加される）
+        self.coupons: Dict[str, PromotionRule] = {rule.id: rule for rule in coupons}
+        self.campaigns = campaigns
+        indexed = sorted(coupons + campaigns, key=lambda rule: rule.starts_at)
+        self._starts = [rule.starts_at for rule in indexed]
+        self._indexed = indexed
+
+    def active_rules(self, now: Optional[datetime] = None) -> List[PromotionRule]:
+        """有効期間内のクーポン・キャンペーン"""
+        now = now or datetime.now(timezone.utc)
+        started = self._indexed[:bisect_right(self._starts, now)]
+        return [rule for rule in started if rule.ends_at >= now]
+
+    @property
+    def needs_customer_history(self) -> bool:
+        """来店回数が必要なルール（新規顧客限定など）を含むか"""
+        return any(rule.needs_customer_history for rule in self._indexed)
+
+    def evaluate_all(
+        self,
+        basket: Basket,
+        now: Optional[datetime] = None
+    ) -> List[Tuple[PromotionRule, RuleResult]]:
+        """注文内容を有効期間内のすべてのクーポン・キャンペーンに対して評価"""
+        now = now or datetime.now(timezone.utc)
+        return [(rule, rule.evaluate(basket, now)) for rule in self.active_rules(now)]
+
+    def best(
+        self,
+        basket: Basket,
+        now: Optional[datetime] = None
+    ) -> Tuple[Optional[PromotionRule], Optional[RuleResult], int]:
+        """
+        割引金額が最大のクーポン・キャンペーンを選ぶ
+
+        同じ割引金額の場合はコードの入力が不要なキャンペーン、次に終了日時の早いものを優先する。
+
+        Returns:
+            (ルール, 評価結果, 評価した件数)（適用できるものがない場合はルールと評価結果がNone）
+        """
+        best_key = None
+        best_rule, best_result = None, None
+        evaluated = self.evaluate_all(basket, now)
+        for rule, result in evaluated:
+            if not result.eligible or result.discount_amount <= 0:
+                continue
+            key = (result.discount_amount, rule.kind == PromotionKind.CAMPAIGN.value, -rule.ends_at.timestamp())
+            if best_key is None or key > best_key:
+                best_key, best_rule, best_result = key, rule, result
+        return best_rule, best_result, len(evaluated)
+
+
+def load_shop_promotions(db: Client, shop_id: str) -> ShopPromotions:
+    """店舗の有効なクーポンと実施中のキャンペーンを取得してコンパイル"""
+    now = datetime.now(timezone.utc).isoformat()
+    coupons = db.table("coupons").select("*").eq("shop_id", shop_id).eq(
+        "is_active", True
+    ).gte("valid_until", now).execute()
+    campaigns = db.table("campaigns").select("*").eq("shop_id", shop_id).eq(
+        "status", CampaignStatus.ACTIVE.value
+    ).eq("is_active", True).gte("end_date", now).execute()
+    return ShopPromotions(
+        [compile_coupon(row) for row in coupons.data or []],
+        [compile_campaign(row) for row in campaigns.data or []]
+    )
+
+
+def get_shop_promotions(db: Client, shop_id: str) -> ShopPromotions:
+    """店舗のコンパイル済みクーポン・キャンペーンを取得（キャッシュがなければ構築）"""
+    return promotion_cache.get_or_build(shop_id, lambda: load_shop_promotions(db, shop_id))
+
+
+def normalize_coupon_code(code: str) -> str:
+    """
+    クーポンコードを正規化
+
+    前後の空白を除き、全角英数字を半角に揃え（NFKC）、大文字にする。
+    """
+    return unicodedata.normalize("NFKC", code).strip().upper()
+
+
+def load_coupon_code_index(db: Client, shop_id: str) -> Dict[str, str]:
+    """店舗のすべてのクーポン（無効・期限切れを含む）の正規化したコード → クーポンID"""
+    result = db.table("coupons").select("id, code").eq("shop_id", shop_id).execute()
+    return {normalize_coupon_code(row["code"]): row["id"] for row in result.data or []}
+
+
+def find_coupon_id(db: Client, shop_id: str, code: str) -> Optional[str]:
+    """
+    クーポンコードのIDを索引から取得（存在しない場合はNone）
+
+    索引は店舗のすべてのコードを持つため、存在しないコードはデータベースに問い合わせずに判定される。
+    """
+    index = coupon_code_index.get_or_build(shop_id, lambda: load_coupon_code_index(db, shop_id))
+    return index.get(normalize_coupon_code(code))
+
+
+def get_coupon_rule(db: Client, shop_id: str, code: str) -> Optional[PromotionRule]:
+    """
+    クーポンコードのルールを取得（存在しない場合はNone）
+
+    コードは正規化して索引で引く。有効なクーポンは店舗のキャッシュから返し、
+    無効・期限切れのクーポンは行を取得してコンパイルする（店舗のキャッシュに追加する）。
+    """
+    coupon_id = find_coupon_id(db, shop_id, code)
+    if coupon_id is None:
+        return None
+    promotions = get_shop_promotions(db, shop_id)
+    rule = promotions.coupons.get(coupon_id)
+    if rule is not None:
+        return rule
+    result = db.table("coupons").select("*").eq("id", coupon_id).eq("shop_id", shop_id).limit(1).execute()
+    if not result.data:
+        return None
+    rule = promotions.coupons[coupon_id] = compile_coupon(result.data[0])
+    return rule
+
+
+def get_campaign_rule(db: Client, shop_id: str, campaign_id: str) -> Optional[PromotionRule]:
+    """実施中のキャンペーンのルールを取得（存在しない・実施中でない場合はNone）"""
+    for rule in get_shop_promotions(db, shop_id).campaigns:
+        if rule.id == campaign_id:
+            return rule
+    return None
+
+
+def invalidate_coupons(shop_id: str) -> None:
+    """クーポンの作成・更新・削除後に、店舗のコード索引とコンパイル済みルールを破棄"""
+    coupon_code_index.invalidate(shop_id)
+    promotion_cache.invalidate(shop_id)
+
+
+# 店舗ID → コンパイル済みのクーポン・キャンペーン（クーポン・キャンペーンの更新で破棄する）
+promotion_cache = TenantCache(settings.PROMOTION_CACHE_TTL_SECONDS)
+# 店舗ID → 正規化したクーポンコード → クーポンID（クーポンの作成・更新・削除で破棄する）
+coupon_code_index = TenantCache(settings.COUPON_CODE_INDEX_TTL_SECONDS)
@@ -0,0 +1,140 @@
+"""
+クライアント単位の試行回数制限
+クーポンコードの総当たりなど、失敗を繰り返すクライアントを一定時間断る（プロセス内で数える）
+"""
+import ipaddress
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Dict, List, Optional, Tuple
+import sys
+import os
+
+from fastapi import HTTPException, Request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+
+
+@lru_cache(maxsize=4)
+def _trusted_networks(value: str) -> Optional[Tuple]:
+    """TRUSTED_PROXIES を解析（"*" はすべての接続元を信頼する場合で None を返す）"""
+    if value.strip() == "*":
+        return None
+    return tuple(
+        ipaddress.ip_network(entry.strip(), strict=False)
+        for entry in value.split(",") if entry.strip()
+    )
+
+
+def _is_trusted(address: str, networks: Optional[Tuple]) -> bool:
+    if networks is None:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_address(request: Request) -> str:
+    """
+    クライアントのアドレス
+
+    接続元のアドレスを使う。接続元が信頼できるプロキシ（TRUSTED_PROXIES）の場合だけ X-Forwarded-For を読み、
+    末尾から信頼できるプロキシのアドレスを除いた最初のエントリ（信頼できるプロキシが追加したもの）を使う。
+    先頭のエントリはクライアントが自由に指定できるため使わない。
+    """
+    peer = request.client.host if request.client else "unknown"
+    trusted = settings.TRUSTED_PROXIES
+    forwarded = request.headers.get("x-forwarded-for")
+    if not trusted or not forwarded:
+        return peer
+    networks = _trusted_networks(trusted)
+    if not _is_trusted(peer, networks):
+        return peer
+    entries: List[str] = [entry.strip() for entry in forwarded.split(",") if entry.strip()]
+    if networks is None:
+        # すべての接続元を信頼する場合は、直前のプロキシが追加した末尾のエントリを使う
+        return entries[-1] if entries else peer
+    for entry in reversed(entries):
+        if not _is_trusted(entry, networks):
+            return entry
+    return entries[0] if entries else peer
+
+
+class FailureRateLimiter:
+    """
+    キーごとの失敗回数の制限（スライディングウィンドウ）
+
+    window_seconds以内の失敗が max_failures 回に達したキーは、最も古い失敗が窓から外れるまで制限される。
+    """
+
+    def __init__(self, max_failures: int, window_seconds: float, max_keys: int = 10000):
+        self.max_failures = max_failures
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._failures: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def _recent(self, key: str, now: float) -> Deque[float]:
+        failures = self._failures.get(key)
+        if failures is None:
+            return deque()
+        while failures and now - failures[0] >= self.window_seconds:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+        return failures
+
+    def retry_after(self, key: str) -> int:
+        """制限が解除されるまでの秒数（制限されていない場合は0）"""
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(key, now)
+            if len(failures) < self.max_failures:
+                return 0
+            return max(1, int(self.window_seconds - (now - failures[0])) + 1)
+
+    def record_failure(self, key: str) -> None:
+        """失敗を記録"""
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._failures and len(self._failures) >= self.max_keys:
+                # 窓を過ぎたキーを捨てる（それでも多い場合は古いものから捨てる）
+                for stale in list(self._failures):
+                    self._recent(stale, now)
+                while len(self._failures) >= self.max_keys:
+                    del self._failures[next(iter(self._failures))]
+            self._failures.setdefault(key, deque()).append(now)
+
+    def clear(self) -> None:
+        """すべての失敗の記録を破棄"""
+        with self._lock:
+            self._failures.clear()
+
+
+# 存在しないクーポンコードの試行回数（キー: 店舗ID:クライアントのアドレス）
+coupon_lookup_limiter = FailureRateLimiter(
+    settings.COUPON_LOOKUP_MAX_MISSES,
+    settings.COUPON_LOOKUP_WINDOW_SECONDS
+)
+
+
+def check_coupon_lookup_limit(request: Request, shop_id: str) -> str:
+    """
+    クーポンコードの試行回数を確認し、制限中の場合は429を返す
+
+    Returns:
+        失敗を記録するときに使うキー
+    """
+    key = f"{shop_id}:{client_address(request)}"
+    retry_after = coupon_lookup_limiter.retry_after(key)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="クーポンコードの試行回数が多すぎます。しばらくしてから再度お試しください",
+            headers={"Retry-After": str(retry_after)}
+        )
+    return key
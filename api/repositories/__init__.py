@@ -0,0 +1,30 @@
+"""
+リポジトリパッケージ
+ルートから使うデータ取得処理をまとめる
+"""
+from fastapi import Depends
+
+from api.auth import get_current_shop
+from api.database import Client, get_db
+from api.repositories.analytics import AnalyticsRepository
+from api.repositories.entities import ShopRepositories
+
+
+def get_analytics_repository(db: Client = Depends(get_db)) -> AnalyticsRepository:
+    """重いクエリのリポジトリを取得する依存関数"""
+    return AnalyticsRepository(db)
+
+
+def get_repositories(
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db)
+) -> ShopRepositories:
+    """
+    ログイン中の店舗のリポジトリを取得する依存関数
+
+    FastAPIは同じリクエスト内で依存関数の結果を共有するため、取得結果はリクエストの間だけ保持される
+    """
+    return ShopRepositories(db, current_shop["id"])
+
+
+__all__ = ["AnalyticsRepository", "ShopRepositories", "get_analytics_repository", "get_repositories"]
@@ -0,0 +1,176 @@
+"""
+集計・空き枠などの重いクエリのリポジトリ
+DATABASE_URLが設定されている場合はasyncpgの接続プールで1回のSQLにまとめて実行し、
+設定されていない場合（または接続できない場合）はPostgREST経由で同じ結果を組み立てる
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from api.database import Client
+from api.models import OrderStatus, ReservationStatus
+from api.pg_pool import PostgresPool, postgres_pool
+from api.utils import as_utc
+
+
+# 空き枠を埋めている（有効な）予約の状態
+ACTIVE_RESERVATION_STATUSES = [ReservationStatus.PENDING.value, ReservationStatus.CONFIRMED.value]
+# 人気集計の対象とする予約・注文の状態
+POPULAR_RESERVATION_STATUSES = [ReservationStatus.COMPLETED.value, ReservationStatus.CONFIRMED.value]
+POPULAR_ORDER_STATUSES = [OrderStatus.PAID.value, OrderStatus.COMPLETED.value]
+
+# プリペアドステートメントとしてキャッシュされるよう、絞り込みの組み合わせごとに定数のSQLを用意する
+_BOOKED_TIMES_SQL = """
+SELECT reservation_datetime
+FROM reservations
+WHERE reservation_datetime >= $1 AND reservation_datetime < $2
+  AND status = ANY($3::varchar[])
+"""
+BOOKED_TIMES_SQL = {
+    (False, False): _BOOKED_TIMES_SQL,
+    (True, False): _BOOKED_TIMES_SQL + "  AND service_id = $4\n",
+    (False, True): _BOOKED_TIMES_SQL + "  AND stylist_id = $4\n",
+    (True, True): _BOOKED_TIMES_SQL + "  AND service_id = $4 AND stylist_id = $5\n",
+}
+
+POPULAR_SERVICES_SQL = """
+SELECT s.*
+FROM (
+    SELECT service_id, count(*) AS booking_count
+    FROM reservations
+    WHERE status = ANY($1::varchar[])
+    GROUP BY service_id
+) t
+JOIN services s ON s.id = t.service_id
+ORDER BY t.booking_count DESC, s.id
+LIMIT $2
+"""
+
+POPULAR_PRODUCTS_SQL = """
+SELECT p.*
+FROM (
+    SELECT item->>'product_id' AS product_id,
+           sum(coalesce((item->>'quantity')::numeric, 1)) AS quantity
+    FROM orders o
+    CROSS JOIN LATERAL jsonb_array_elements(o.items) AS item
+    WHERE o.status = ANY($1::varchar[])
+      AND jsonb_typeof(o.items) = 'array'
+      AND item->>'product_id' IS NOT NULL
+    GROUP BY 1
+) t
+JOIN products p ON p.id::text = t.product_id
+ORDER BY t.quantity DESC, p.id
+LIMIT $2
+"""
+
+CUSTOMER_SUMMARY_SQL = "SELECT summary FROM get_customer_summary($1, $2::uuid, $3) AS summary"
+
+
+def _rank_rows(rows: List[Dict], counts: Counter, limit: int) -> List[Dict]:
+    """件数の多い順（同数はID順）に並べて上位を返す"""
+    rows = [row for row in rows if row["id"] in counts]
+    rows.sort(key=lambda row: (-counts[row["id"]], row["id"]))
+    return rows[:limit]
+
+
+class AnalyticsRepository:
+    """重いクエリのリポジトリ（接続プールが使えない場合はPostgRESTにフォールバック）"""
+
+    def __init__(self, db: Client, pool: Optional[PostgresPool] = None):
+        self.db = db
+        self.pool = pool or postgres_pool
+
+    async def booked_reservation_times(
+        self,
+        start: datetime,
+        end: datetime,
+        service_id: Optional[str] = None,
+        stylist_id: Optional[str] = None
+    ) -> List[datetime]:
+        """
+        期間内の有効な予約の開始日時（UTC）を取得
+
+        時間枠ごとに問い合わせず、期間全体を1回で取得して呼び出し側で照合する。
+        """
+        start, end = as_utc(start), as_utc(end)
+        filters = [value for value in (service_id, stylist_id) if value]
+        rows = await self.pool.fetch(
+            "booked_reservation_times",
+            BOOKED_TIMES_SQL[(bool(service_id), bool(stylist_id))],
+            start, end, ACTIVE_RESERVATION_STATUSES, *filters
+        )
+        if rows is None:
+            query = self.db.table("reservations").select("reservation_datetime").gte(
+                "reservation_datetime", start.isoformat()
+            ).lt(
+                "reservation_datetime", end.isoformat()
+            ).in_("status", ACTIVE_RESERVATION_STATUSES)
+            if service_id:
+                query = query.eq("service_id", service_id)
+            if stylist_id:
+                query = query.eq("stylist_id", stylist_id)
+            rows = query.execute().data or []
+        return [as_utc(row["reservation_datetime"]) for row in rows]
+
+    async def popular_services(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """予約数（完了・確定）の多いサービスを取得"""
+        rows = await self.pool.fetch(
+            "popular_services", POPULAR_SERVICES_SQL, POPULAR_RESERVATION_STATUSES, limit
+        )
+        if rows is not None:
+            return rows
+
+        reservations = self.db.table("reservations").select("service_id").in_(
+            "status", POPULAR_RESERVATION_STATUSES
+        ).execute()
+        counts = Counter(r["service_id"] for r in reservations.data or [] if r.get("service_id"))
+        if not counts:
+            return []
+        # 件数の多い順に上位を取り、詳細は1回のクエリでまとめて取得する
+        candidate_ids = [service_id for service_id, _ in counts.most_common(limit * 2)]
+        services = self.db.table("services").select("*").in_("id", candidate_ids).execute()
+        return _rank_rows(services.data or [], counts, limit)
+
+    async def popular_products(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """販売数量（支払済・完了の注文）の多い商品を取得"""
+        rows = await self.pool.fetch(
+            "popular_products", POPULAR_PRODUCTS_SQL, POPULAR_ORDER_STATUSES, limit
+        )
+        if rows is not None:
+            return rows
+
+        orders = self.db.table("orders").select("items").in_(
+            "status", POPULAR_ORDER_STATUSES
+        ).execute()
+        counts: Counter = Counter()
+        for order in orders.data or []:
+            for item in order.get("items") or []:
+                if item.get("product_id"):
+                    counts[item["product_id"]] += item.get("quantity", 1)
+        if not counts:
+            return []
+        candidate_ids = [product_id for product_id, _ in counts.most_common(limit * 2)]
+        products = self.db.table("products").select("*").in_("id", candidate_ids).execute()
+        return _rank_rows(products.data or [], counts, limit)
+
+    async def customer_summary(
+        self,
+        shop_id: str,
+        customer_id: str,
+        limit: int = 5
+    ) -> Optional[Dict[str, Any]]:
+        """顧客サマリー（get_customer_summary関数の結果、顧客が存在しない場合はNone）"""
+        rows = await self.pool.fetch(
+            "customer_summary", CUSTOMER_SUMMARY_SQL, shop_id, customer_id, limit
+        )
+        if rows is None:
+            rows = self.db.rpc("get_customer_summary", {
+                "p_shop_id": shop_id,
+                "p_customer_id": customer_id,
+                "p_limit": limit
+            }).execute().data or []
+            return rows[0] if rows else None
+        return rows[0]["summary"] if rows else None
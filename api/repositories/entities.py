@@ -0,0 +1,117 @@
+"""
+店舗単位のエンティティリポジトリ
+顧客・サービス・スタイリスト・商品・予約をIDで取得する処理をまとめ、
+同じリクエスト内の取得を列の組み合わせごとに1回の in_() クエリにまとめる
+"""
+from typing import Dict, Hashable, Iterable, List, Optional
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from api.database import Client
+from api.repositories.loader import DataLoader
+
+
+# 用途ごとの取得列（"*" の代わりに必要な列だけを取得する、結果の照合に使うためidを必ず含める）
+CUSTOMER_CONTACT_COLUMNS = "id, name, email"
+CUSTOMER_DETAIL_COLUMNS = (
+    "id, email, phone, name, name_kana, birthday, gender, address, notes, "
+    "is_active, total_visits, last_visit, created_at, updated_at"
+)
+SERVICE_NAME_COLUMNS = "id, name"
+SERVICE_DETAIL_COLUMNS = (
+    "id, name, name_en, description, duration_minutes, price, category, image_url, "
+    "display_order, is_active, created_at, updated_at"
+)
+STYLIST_NAME_COLUMNS = "id, name"
+STYLIST_DETAIL_COLUMNS = (
+    "id, name, name_kana, email, phone, specialty, bio, profile_image_url, working_hours, "
+    "is_active, created_at, updated_at"
+)
+PRODUCT_STOCK_COLUMNS = "id, name, price, stock_quantity"
+RESERVATION_STATUS_COLUMNS = "id, customer_id, status, reservation_datetime"
+RESERVATION_DETAIL_COLUMNS = (
+    "id, customer_id, stylist_id, service_id, reservation_datetime, duration_minutes, "
+    "status, notes, reminder_sent, cancellation_reason, cancelled_at, created_at, updated_at"
+)
+
+
+class ShopScopedRepository:
+    """
+    店舗に属するテーブルのリポジトリ
+
+    取得は常に店舗IDで絞り込むため、他店舗の行は存在しないものとして扱われる（所有権チェックを兼ねる）。
+    """
+
+    table: str = ""
+
+    def __init__(self, db: Client, shop_id: str):
+        self.db = db
+        self.shop_id = shop_id
+        self._loaders: Dict[str, DataLoader] = {}
+
+    def _loader(self, columns: str) -> DataLoader:
+        loader = self._loaders.get(columns)
+        if loader is None:
+            loader = self._loaders[columns] = DataLoader(
+                lambda ids: self._fetch_by_ids(ids, columns)
+            )
+        return loader
+
+    def _fetch_by_ids(self, ids: List[Hashable], columns: str) -> Dict[Hashable, dict]:
+        result = self.db.table(self.table).select(columns).in_(
+            "id", list(ids)
+        ).eq("shop_id", self.shop_id).execute()
+        return {row["id"]: row for row in result.data or []}
+
+    async def get(self, id: str, columns: str = "*") -> Optional[dict]:
+        """IDで1件取得（存在しない・他店舗の場合はNone）"""
+        return await self._loader(columns).load(id)
+
+    async def exists(self, id: str) -> bool:
+        """IDの行が店舗に存在するか（id列だけを取得し、同じリクエスト内の確認はまとめて行う）"""
+        return await self._loader("id").load(id) is not None
+
+    async def get_many(self, ids: Iterable[str], columns: str = "*") -> Dict[str, dict]:
+        """複数のIDをまとめて取得（存在するものだけをID→行の辞書で返す）"""
+        ids = list(dict.fromkeys(ids))
+        rows = await self._loader(columns).load_many(ids)
+        return {id: row for id, row in zip(ids, rows) if row is not None}
+
+    def forget(self, id: str) -> None:
+        """更新した行の取得結果を破棄"""
+        for loader in self._loaders.values():
+            loader.clear(id)
+
+
+class CustomerRepository(ShopScopedRepository):
+    table = "customers"
+
+
+class ServiceRepository(ShopScopedRepository):
+    table = "services"
+
+
+class StylistRepository(ShopScopedRepository):
+    table = "stylists"
+
+
+class ProductRepository(ShopScopedRepository):
+    table = "products"
+
+
+class ReservationRepository(ShopScopedRepository):
+    table = "reservations"
+
+
+class ShopRepositories:
+    """1リクエスト分のリポジトリ（取得結果はリクエストの間だけ保持する）"""
+
+    def __init__(self, db: Client, shop_id: str):
+        self.db = db
+        self.shop_id = shop_id
+        self.customers = CustomerRepository(db, shop_id)
+        self.services = ServiceRepository(db, shop_id)
+        self.stylists = StylistRepository(db, shop_id)
+        self.products = ProductRepository(db, shop_id)
+        self.reservations = ReservationRepository(db, shop_id)
@@ -0,0 +1,67 @@
+"""
+リクエスト単位のバッチ取得ローダー（DataLoader方式）
+同じイベントループの周回で要求されたキーを1回の取得関数の呼び出しにまとめ、結果をリクエスト中は保持する
+"""
+import asyncio
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class DataLoader:
+    """
+    キーごとの取得をまとめるローダー
+
+    - load()を同時に（asyncio.gatherなどで）呼び出すと、キーをまとめて1回だけbatch_loadを呼ぶ
+    - 取得済みのキー（存在しなかったキーを含む）は再取得しない
+    - batch_loadはキーのリストを受け取り、キー→値の辞書を返す（含まれないキーはNone）
+
+    インスタンスは1リクエストの中だけで使う（別のリクエストと共有すると更新が反映されない）。
+    """
+
+    def __init__(self, batch_load: Callable[[List[Hashable]], Dict[Hashable, Any]]):
+        self._batch_load = batch_load
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._pending: List[Tuple[Hashable, asyncio.Future]] = []
+
+    def load(self, key: Hashable) -> "asyncio.Future[Optional[Any]]":
+        """キーの値を取得（存在しない場合はNone）"""
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._cache[key] = loop.create_future()
+            if not self._pending:
+                # 他のタスクが同じ周回で要求するキーを待ってから取得する
+                loop.call_soon(self._dispatch)
+            self._pending.append((key, future))
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Optional[Any]]:
+        """複数のキーの値を1回の取得でまとめて取得（重複したキーは1回だけ取得）"""
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+
+    def prime(self, key: Hashable, value: Any) -> None:
+        """取得済みの値を登録（既に登録されている場合は置き換える）"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._cache[key] = future
+
+    def clear(self, key: Hashable) -> None:
+        """キーの値を破棄（更新後に再取得させる）"""
+        self._cache.pop(key, None)
+
+    def _dispatch(self) -> None:
+        pending, self._pending = self._pending, []
+        keys = [key for key, _ in pending]
+        futures = [future for _, future in pending]
+        try:
+            values = self._batch_load(keys)
+        except Exception as e:
+            for key, future in zip(keys, futures):
+                # 失敗したキーは次回のload()で再取得する
+                if self._cache.get(key) is future:
+                    del self._cache[key]
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in zip(keys, futures):
+            if not future.done():
+                future.set_result(values.get(key))
@@ -4,13 +4,12 @@
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr
-from supabase import Client
 from datetime import timedelta
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db
 from api.auth import authenticate_shop, create_access_token, get_current_shop, get_password_hash
 from api.logger import logger
 from config import settings
@@ -92,7 +91,9 @@ async def get_current_shop_info(
 ):
     """現在のログイン中の店舗情報を取得"""
     try:
-        result = db.table("shops").select("*").eq("id", current_shop["id"]).execute()
+        result = db.table("shops").select(
+            "id, email, name, admin_email, admin_name, is_active"
+        ).eq("id", current_shop["id"]).execute()
         
         if not result.data:
             raise HTTPException(
@@ -2,28 +2,41 @@
 キャンペーン管理APIルート
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import Optional
-from datetime import datetime
-from supabase import Client
+from typing import List, Optional
+from datetime import date, datetime
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.auth import get_current_shop
 from api.schemas import (
     CampaignCreate,
     CampaignUpdate,
     CampaignResponse,
+    CampaignStatisticsResponse,
+    CampaignNotificationJobResponse,
     PaginationParams,
     PaginatedResponse,
     MessageResponse
 )
-from api.models import CampaignStatus
+from api.models import CampaignStatus, PromotionKind
+from api.promotions import promotion_cache
+from api.promotion_stats import load_promotion_daily_stats, summarize_promotion_stats
 
 router = APIRouter()
 
 
+def get_campaign_scheduler():
+    """
+    キャンペーンのスケジューラーを取得
+
+    スケジューラーはキャンペーンの変更時にしか使わないため、コールドスタートを短くするよう初回利用時に読み込む
+    """
+    from marketing.campaign_scheduler import campaign_scheduler
+    return campaign_scheduler
+
+
 @router.post("/", response_model=CampaignResponse)
 async def create_campaign(
     campaign: CampaignCreate,
@@ -39,6 +52,9 @@ async def create_campaign(
     if not result.data:
         raise HTTPException(status_code=500, detail="キャンペーンの作成に失敗しました")
     
+    promotion_cache.invalidate(current_shop["id"])
+    get_campaign_scheduler().track(result.data[0])
+    
     return CampaignResponse(**result.data[0])
 
 
@@ -83,6 +99,11 @@ async def list_active_campaigns(
     db: Client = Depends(get_db)
 ):
     """アクティブなキャンペーン一覧を取得"""
+    # スケジューラーが保持している実施中の一覧を返す（読み込み前・無効の場合はデータベースから取得）
+    campaigns = get_campaign_scheduler().active_campaigns(current_shop["id"])
+    if campaigns is not None:
+        return {"campaigns": campaigns}
+    
     now = datetime.now().isoformat()
     
     # statusカラムが存在しない場合はis_activeのみでフィルタ
@@ -114,6 +135,62 @@ async def get_campaign(
     return CampaignResponse(**result.data[0])
 
 
+@router.get("/{campaign_id}/statistics", response_model=CampaignStatisticsResponse)
+async def get_campaign_statistics(
+    campaign_id: str,
+    start_date: Optional[date] = Query(None, description="集計の開始日"),
+    end_date: Optional[date] = Query(None, description="集計の終了日"),
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db)
+):
+    """
+    キャンペーンの統計（期間内の合計と日ごとの推移）を取得
+    
+    注文の支払い・キャンセル・返金時に更新される日次集計を読むため、注文は走査しない。
+    """
+    campaign = db.table("campaigns").select("id, name, status, start_date, end_date").eq(
+        "id", campaign_id
+    ).eq("shop_id", current_shop["id"]).execute()
+    
+    if not campaign.data:
+        raise HTTPException(status_code=404, detail="キャンペーンが見つかりません")
+    
+    daily = load_promotion_daily_stats(
+        db, current_shop["id"], PromotionKind.CAMPAIGN.value, campaign_id, start_date, end_date
+    )
+    totals = summarize_promotion_stats(daily)
+    
+    return CampaignStatisticsResponse(
+        campaign_id=campaign_id,
+        name=campaign.data[0]["name"],
+        status=campaign.data[0]["status"],
+        start_date=campaign.data[0]["start_date"],
+        end_date=campaign.data[0]["end_date"],
+        total_orders=totals["orders"],
+        total_revenue=totals["revenue"],
+        total_discount=totals["discount_amount"],
+        cancelled_orders=totals["cancelled_orders"],
+        refunded_orders=totals["refunded_orders"],
+        refunded_amount=totals["refunded_amount"],
+        net_revenue=totals["net_revenue"],
+        daily=daily
+    )
+
+
+@router.get("/{campaign_id}/notifications", response_model=List[CampaignNotificationJobResponse])
+async def list_campaign_notifications(
+    campaign_id: str,
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db)
+):
+    """キャンペーン通知の送信ジョブ（送信数・失敗数などの進捗）を新しい順に取得"""
+    result = db.table("campaign_notification_jobs").select(
+        "id, campaign_id, status, sent_count, failed_count, skipped_count, last_error, started_at, finished_at, updated_at"
+    ).eq("campaign_id", campaign_id).eq("shop_id", current_shop["id"]).order("created_at", desc=True).limit(20).execute()
+    
+    return [CampaignNotificationJobResponse(**job) for job in result.data or []]
+
+
 @router.patch("/{campaign_id}", response_model=CampaignResponse)
 async def update_campaign(
     campaign_id: str,
@@ -123,8 +200,7 @@ async def update_campaign(
 ):
     """キャンペーン情報を更新"""
     # キャンペーンの存在確認と所有権チェック
-    existing = db.table("campaigns").select("*").eq("id", campaign_id).eq("shop_id", current_shop["id"]).execute()
-    if not existing.data:
+    if not row_exists(db, "campaigns", id=campaign_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="キャンペーンが見つかりません")
     
     update_data = campaign_update.dict(exclude_unset=True)
@@ -135,6 +211,9 @@ async def update_campaign(
     if not result.data:
         raise HTTPException(status_code=500, detail="キャンペーン情報の更新に失敗しました")
     
+    promotion_cache.invalidate(current_shop["id"])
+    get_campaign_scheduler().track(result.data[0])
+    
     return CampaignResponse(**result.data[0])
 
 
@@ -154,6 +233,9 @@ async def activate_campaign(
     if not result.data:
         raise HTTPException(status_code=404, detail="キャンペーンが見つかりません")
     
+    promotion_cache.invalidate(current_shop["id"])
+    get_campaign_scheduler().track(result.data[0])
+    
     return CampaignResponse(**result.data[0])
 
 
@@ -172,6 +254,9 @@ async def pause_campaign(
     if not result.data:
         raise HTTPException(status_code=404, detail="キャンペーンが見つかりません")
     
+    promotion_cache.invalidate(current_shop["id"])
+    get_campaign_scheduler().track(result.data[0])
+    
     return CampaignResponse(**result.data[0])
 
 
@@ -191,6 +276,9 @@ async def end_campaign(
     if not result.data:
         raise HTTPException(status_code=404, detail="キャンペーンが見つかりません")
     
+    promotion_cache.invalidate(current_shop["id"])
+    get_campaign_scheduler().track(result.data[0])
+    
     return CampaignResponse(**result.data[0])
 
 
@@ -209,6 +297,9 @@ async def delete_campaign(
     if not result.data:
         raise HTTPException(status_code=404, detail="キャンペーンが見つかりません")
     
+    promotion_cache.invalidate(current_shop["id"])
+    get_campaign_scheduler().track(result.data[0])
+    
     return MessageResponse(message="キャンペーンを削除しました")
 
 
@@ -1,15 +1,14 @@
 """
 クーポン管理APIルート
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import Optional
 from datetime import datetime
-from supabase import Client
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.auth import get_current_shop
 from api.schemas import (
     CouponCreate,
@@ -22,6 +21,9 @@ from api.schemas import (
     MessageResponse
 )
 from api.models import CouponType
+from api.coupon_tokens import coupon_tokens
+from api.promotions import Basket, find_coupon_id, get_coupon_rule, invalidate_coupons
+from api.rate_limit import check_coupon_lookup_limit, coupon_lookup_limiter
 
 router = APIRouter()
 
@@ -33,9 +35,11 @@ async def create_coupon(
     db: Client = Depends(get_db)
 ):
     """クーポンを作成"""
-    # コードの重複チェック（同じ店舗内で）
-    existing = db.table("coupons").select("*").eq("code", coupon.code).eq("shop_id", current_shop["id"]).execute()
-    if existing.data:
+    # コードの重複チェック（同じ店舗内で、大文字・小文字や全角・半角の違いも重複とみなす）
+    if (
+        find_coupon_id(db, current_shop["id"], coupon.code) is not None
+        or row_exists(db, "coupons", code=coupon.code, shop_id=current_shop["id"])
+    ):
         raise HTTPException(status_code=400, detail="このクーポンコードは既に使用されています")
     
     coupon_data = coupon.dict()
@@ -46,6 +50,8 @@ async def create_coupon(
     if not result.data:
         raise HTTPException(status_code=500, detail="クーポンの作成に失敗しました")
     
+    invalidate_coupons(current_shop["id"])
+    
     return CouponResponse(**result.data[0])
 
 
@@ -108,8 +114,7 @@ async def update_coupon(
 ):
     """クーポン情報を更新"""
     # クーポンの存在確認と所有権チェック
-    existing = db.table("coupons").select("*").eq("id", coupon_id).eq("shop_id", current_shop["id"]).execute()
-    if not existing.data:
+    if not row_exists(db, "coupons", id=coupon_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="クーポンが見つかりません")
     
     update_data = coupon_update.dict(exclude_unset=True)
@@ -120,6 +125,10 @@ async def update_coupon(
     if not result.data:
         raise HTTPException(status_code=500, detail="クーポン情報の更新に失敗しました")
     
+    # 使用回数の上限が変わった場合に残り回数を取り直させる
+    coupon_tokens.invalidate(current_shop["id"])
+    invalidate_coupons(current_shop["id"])
+    
     return CouponResponse(**result.data[0])
 
 
@@ -138,106 +147,64 @@ async def delete_coupon(
     if not result.data:
         raise HTTPException(status_code=404, detail="クーポンが見つかりません")
     
+    invalidate_coupons(current_shop["id"])
+    
     return MessageResponse(message="クーポンを削除しました")
 
 
 @router.post("/validate", response_model=CouponValidateResponse)
 async def validate_coupon(
     validation_request: CouponValidateRequest,
+    request: Request,
     current_shop: dict = Depends(get_current_shop),
     db: Client = Depends(get_db)
 ):
     """クーポンの有効性を検証"""
-    # クーポンの取得（同じ店舗内で）
-    result = db.table("coupons").select("*").eq("code", validation_request.code).eq("shop_id", current_shop["id"]).execute()
+    limit_key = check_coupon_lookup_limit(request, current_shop["id"])
+    rule = get_coupon_rule(db, current_shop["id"], validation_request.code)
     
-    if not result.data:
+    if rule is None:
+        coupon_lookup_limiter.record_failure(limit_key)
         return CouponValidateResponse(
             valid=False,
             message="クーポンが見つかりません"
         )
     
-    coupon = result.data[0]
-    
-    # アクティブチェック
-    if not coupon.get("is_active", False):
-        return CouponValidateResponse(
-            valid=False,
-            message="このクーポンは無効です"
-        )
-    
-    # 有効期限チェック
-    now = datetime.now()
-    valid_from = datetime.fromisoformat(coupon["valid_from"])
-    valid_until = datetime.fromisoformat(coupon["valid_until"])
+    result = rule.evaluate(Basket(
+        validation_request.total_amount,
+        service_ids=validation_request.service_ids
+    ))
     
-    if now < valid_from:
+    if not result.eligible:
         return CouponValidateResponse(
             valid=False,
-            message="このクーポンはまだ有効ではありません"
+            message=result.message
         )
     
-    if now > valid_until:
-        return CouponValidateResponse(
-            valid=False,
-            message="このクーポンの有効期限が切れています"
-        )
-    
-    # 使用回数制限チェック
-    if coupon.get("usage_limit") is not None:
-        if coupon.get("usage_count", 0) >= coupon["usage_limit"]:
-            return CouponValidateResponse(
-                valid=False,
-                message="このクーポンの使用回数制限に達しています"
-            )
-    
-    # 最低購入金額チェック
-    if coupon.get("min_purchase_amount") is not None:
-        if validation_request.total_amount < coupon["min_purchase_amount"]:
-            return CouponValidateResponse(
-                valid=False,
-                message=f"最低購入金額 {coupon['min_purchase_amount']}円以上でご利用いただけます"
-            )
-    
-    # 適用可能サービスチェック
-    if coupon.get("applicable_services") and validation_request.service_ids:
-        applicable = set(coupon["applicable_services"])
-        requested = set(validation_request.service_ids)
-        if not requested.intersection(applicable):
-            return CouponValidateResponse(
-                valid=False,
-                message="このクーポンは選択されたサービスには適用できません"
-            )
-    
-    # 割引金額の計算
-    discount_amount = 0
-    if coupon["coupon_type"] == CouponType.PERCENTAGE.value:
-        discount_amount = int(validation_request.total_amount * coupon["discount_value"] / 100)
-        if coupon.get("max_discount_amount"):
-            discount_amount = min(discount_amount, coupon["max_discount_amount"])
-    elif coupon["coupon_type"] == CouponType.FIXED_AMOUNT.value:
-        discount_amount = coupon["discount_value"]
-    
     return CouponValidateResponse(
         valid=True,
-        coupon=CouponResponse(**coupon),
-        discount_amount=discount_amount,
-        message="クーポンが適用されました"
+        coupon=CouponResponse(**{**rule.row, "usage_count": rule.usage_count}),
+        discount_amount=result.discount_amount,
+        message=result.message
     )
 
 
 @router.get("/code/{code}", response_model=CouponResponse)
 async def get_coupon_by_code(
     code: str,
+    request: Request,
+    current_shop: dict = Depends(get_current_shop),
     db: Client = Depends(get_db)
 ):
     """クーポンコードでクーポンを取得"""
-    result = db.table("coupons").select("*").eq("code", code).execute()
+    limit_key = check_coupon_lookup_limit(request, current_shop["id"])
+    rule = get_coupon_rule(db, current_shop["id"], code)
     
-    if not result.data:
+    if rule is None:
+        coupon_lookup_limiter.record_failure(limit_key)
         raise HTTPException(status_code=404, detail="クーポンが見つかりません")
     
-    return CouponResponse(**result.data[0])
+    return CouponResponse(**{**rule.row, "usage_count": rule.usage_count})
 
 
 
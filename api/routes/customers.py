@@ -4,17 +4,19 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from datetime import datetime
-from supabase import Client
+from enum import Enum
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.auth import get_current_shop
+from api.repositories import AnalyticsRepository, get_analytics_repository
 from api.schemas import (
     CustomerCreate,
     CustomerUpdate,
     CustomerResponse,
+    CustomerSummaryResponse,
     PaginationParams,
     PaginatedResponse,
     MessageResponse
@@ -22,6 +24,15 @@ from api.schemas import (
 
 router = APIRouter()
 
+# 前方入力補完モードで返す最大件数
+TYPEAHEAD_LIMIT = 10
+
+
+class CustomerSearchMode(str, Enum):
+    """顧客検索モード"""
+    FULL = "full"
+    TYPEAHEAD = "typeahead"
+
 
 @router.post("/", response_model=CustomerResponse)
 async def create_customer(
@@ -31,8 +42,7 @@ async def create_customer(
 ):
     """顧客を作成"""
     # メールアドレスの重複チェック（同じ店舗内で）
-    existing = db.table("customers").select("*").eq("email", customer.email).eq("shop_id", current_shop["id"]).execute()
-    if existing.data:
+    if row_exists(db, "customers", email=customer.email, shop_id=current_shop["id"]):
         raise HTTPException(status_code=400, detail="このメールアドレスは既に登録されています")
     
     customer_data = customer.dict()
@@ -83,6 +93,34 @@ async def list_customers(
     )
 
 
+@router.get("/search")
+async def search_customers(
+    q: str = Query(..., min_length=1, max_length=100, description="名前・フリガナ・メール・電話番号の一部"),
+    mode: CustomerSearchMode = CustomerSearchMode.FULL,
+    limit: int = Query(20, ge=1, le=100),
+    include_inactive: bool = False,
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db)
+):
+    """
+    顧客を検索（トライグラムインデックスによる部分一致・あいまい検索）
+
+    database/migrations/add_customer_search_index.sql の search_customers 関数を使用し、
+    前方一致・類似度の高い順に返す。typeaheadモードでは上位10件のみ返す。
+    """
+    if mode == CustomerSearchMode.TYPEAHEAD:
+        limit = TYPEAHEAD_LIMIT
+    
+    result = db.rpc("search_customers", {
+        "p_shop_id": current_shop["id"],
+        "p_query": q,
+        "p_limit": limit,
+        "p_include_inactive": include_inactive
+    }).execute()
+    
+    return {"customers": result.data or []}
+
+
 @router.get("/{customer_id}", response_model=CustomerResponse)
 async def get_customer(
     customer_id: str,
@@ -118,8 +156,7 @@ async def update_customer(
 ):
     """顧客情報を更新"""
     # 顧客の存在確認と所有権チェック
-    existing = db.table("customers").select("*").eq("id", customer_id).eq("shop_id", current_shop["id"]).execute()
-    if not existing.data:
+    if not row_exists(db, "customers", id=customer_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="顧客が見つかりません")
     
     update_data = customer_update.dict(exclude_unset=True)
@@ -151,6 +188,45 @@ async def delete_customer(
     return MessageResponse(message="顧客を削除しました")
 
 
+@router.get("/{customer_id}/summary", response_model=CustomerSummaryResponse)
+async def get_customer_summary(
+    customer_id: str,
+    limit: int = Query(5, ge=1, le=20, description="直近の予約・注文の取得件数"),
+    current_shop: dict = Depends(get_current_shop),
+    repository: AnalyticsRepository = Depends(get_analytics_repository)
+):
+    """
+    顧客サマリーを取得（顧客カード用）
+    
+    プロフィール・直近の予約/注文・累計購入額・来店統計を
+    get_customer_summary関数で1回のデータベース呼び出しにまとめて取得する
+    （DATABASE_URLが設定されている場合はPostgRESTを経由せず直接呼び出す）。
+    """
+    summary = await repository.customer_summary(current_shop["id"], customer_id, limit)
+    
+    if not summary:
+        raise HTTPException(status_code=404, detail="顧客が見つかりません")
+    
+    customer = summary["customer"]
+    order_stats = summary.get("order_stats") or {}
+    reservation_stats = summary.get("reservation_stats") or {}
+    
+    return CustomerSummaryResponse(
+        customer=CustomerResponse(**customer),
+        recent_reservations=summary.get("recent_reservations") or [],
+        recent_orders=summary.get("recent_orders") or [],
+        total_visits=customer.get("total_visits") or 0,
+        last_visit=customer.get("last_visit"),
+        order_count=order_stats.get("order_count", 0),
+        lifetime_spend=order_stats.get("lifetime_spend", 0),
+        last_order_at=order_stats.get("last_order_at"),
+        total_reservations=reservation_stats.get("total_reservations", 0),
+        upcoming_reservations=reservation_stats.get("upcoming_reservations", 0),
+        cancelled_reservations=reservation_stats.get("cancelled_reservations", 0),
+        no_show_reservations=reservation_stats.get("no_show_reservations", 0)
+    )
+
+
 @router.get("/{customer_id}/reservations")
 async def get_customer_reservations(
     customer_id: str,
@@ -161,8 +237,7 @@ async def get_customer_reservations(
 ):
     """顧客の予約履歴を取得"""
     # 顧客の存在確認と所有権チェック
-    customer = db.table("customers").select("*").eq("id", customer_id).eq("shop_id", current_shop["id"]).execute()
-    if not customer.data:
+    if not row_exists(db, "customers", id=customer_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="顧客が見つかりません")
     
     # 予約の取得
@@ -195,8 +270,7 @@ async def get_customer_orders(
 ):
     """顧客の注文履歴を取得"""
     # 顧客の存在確認と所有権チェック
-    customer = db.table("customers").select("*").eq("id", customer_id).eq("shop_id", current_shop["id"]).execute()
-    if not customer.data:
+    if not row_exists(db, "customers", id=customer_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="顧客が見つかりません")
     
     # 注文の取得
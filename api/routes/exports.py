@@ -0,0 +1,192 @@
+"""
+データエクスポートAPIルート
+予約・注文・顧客データをCSV/NDJSONでストリーミング出力する
+"""
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import Iterator, List, Optional
+from datetime import datetime
+from enum import Enum
+import csv
+import io
+import json
+import zlib
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from api.database import Client, get_db, iter_keyset_pages
+from api.auth import get_current_shop
+from api.models import ReservationStatus, OrderStatus
+from config import settings
+
+router = APIRouter()
+
+
+class ExportFormat(str, Enum):
+    """エクスポート形式"""
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+# エクスポート対象の列（キーセットページネーションのためidと並び順の列を必ず含める）
+RESERVATION_EXPORT_COLUMNS = [
+    "id", "customer_id", "stylist_id", "service_id", "reservation_datetime",
+    "duration_minutes", "status", "notes", "cancellation_reason", "cancelled_at",
+    "created_at", "updated_at"
+]
+
+ORDER_EXPORT_COLUMNS = [
+    "id", "customer_id", "reservation_id", "total_amount", "discount_amount",
+    "final_amount", "status", "payment_method", "payment_id", "notes", "items",
+    "created_at", "updated_at"
+]
+
+CUSTOMER_EXPORT_COLUMNS = [
+    "id", "email", "phone", "name", "name_kana", "birthday", "gender", "address",
+    "notes", "is_active", "total_visits", "last_visit", "created_at", "updated_at"
+]
+
+
+def _serialize_csv_value(value):
+    """CSVセルの値に変換（JSONB列はJSON文字列にする）"""
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _encode_csv(pages: Iterator[List[dict]], columns: List[str]) -> Iterator[bytes]:
+    """チャンクごとにCSVへエンコード"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # Excelで文字化けしないようにBOMを付与
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+
+    for rows in pages:
+        buffer.seek(0)
+        buffer.truncate(0)
+        for row in rows:
+            writer.writerow([_serialize_csv_value(row.get(column)) for column in columns])
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(pages: Iterator[List[dict]], columns: List[str]) -> Iterator[bytes]:
+    """チャンクごとにNDJSONへエンコード"""
+    for rows in pages:
+        lines = [
+            json.dumps({column: row.get(column) for column in columns}, ensure_ascii=False, default=str)
+            for row in rows
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """ストリームをその場でgzip圧縮"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def build_export_response(
+    pages: Iterator[List[dict]],
+    columns: List[str],
+    resource: str,
+    export_format: ExportFormat,
+    compress: bool
+) -> StreamingResponse:
+    """エクスポート用のStreamingResponseを生成"""
+    if export_format == ExportFormat.CSV:
+        body = _encode_csv(pages, columns)
+        media_type = "text/csv; charset=utf-8"
+    else:
+        body = _encode_ndjson(pages, columns)
+        media_type = "application/x-ndjson"
+
+    filename = f"{resource}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format.value}"
+    if compress:
+        body = _gzip_stream(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/reservations")
+async def export_reservations(
+    export_format: ExportFormat = Query(ExportFormat.CSV, alias="format"),
+    compress: bool = Query(False, description="gzip圧縮して出力"),
+    status: Optional[ReservationStatus] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db)
+):
+    """予約データをエクスポート"""
+    def build_query():
+        query = db.table("reservations").select(",".join(RESERVATION_EXPORT_COLUMNS)).eq("shop_id", current_shop["id"])
+        if status:
+            query = query.eq("status", status.value)
+        if start_date:
+            query = query.gte("reservation_datetime", start_date.isoformat())
+        if end_date:
+            query = query.lte("reservation_datetime", end_date.isoformat())
+        return query
+
+    pages = iter_keyset_pages(build_query, "reservation_datetime", settings.EXPORT_CHUNK_SIZE)
+    return build_export_response(pages, RESERVATION_EXPORT_COLUMNS, "reservations", export_format, compress)
+
+
+@router.get("/orders")
+async def export_orders(
+    export_format: ExportFormat = Query(ExportFormat.CSV, alias="format"),
+    compress: bool = Query(False, description="gzip圧縮して出力"),
+    status: Optional[OrderStatus] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db)
+):
+    """注文データをエクスポート"""
+    def build_query():
+        query = db.table("orders").select(",".join(ORDER_EXPORT_COLUMNS)).eq("shop_id", current_shop["id"])
+        if status:
+            query = query.eq("status", status.value)
+        if start_date:
+            query = query.gte("created_at", start_date.isoformat())
+        if end_date:
+            query = query.lte("created_at", end_date.isoformat())
+        return query
+
+    pages = iter_keyset_pages(build_query, "created_at", settings.EXPORT_CHUNK_SIZE)
+    return build_export_response(pages, ORDER_EXPORT_COLUMNS, "orders", export_format, compress)
+
+
+@router.get("/customers")
+async def export_customers(
+    export_format: ExportFormat = Query(ExportFormat.CSV, alias="format"),
+    compress: bool = Query(False, description="gzip圧縮して出力"),
+    is_active: Optional[bool] = None,
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db)
+):
+    """顧客データをエクスポート"""
+    def build_query():
+        query = db.table("customers").select(",".join(CUSTOMER_EXPORT_COLUMNS)).eq("shop_id", current_shop["id"])
+        if is_active is not None:
+            query = query.eq("is_active", is_active)
+        return query
+
+    pages = iter_keyset_pages(build_query, "created_at", settings.EXPORT_CHUNK_SIZE)
+    return build_export_response(pages, CUSTOMER_EXPORT_COLUMNS, "customers", export_format, compress)
@@ -4,14 +4,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Header
 from typing import Optional, List
 from pydantic import BaseModel, EmailStr
-from supabase import Client
 from datetime import datetime, timedelta, timezone
 import secrets
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.email_service import get_email_service
 from api.logger import logger
 from api.auth import verify_admin_api_key
@@ -220,9 +219,7 @@ async def accept_invitation(
             raise HTTPException(status_code=400, detail="この招待の有効期限が切れています")
         
         # 既存のアカウントをチェック（ログイン用メールアドレスでチェック）
-        existing_shop = db.table("shops").select("*").eq("email", accept_data.login_email).execute()
-        if existing_shop.data and len(existing_shop.data) > 0:
-            shop = existing_shop.data[0]
+        if row_exists(db, "shops", email=accept_data.login_email):
             raise HTTPException(
                 status_code=400,
                 detail=f"このログイン用メールアドレス（{accept_data.login_email}）は既に店舗アカウントが登録されています。既存のアカウントでログインしてください。"
@@ -1,16 +1,21 @@
 """
 注文管理APIルート
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import Optional
 from datetime import datetime
-from supabase import Client
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.auth import get_current_shop
+from api.repositories import ShopRepositories, get_repositories
+from api.repositories.entities import (
+    CUSTOMER_CONTACT_COLUMNS,
+    CUSTOMER_DETAIL_COLUMNS,
+    RESERVATION_DETAIL_COLUMNS
+)
 from api.schemas import (
     OrderCreate,
     OrderUpdate,
@@ -18,175 +23,199 @@ from api.schemas import (
     OrderWithDetails,
     PaginationParams,
     PaginatedResponse,
-    MessageResponse,
-    CouponValidateRequest
+    MessageResponse
 )
 from api.models import OrderStatus
-from api.routes import coupons
+from api.coupon_tokens import coupon_tokens
+from api.promotions import Basket, get_campaign_rule, get_coupon_rule
+from api.rate_limit import check_coupon_lookup_limit, coupon_lookup_limiter
 from api.email_service import get_email_service
 from api.logger import logger
+from config import settings
 
 router = APIRouter()
 
 
-def calculate_order_totals(items: list, discount_amount: int = 0) -> dict:
-    """注文の合計金額を計算"""
-    total_amount = sum(item["quantity"] * item["unit_price"] for item in items)
-    final_amount = max(0, total_amount - discount_amount)
-    
-    return {
-        "total_amount": total_amount,
-        "discount_amount": discount_amount,
-        "final_amount": final_amount
-    }
+def load_coupon_usage(db: Client, shop_id: str, coupon_id: str) -> Optional[dict]:
+    """クーポンの使用回数と上限を取得（使用枠キャッシュ用）"""
+    result = db.table("coupons").select("id, usage_limit, usage_count").eq(
+        "id", coupon_id
+    ).eq("shop_id", shop_id).limit(1).execute()
+    return result.data[0] if result.data else None
+
+
+# place_order関数のエラー種別（例外のHINT）とHTTPステータス
+PLACE_ORDER_ERROR_STATUS = {
+    "customer_not_found": 404,
+    "reservation_not_found": 404,
+    "product_not_found": 404,
+    "service_not_found": 404,
+    "insufficient_stock": 400,
+    "coupon_not_found": 400,
+    "coupon_inactive": 400,
+    "coupon_expired": 400,
+    "coupon_usage_limit": 400,
+    "coupon_min_purchase": 400,
+    "campaign_not_found": 400,
+    "campaign_inactive": 400,
+}
+
+# set_order_status関数のエラー種別（例外のHINT）とHTTPステータス
+SET_ORDER_STATUS_ERROR_STATUS = {
+    "order_not_found": 404,
+    "order_status_final": 400,
+    "order_not_paid": 400,
+}
+
+
+def set_order_status(
+    db: Client,
+    shop_id: str,
+    order_id: str,
+    status: OrderStatus,
+    payment_method: Optional[str] = None,
+    payment_id: Optional[str] = None
+) -> dict:
+    """
+    注文のステータスを変更
+    
+    set_order_status関数で、ステータスの変更とクーポン・キャンペーンの日次集計の更新を1トランザクションで行う。
+    """
+    from postgrest.exceptions import APIError
+    
+    try:
+        result = db.rpc("set_order_status", {
+            "p_shop_id": shop_id,
+            "p_order_id": order_id,
+            "p_status": status.value,
+            "p_payment_method": payment_method,
+            "p_payment_id": payment_id,
+            "p_timezone": settings.PROMOTION_STATS_TIMEZONE
+        }).execute()
+    except APIError as e:
+        status_code = SET_ORDER_STATUS_ERROR_STATUS.get(e.hint)
+        if status_code is None:
+            raise
+        raise HTTPException(status_code=status_code, detail=e.message)
+    
+    if not result.data:
+        raise HTTPException(status_code=404, detail="注文が見つかりません")
+    return result.data[0]
 
 
 @router.post("/", response_model=OrderResponse)
 async def create_order(
     order: OrderCreate,
+    request: Request,
     current_shop: dict = Depends(get_current_shop),
-    db: Client = Depends(get_db)
+    db: Client = Depends(get_db),
+    repos: ShopRepositories = Depends(get_repositories)
 ):
-    """注文を作成"""
-    # 顧客の存在確認と所有権チェック
-    customer = db.table("customers").select("*").eq("id", order.customer_id).eq("shop_id", current_shop["id"]).execute()
-    if not customer.data:
-        raise HTTPException(status_code=404, detail="顧客が見つかりません")
-    
-    # 予約の存在確認と所有権チェック（指定されている場合）
-    if order.reservation_id:
-        reservation = db.table("reservations").select("*").eq("id", order.reservation_id).eq("shop_id", current_shop["id"]).execute()
-        if not reservation.data:
-            raise HTTPException(status_code=404, detail="予約が見つかりません")
-    
-    # アイテムの検証と所有権チェック
-    for item in order.items:
-        if item.product_id:
-            product = db.table("products").select("*").eq("id", item.product_id).eq("shop_id", current_shop["id"]).execute()
-            if not product.data:
-                raise HTTPException(status_code=404, detail=f"商品 {item.product_id} が見つかりません")
-            # 在庫チェック
-            if product.data[0].get("stock_quantity") is not None:
-                if product.data[0]["stock_quantity"] < item.quantity:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"商品 {item.name} の在庫が不足しています"
-                    )
-        
-        if item.service_id:
-            service = db.table("services").select("*").eq("id", item.service_id).eq("shop_id", current_shop["id"]).execute()
-            if not service.data:
-                raise HTTPException(status_code=404, detail=f"サービス {item.service_id} が見つかりません")
+    """
+    注文を作成
+    
+    所有権・在庫・クーポンの検証、在庫の引き当て、注文とクーポン使用履歴の作成は
+    place_order関数で1回の呼び出し・1トランザクションにまとめて行う（途中で失敗した場合は何も変更されない）。
+    適用したクーポン・キャンペーンのIDは注文に記録され、キャンペーン統計の集計に使われる。
+    """
+    from postgrest.exceptions import APIError
     
-    # クーポンの検証と適用
-    discount_amount = 0
+    shop_id = current_shop["id"]
+    items_data = [item.dict() for item in order.items]
+    total_amount = sum(item.quantity * item.unit_price for item in order.items)
+    service_ids = [item.service_id for item in order.items if item.service_id]
+    
+    if order.coupon_code and order.campaign_id:
+        raise HTTPException(status_code=400, detail="クーポンとキャンペーンは同時に利用できません")
+    
+    campaign_discount = 0
+    if order.campaign_id:
+        # 対象顧客・条件はコンパイル済みのルールで判定し、割引金額をplace_order関数に渡す
+        campaign_rule = get_campaign_rule(db, shop_id, order.campaign_id)
+        if campaign_rule is None:
+            raise HTTPException(status_code=400, detail="キャンペーンは現在アクティブではありません")
+        customer_visits = None
+        if campaign_rule.needs_customer_history:
+            customer = await repos.customers.get(order.customer_id, "id, total_visits")
+            if customer is None:
+                raise HTTPException(status_code=404, detail="顧客が見つかりません")
+            customer_visits = customer.get("total_visits") or 0
+        check = campaign_rule.evaluate(Basket(
+            total_amount,
+            service_ids=service_ids,
+            customer_id=order.customer_id,
+            customer_visits=customer_visits
+        ))
+        if not check.eligible:
+            raise HTTPException(status_code=400, detail=check.message)
+        campaign_discount = check.discount_amount
+    
+    coupon_code = None
+    coupon_rule = None
+    coupon_token = None
     if order.coupon_code:
-        # クーポンの検証（同じ店舗内で）
-        coupon_result = db.table("coupons").select("*").eq("code", order.coupon_code).eq("shop_id", current_shop["id"]).execute()
-        
-        if not coupon_result.data:
+        # 期間・最低購入金額・対象サービスなどの条件は、コンパイル済みのルールでデータベースに送る前に判定する
+        limit_key = check_coupon_lookup_limit(request, shop_id)
+        coupon_rule = get_coupon_rule(db, shop_id, order.coupon_code)
+        if coupon_rule is None:
+            coupon_lookup_limiter.record_failure(limit_key)
             raise HTTPException(status_code=400, detail="クーポンが見つかりません")
+        check = coupon_rule.evaluate(Basket(total_amount, service_ids=service_ids))
+        if not check.eligible:
+            raise HTTPException(status_code=400, detail=check.message)
+        # 入力されたコードは正規化して照合しているため、以降は登録されているコードを使う
+        coupon_code = coupon_rule.code
         
-        coupon = coupon_result.data[0]
-        total_amount = sum(item.quantity * item.unit_price for item in order.items)
-        
-        # クーポンの有効性チェック
-        if not coupon.get("is_active", False):
-            raise HTTPException(status_code=400, detail="このクーポンは無効です")
-        
-        from datetime import datetime
-        now = datetime.now()
-        valid_from = datetime.fromisoformat(coupon["valid_from"].replace("Z", "+00:00"))
-        valid_until = datetime.fromisoformat(coupon["valid_until"].replace("Z", "+00:00"))
-        
-        if now < valid_from or now > valid_until:
-            raise HTTPException(status_code=400, detail="このクーポンの有効期限が切れています")
-        
-        # 使用回数制限のチェック
-        if coupon.get("usage_limit") and coupon.get("usage_count", 0) >= coupon["usage_limit"]:
-            raise HTTPException(status_code=400, detail="このクーポンの使用回数制限に達しています")
-        
-        # 最小購入金額のチェック
-        if coupon.get("min_purchase_amount") and total_amount < coupon["min_purchase_amount"]:
-            raise HTTPException(
-                status_code=400,
-                detail=f"このクーポンは{coupon['min_purchase_amount']}円以上の購入でご利用いただけます"
-            )
-        
-        # 割引金額の計算
-        from api.utils import calculate_discount
-        discount_amount = calculate_discount(
-            total_amount,
-            coupon["coupon_type"],
-            coupon["discount_value"],
-            coupon.get("max_discount_amount")
+        # 使用回数の残りがないクーポンはデータベースに送らずに断る（注文が集中したときの絞り込み）
+        coupon_token = coupon_tokens.reserve(
+            shop_id,
+            coupon_code,
+            lambda: load_coupon_usage(db, shop_id, coupon_rule.id)
         )
-        if not coupon_validation.valid:
-            raise HTTPException(status_code=400, detail=coupon_validation.message or "無効なクーポンです")
-        discount_amount = coupon_validation.discount_amount
+        if coupon_token is None:
+            raise HTTPException(status_code=400, detail="このクーポンの使用回数制限に達しています")
     
-    # 合計金額の計算
-    items_data = [item.dict() for item in order.items]
-    totals = calculate_order_totals(items_data, discount_amount)
-    
-    # 注文の作成
-    order_data = {
-        "customer_id": order.customer_id,
-        "reservation_id": order.reservation_id,
-        "items": items_data,
-        "total_amount": totals["total_amount"],
-        "discount_amount": totals["discount_amount"],
-        "final_amount": totals["final_amount"],
-        "status": OrderStatus.PENDING.value,
-        "payment_method": order.payment_method,
-        "notes": order.notes,
-        "shop_id": current_shop["id"]
-    }
-    
-    result = db.table("orders").insert(order_data).execute()
+    coupon_used = False
+    try:
+        result = db.rpc("place_order", {
+            "p_shop_id": shop_id,
+            "p_customer_id": order.customer_id,
+            "p_items": items_data,
+            "p_reservation_id": order.reservation_id,
+            "p_coupon_code": coupon_code,
+            "p_payment_method": order.payment_method,
+            "p_notes": order.notes,
+            "p_campaign_id": order.campaign_id,
+            "p_campaign_discount": campaign_discount
+        }).execute()
+        coupon_used = bool(result.data) and result.data[0].get("coupon_id") is not None
+    except APIError as e:
+        if e.hint == "coupon_usage_limit":
+            coupon_tokens.mark_exhausted(shop_id, coupon_code)
+        status_code = PLACE_ORDER_ERROR_STATUS.get(e.hint)
+        if status_code is None:
+            raise
+        raise HTTPException(status_code=status_code, detail=e.message)
+    finally:
+        if coupon_token is not None:
+            if coupon_used:
+                coupon_token.commit()
+                coupon_rule.record_use()
+            else:
+                coupon_token.release()
     
     if not result.data:
         raise HTTPException(status_code=500, detail="注文の作成に失敗しました")
     
-    # 在庫の更新
-    for item in order.items:
-        if item.product_id:
-            product = db.table("products").select("*").eq("id", item.product_id).eq("shop_id", current_shop["id"]).execute()
-            if product.data and product.data[0].get("stock_quantity") is not None:
-                new_stock = product.data[0]["stock_quantity"] - item.quantity
-                db.table("products").update({
-                    "stock_quantity": new_stock,
-                    "updated_at": datetime.now().isoformat()
-                }).eq("id", item.product_id).eq("shop_id", current_shop["id"]).execute()
-    
-    # クーポン使用履歴の記録
-    if order.coupon_code and discount_amount > 0:
-        coupon_result = db.table("coupons").select("*").eq("code", order.coupon_code).eq("shop_id", current_shop["id"]).execute()
-        if coupon_result.data:
-            coupon_id = coupon_result.data[0]["id"]
-            db.table("coupon_usages").insert({
-                "coupon_id": coupon_id,
-                "customer_id": order.customer_id,
-                "order_id": result.data[0]["id"],
-                "discount_amount": discount_amount,
-                "used_at": datetime.now().isoformat(),
-                "shop_id": current_shop["id"]
-            }).execute()
-            
-            # クーポンの使用回数を更新
-            db.table("coupons").update({
-                "usage_count": coupon_result.data[0]["usage_count"] + 1,
-                "updated_at": datetime.now().isoformat()
-            }).eq("id", coupon_id).eq("shop_id", current_shop["id"]).execute()
-    
     order_response = OrderResponse(**result.data[0])
     
     # 注文確認メールを送信
     try:
+        customer = await repos.customers.get(order.customer_id, CUSTOMER_CONTACT_COLUMNS)
         email_service = get_email_service()
         email_service.send_order_confirmation(
-            customer_email=customer.data[0]["email"],
-            customer_name=customer.data[0].get("name", "お客様"),
+            customer_email=customer["email"],
+            customer_name=customer.get("name", "お客様"),
             order_id=order_response.id,
             total_amount=order_response.final_amount,
             items=items_data
@@ -246,7 +275,8 @@ async def list_orders(
 async def get_order(
     order_id: str,
     current_shop: dict = Depends(get_current_shop),
-    db: Client = Depends(get_db)
+    db: Client = Depends(get_db),
+    repos: ShopRepositories = Depends(get_repositories)
 ):
     """注文詳細を取得"""
     result = db.table("orders").select("*").eq("id", order_id).eq("shop_id", current_shop["id"]).execute()
@@ -261,14 +291,10 @@ async def get_order(
     reservation = None
     
     if order.get("customer_id"):
-        customer_result = db.table("customers").select("*").eq("id", order["customer_id"]).execute()
-        if customer_result.data:
-            customer = customer_result.data[0]
+        customer = await repos.customers.get(order["customer_id"], CUSTOMER_DETAIL_COLUMNS)
     
     if order.get("reservation_id"):
-        reservation_result = db.table("reservations").select("*").eq("id", order["reservation_id"]).execute()
-        if reservation_result.data:
-            reservation = reservation_result.data[0]
+        reservation = await repos.reservations.get(order["reservation_id"], RESERVATION_DETAIL_COLUMNS)
     
     return OrderWithDetails(
         **order,
@@ -286,11 +312,21 @@ async def update_order(
 ):
     """注文を更新"""
     # 注文の存在確認と所有権チェック
-    existing = db.table("orders").select("*").eq("id", order_id).eq("shop_id", current_shop["id"]).execute()
-    if not existing.data:
+    if not row_exists(db, "orders", id=order_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="注文が見つかりません")
     
     update_data = order_update.dict(exclude_unset=True)
+    
+    # ステータスの変更はクーポン・キャンペーンの集計と同時に行う
+    status = update_data.pop("status", None)
+    if status is not None:
+        updated = set_order_status(
+            db, current_shop["id"], order_id, status,
+            update_data.pop("payment_method", None), update_data.pop("payment_id", None)
+        )
+        if not update_data:
+            return OrderResponse(**updated)
+    
     update_data["updated_at"] = datetime.now().isoformat()
     
     result = db.table("orders").update(update_data).eq("id", order_id).eq("shop_id", current_shop["id"]).execute()
@@ -310,17 +346,9 @@ async def process_payment(
     db: Client = Depends(get_db)
 ):
     """注文の支払いを処理"""
-    result = db.table("orders").update({
-        "status": OrderStatus.PAID.value,
-        "payment_method": payment_method,
-        "payment_id": payment_id,
-        "updated_at": datetime.now().isoformat()
-    }).eq("id", order_id).eq("shop_id", current_shop["id"]).execute()
-    
-    if not result.data:
-        raise HTTPException(status_code=404, detail="注文が見つかりません")
+    order = set_order_status(db, current_shop["id"], order_id, OrderStatus.PAID, payment_method, payment_id)
     
-    return OrderResponse(**result.data[0])
+    return OrderResponse(**order)
 
 
 @router.post("/{order_id}/cancel", response_model=OrderResponse)
@@ -330,30 +358,20 @@ async def cancel_order(
     db: Client = Depends(get_db)
 ):
     """注文をキャンセル"""
-    # 注文の存在確認と所有権チェック
-    existing = db.table("orders").select("*").eq("id", order_id).eq("shop_id", current_shop["id"]).execute()
-    if not existing.data:
-        raise HTTPException(status_code=404, detail="注文が見つかりません")
-    
-    order = existing.data[0]
-    
-    # 在庫の戻し
-    if order.get("items"):
-        for item in order["items"]:
-            if item.get("product_id"):
-                product = db.table("products").select("*").eq("id", item["product_id"]).eq("shop_id", current_shop["id"]).execute()
-                if product.data and product.data[0].get("stock_quantity") is not None:
-                    new_stock = product.data[0]["stock_quantity"] + item["quantity"]
-                    db.table("products").update({
-                        "stock_quantity": new_stock,
-                        "updated_at": datetime.now().isoformat()
-                    }).eq("id", item["product_id"]).eq("shop_id", current_shop["id"]).execute()
-    
-    # 注文のキャンセル
-    result = db.table("orders").update({
-        "status": OrderStatus.CANCELLED.value,
-        "updated_at": datetime.now().isoformat()
-    }).eq("id", order_id).eq("shop_id", current_shop["id"]).execute()
+    # ステータスの変更・在庫の戻し・クーポンとキャンペーンの集計の取り消しを1つのトランザクションで行う
+    # （キャンセル済み・返金済みの注文は関数で断られるため、在庫は1回しか戻らない）
+    cancelled = set_order_status(db, current_shop["id"], order_id, OrderStatus.CANCELLED)
+    return OrderResponse(**cancelled)
+
+
+@router.post("/{order_id}/refund", response_model=OrderResponse)
+async def refund_order(
+    order_id: str,
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db)
+):
+    """注文を返金済みにする（クーポン・キャンペーンの集計では返金として記録）"""
+    order = set_order_status(db, current_shop["id"], order_id, OrderStatus.REFUNDED)
     
-    return OrderResponse(**result.data[0])
+    return OrderResponse(**order)
 
@@ -1,16 +1,21 @@
 """
 商品管理APIルート
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import Optional
 from datetime import datetime
-from supabase import Client
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.auth import get_current_shop
+from api.http_cache import (
+    PRIVATE_CACHE_CONTROL,
+    apply_cache_headers,
+    get_table_validator,
+    not_modified_response
+)
 from api.schemas import (
     ProductCreate,
     ProductUpdate,
@@ -42,6 +47,8 @@ async def create_product(
 
 @router.get("/", response_model=PaginatedResponse)
 async def list_products(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
     category: Optional[str] = None,
@@ -51,6 +58,13 @@ async def list_products(
     db: Client = Depends(get_db)
 ):
     """商品一覧を取得"""
+    # 本体を取得する前にバリデータを求める（取得中に更新されても古いETagが付くだけで安全）
+    validator = get_table_validator(db, "products", current_shop["id"], request)
+    cached = not_modified_response(request, validator, PRIVATE_CACHE_CONTROL)
+    if cached:
+        return cached
+    apply_cache_headers(response, validator, PRIVATE_CACHE_CONTROL)
+    
     query = db.table("products").select("*").eq("shop_id", current_shop["id"])
     
     if category:
@@ -106,8 +120,7 @@ async def update_product(
 ):
     """商品情報を更新"""
     # 商品の存在確認と所有権チェック
-    existing = db.table("products").select("*").eq("id", product_id).eq("shop_id", current_shop["id"]).execute()
-    if not existing.data:
+    if not row_exists(db, "products", id=product_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="商品が見つかりません")
     
     update_data = product_update.dict(exclude_unset=True)
@@ -160,10 +173,18 @@ async def update_stock(
 
 @router.get("/categories/list")
 async def list_categories(
+    request: Request,
+    response: Response,
     current_shop: dict = Depends(get_current_shop),
     db: Client = Depends(get_db)
 ):
     """商品カテゴリ一覧を取得"""
+    validator = get_table_validator(db, "products", current_shop["id"], request, resource="categories")
+    cached = not_modified_response(request, validator, PRIVATE_CACHE_CONTROL)
+    if cached:
+        return cached
+    apply_cache_headers(response, validator, PRIVATE_CACHE_CONTROL)
+    
     result = db.table("products").select("category").eq("shop_id", current_shop["id"]).execute()
     
     categories = set()
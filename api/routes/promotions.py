@@ -0,0 +1,75 @@
+"""
+割引検索APIルート
+"""
+from fastapi import APIRouter, Depends, HTTPException
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from api.database import Client, get_db
+from api.auth import get_current_shop
+from api.promotions import Basket, get_shop_promotions
+from api.repositories import ShopRepositories, get_repositories
+from api.schemas import (
+    PromotionBasketRequest,
+    PromotionCandidate,
+    BestPromotionResponse
+)
+
+router = APIRouter()
+
+
+@router.post("/best", response_model=BestPromotionResponse)
+async def find_best_promotion(
+    basket: PromotionBasketRequest,
+    current_shop: dict = Depends(get_current_shop),
+    db: Client = Depends(get_db),
+    repos: ShopRepositories = Depends(get_repositories)
+):
+    """
+    注文内容に適用できる割引金額が最大のクーポン・キャンペーンを検索
+
+    店舗の有効なクーポン・キャンペーンはコンパイル済みの索引（キャッシュ）から取り出してメモリ上で評価するため、
+    データベースへの問い合わせは索引の構築時と、新規顧客限定のキャンペーンがある場合の顧客の来店回数の取得だけになる。
+    """
+    promotions = get_shop_promotions(db, current_shop["id"])
+
+    total_amount = basket.total_amount
+    if total_amount is None:
+        total_amount = sum(item.quantity * item.unit_price for item in basket.items)
+    service_ids = set(basket.service_ids or [])
+    service_ids.update(item.service_id for item in basket.items if item.service_id)
+
+    customer_visits = None
+    if basket.customer_id and promotions.needs_customer_history:
+        customer = await repos.customers.get(basket.customer_id, "id, total_visits")
+        if customer is None:
+            raise HTTPException(status_code=404, detail="顧客が見つかりません")
+        customer_visits = customer.get("total_visits") or 0
+
+    rule, result, evaluated = promotions.best(Basket(
+        total_amount,
+        service_ids=service_ids,
+        customer_id=basket.customer_id,
+        customer_visits=customer_visits
+    ))
+
+    best = None
+    discount_amount = 0
+    if rule is not None:
+        discount_amount = result.discount_amount
+        best = PromotionCandidate(
+            kind=rule.kind,
+            id=rule.id,
+            code=rule.code,
+            name=rule.name,
+            discount_amount=discount_amount,
+            message=result.message
+        )
+
+    return BestPromotionResponse(
+        best=best,
+        total_amount=total_amount,
+        final_amount=max(0, total_amount - discount_amount),
+        evaluated=evaluated
+    )
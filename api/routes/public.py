@@ -0,0 +1,248 @@
+"""
+公開APIルート（認証不要）
+顧客向け予約ページが使う読み取り専用のエンドポイント
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from datetime import datetime, timedelta
+from typing import List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import sys
+import os
+import json
+import re
+import orjson
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from api.database import Client, get_db
+from api.logger import logger
+from api.models import ReservationStatus
+from api.catalog_cache import catalog_cache
+from api.http_cache import (
+    CacheValidator,
+    apply_cache_headers,
+    build_etag,
+    not_modified_response,
+    public_cache_control
+)
+from api.utils import generate_time_slots
+from api.routes.settings import ShopSettings
+from config import settings
+
+router = APIRouter()
+
+
+# 公開してよいカラムのみ取得する（スタイリストの連絡先などは含めない）
+PUBLIC_SERVICE_COLUMNS = "id, name, name_en, description, duration_minutes, price, category, image_url, display_order"
+PUBLIC_STYLIST_COLUMNS = "id, name, name_kana, specialty, bio, profile_image_url"
+# 店舗IDの形式（secrets.token_urlsafe で発行される文字のみ）
+SHOP_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class CatalogSnapshot:
+    """構築済みの公開カタログ（シリアライズ済みの本体とETag）"""
+
+    def __init__(self, body: bytes, validator: CacheValidator, built_on: str):
+        self.body = body
+        self.validator = validator
+        self.built_on = built_on
+
+
+def _load_shop_settings(db: Client) -> ShopSettings:
+    """店舗設定を取得（未設定・エラー時はデフォルト値）"""
+    try:
+        result = db.table("settings").select("value").eq("key", "shop_settings").execute()
+        if result.data:
+            return ShopSettings(**json.loads(result.data[0].get("value", "{}")))
+    except Exception as e:
+        logger.error(f"公開カタログの設定取得エラー: {str(e)}")
+    return ShopSettings(shop_name="Yoyaku 予約システム")
+
+
+def _shop_timezone(shop_settings: ShopSettings) -> ZoneInfo:
+    try:
+        return ZoneInfo(shop_settings.timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("Asia/Tokyo")
+
+
+def _parse_reservation_datetime(value: str, tz: ZoneInfo) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=tz)
+    return parsed.astimezone(tz)
+
+
+def build_availability(
+    shop_settings: ShopSettings,
+    stylist_ids: List[str],
+    reservations: List[dict],
+    now: datetime,
+    days: int
+) -> List[dict]:
+    """
+    指定日数分の空き状況を計算
+
+    各時間枠について、その時間に予約の入っていないスタイリストを空きとする。
+    スタイリスト未指定の予約は空いているスタイリスト1名分の枠を消費する。
+    最短予約受付時間より前の枠は予約不可とする。
+
+    Args:
+        shop_settings: 店舗設定（営業時間・営業日・枠の長さ）
+        stylist_ids: 在籍中のスタイリストIDのリスト
+        reservations: 期間内の有効な予約（reservation_datetime, duration_minutes, stylist_id）
+        now: 現在日時（店舗のタイムゾーン）
+        days: 日数
+
+    Returns:
+        日付ごとの時間枠のリスト
+    """
+    tz = now.tzinfo
+    slot_duration = shop_settings.reservation_slot_duration_minutes
+    earliest = now + timedelta(hours=shop_settings.min_advance_booking_hours)
+    capacity = len(stylist_ids) or 1
+
+    # 予約を (開始, 終了, スタイリストID) に変換し、開始日時順に並べる
+    booked = []
+    for reservation in reservations:
+        start = _parse_reservation_datetime(reservation["reservation_datetime"], tz)
+        end = start + timedelta(minutes=reservation.get("duration_minutes") or slot_duration)
+        booked.append((start, end, reservation.get("stylist_id")))
+    booked.sort(key=lambda item: item[0])
+
+    availability = []
+    for offset in range(days):
+        day = (now + timedelta(days=offset)).replace(hour=0, minute=0, second=0, microsecond=0)
+        if day.weekday() not in shop_settings.business_days:
+            availability.append({"date": day.date().isoformat(), "is_business_day": False, "slots": []})
+            continue
+
+        slots = []
+        for slot_start in generate_time_slots(
+            day,
+            duration_minutes=slot_duration,
+            start_time=shop_settings.business_hours_start,
+            end_time=shop_settings.business_hours_end
+        ):
+            slot_end = slot_start + timedelta(minutes=slot_duration)
+            busy_stylists = set()
+            unassigned = 0
+            for start, end, stylist_id in booked:
+                if start >= slot_end:
+                    break
+                if end <= slot_start:
+                    continue
+                if stylist_id:
+                    busy_stylists.add(stylist_id)
+                else:
+                    unassigned += 1
+
+            free_stylists = [stylist_id for stylist_id in stylist_ids if stylist_id not in busy_stylists]
+            remaining = (len(free_stylists) if stylist_ids else capacity - len(busy_stylists)) - unassigned
+            available = slot_start >= earliest and remaining > 0
+            slots.append({
+                "start_time": slot_start.isoformat(),
+                "end_time": slot_end.isoformat(),
+                "available": available,
+                "available_stylist_ids": free_stylists if available else []
+            })
+
+        availability.append({"date": day.date().isoformat(), "is_business_day": True, "slots": slots})
+
+    return availability
+
+
+def build_catalog(db: Client, shop_id: str) -> Optional[CatalogSnapshot]:
+    """
+    店舗の公開カタログを構築
+
+    サービス・スタイリスト・設定・期間内の予約をそれぞれ1回ずつ取得し、
+    空き状況を計算してシリアライズ済みの本体として保持する。
+
+    Returns:
+        CatalogSnapshot、店舗が存在しない場合None
+    """
+    shop = db.table("shops").select("id, name").eq("id", shop_id).eq("is_active", True).execute()
+    if not shop.data:
+        return None
+
+    shop_settings = _load_shop_settings(db)
+    tz = _shop_timezone(shop_settings)
+    now = datetime.now(tz)
+    days = settings.CATALOG_AVAILABILITY_DAYS
+    period_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    period_end = period_start + timedelta(days=days)
+
+    services = db.table("services").select(PUBLIC_SERVICE_COLUMNS).eq(
+        "shop_id", shop_id
+    ).eq("is_active", True).order("display_order").execute()
+
+    stylists = db.table("stylists").select(PUBLIC_STYLIST_COLUMNS).eq(
+        "shop_id", shop_id
+    ).eq("is_active", True).order("name").execute()
+
+    reservations = db.table("reservations").select(
+        "reservation_datetime, duration_minutes, stylist_id"
+    ).eq("shop_id", shop_id).in_(
+        "status", [ReservationStatus.PENDING.value, ReservationStatus.CONFIRMED.value]
+    ).gte("reservation_datetime", period_start.isoformat()).lt(
+        "reservation_datetime", period_end.isoformat()
+    ).execute()
+
+    stylist_ids = [stylist["id"] for stylist in stylists.data]
+    catalog = {
+        "shop": shop.data[0],
+        "settings": shop_settings.dict(),
+        "services": services.data,
+        "stylists": stylists.data,
+        "availability": build_availability(
+            shop_settings, stylist_ids, reservations.data, now, days
+        )
+    }
+
+    # 内容が変わらなければ再構築してもETagが変わらないよう、生成日時を含める前に求める
+    etag = build_etag("catalog", shop_id, orjson.dumps(catalog))
+    catalog["generated_at"] = now.isoformat()
+    return CatalogSnapshot(orjson.dumps(catalog), CacheValidator(etag, now), period_start.date().isoformat())
+
+
+def get_catalog_snapshot(db: Client, shop_id: str) -> Optional[CatalogSnapshot]:
+    """キャッシュから公開カタログを取得（日付が変わっていれば再構築）"""
+    snapshot = catalog_cache.get_or_build(shop_id, lambda: build_catalog(db, shop_id))
+    if snapshot is None:
+        return None
+
+    today = datetime.now(snapshot.validator.last_modified.tzinfo).date().isoformat()
+    if snapshot.built_on != today:
+        catalog_cache.invalidate(shop_id)
+        snapshot = catalog_cache.get_or_build(shop_id, lambda: build_catalog(db, shop_id))
+    return snapshot
+
+
+@router.get("/{shop_id}/catalog")
+async def get_public_catalog(
+    shop_id: str,
+    request: Request,
+    db: Client = Depends(get_db)
+):
+    """
+    予約ページ用の公開カタログを取得
+
+    サービス・在籍中のスタイリスト・店舗設定・今後7日間の空き状況を1回で返す。
+    店舗ごとにメモリ上へキャッシュし、管理側の更新時に破棄される。
+    """
+    # 形式の合わないIDはデータベースにもキャッシュにも触れずに断る
+    if not SHOP_ID_PATTERN.match(shop_id):
+        raise HTTPException(status_code=404, detail="店舗が見つかりません")
+
+    snapshot = get_catalog_snapshot(db, shop_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="店舗が見つかりません")
+
+    cache_control = public_cache_control(settings.CATALOG_CACHE_MAX_AGE)
+    cached = not_modified_response(request, snapshot.validator, cache_control)
+    if cached:
+        return cached
+
+    response = Response(content=snapshot.body, media_type="application/json")
+    apply_cache_headers(response, snapshot.validator, cache_control)
+    return response
@@ -3,19 +3,23 @@ AIレコメンデーションAPIルート
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional
-from supabase import Client
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
-from ai.recommendation_engine import RecommendationEngine
+from api.database import Client, get_db
+from api.repositories import AnalyticsRepository, get_analytics_repository
 
 router = APIRouter()
 
 
 def get_recommendation_engine(db: Client):
-    """レコメンデーションエンジンのインスタンスを取得"""
+    """
+    レコメンデーションエンジンのインスタンスを取得
+
+    エンジンはレコメンデーションAPIでしか使わないため、コールドスタートを短くするよう初回利用時に読み込む
+    """
+    from ai.recommendation_engine import RecommendationEngine
     return RecommendationEngine(db)
 
 
@@ -23,12 +27,14 @@ def get_recommendation_engine(db: Client):
 async def get_recommended_services(
     customer_id: str,
     limit: int = Query(5, ge=1, le=20),
-    db: Client = Depends(get_db)
+    db: Client = Depends(get_db),
+    repository: AnalyticsRepository = Depends(get_analytics_repository)
 ):
     """顧客におすすめのサービスを取得"""
     try:
         engine = get_recommendation_engine(db)
-        recommendations = engine.recommend_services(customer_id, limit)
+        popular_services = await repository.popular_services(limit)
+        recommendations = engine.recommend_services(customer_id, limit, popular_services)
         return {"recommendations": recommendations}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"レコメンデーション取得エラー: {str(e)}")
@@ -39,12 +45,14 @@ async def get_recommended_products(
     customer_id: str,
     service_id: Optional[str] = None,
     limit: int = Query(5, ge=1, le=20),
-    db: Client = Depends(get_db)
+    db: Client = Depends(get_db),
+    repository: AnalyticsRepository = Depends(get_analytics_repository)
 ):
     """顧客におすすめの商品を取得"""
     try:
         engine = get_recommendation_engine(db)
-        recommendations = engine.recommend_products(customer_id, service_id, limit)
+        popular_products = await repository.popular_products(limit)
+        recommendations = engine.recommend_products(customer_id, service_id, limit, popular_products)
         return {"recommendations": recommendations}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"レコメンデーション取得エラー: {str(e)}")
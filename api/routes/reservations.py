@@ -4,13 +4,25 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from datetime import datetime, timedelta
-from supabase import Client
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.auth import get_current_shop
+from api.catalog_cache import catalog_cache
+from api.repositories import AnalyticsRepository, ShopRepositories, get_analytics_repository, get_repositories
+from api.utils import as_utc
+from api.repositories.entities import (
+    CUSTOMER_CONTACT_COLUMNS,
+    CUSTOMER_DETAIL_COLUMNS,
+    RESERVATION_DETAIL_COLUMNS,
+    RESERVATION_STATUS_COLUMNS,
+    SERVICE_DETAIL_COLUMNS,
+    SERVICE_NAME_COLUMNS,
+    STYLIST_DETAIL_COLUMNS,
+    STYLIST_NAME_COLUMNS
+)
 from api.schemas import (
     ReservationCreate,
     ReservationUpdate,
@@ -56,38 +68,100 @@ def validate_reservation_datetime(reservation_datetime: datetime) -> None:
         )
 
 
+def sync_customer_visit_stats(
+    db: Client,
+    previous: dict,
+    updated: dict
+) -> None:
+    """
+    予約ステータスの遷移に応じて顧客の来店統計（total_visits / last_visit）を更新
+    
+    完了への遷移で加算し、完了からの遷移で取り消す。
+    完了済み予約の日時が変わった場合は最終来店日時のみ再計算する。
+    統計の更新に失敗しても予約の更新は阻害しない（バックフィルで補正可能）。
+    """
+    completed = ReservationStatus.COMPLETED.value
+    was_completed = previous.get("status") == completed
+    is_completed = updated.get("status") == completed
+    
+    if was_completed and is_completed:
+        if previous.get("reservation_datetime") == updated.get("reservation_datetime"):
+            return
+        delta = 0
+    elif is_completed:
+        delta = 1
+    elif was_completed:
+        delta = -1
+    else:
+        return
+    
+    try:
+        db.rpc("adjust_customer_visit_stats", {
+            "p_customer_id": updated.get("customer_id") or previous.get("customer_id"),
+            "p_delta": delta,
+            "p_visit_at": updated.get("reservation_datetime") or previous.get("reservation_datetime")
+        }).execute()
+    except Exception as e:
+        logger.error(f"顧客来店統計の更新に失敗しました: {str(e)}")
+
+
+def update_reservation_if_unchanged(
+    db: Client,
+    shop_id: str,
+    previous: dict,
+    update_data: dict
+) -> dict:
+    """
+    読み込んだ時点からステータスが変わっていない場合のみ予約を更新し、来店統計に反映
+    
+    同じ予約への同時の更新が両方とも同じ遷移（例: 確認済み→完了）として来店回数を加算しないよう、
+    更新は読み込んだステータスを条件にし、行が更新できた場合のみ来店統計を更新する。
+    """
+    result = db.table("reservations").update(update_data).eq("id", previous["id"]).eq(
+        "shop_id", shop_id
+    ).eq("status", previous["status"]).execute()
+    if not result.data:
+        raise HTTPException(status_code=409, detail="予約が同時に更新されました。もう一度お試しください")
+    
+    sync_customer_visit_stats(db, previous, result.data[0])
+    return result.data[0]
+
+
 @router.post("/", response_model=ReservationResponse)
 async def create_reservation(
     reservation: ReservationCreate,
     current_shop: dict = Depends(get_current_shop),
-    db: Client = Depends(get_db)
+    db: Client = Depends(get_db),
+    repos: ShopRepositories = Depends(get_repositories)
 ):
     """予約を作成"""
     # 日時のバリデーション
     validate_reservation_datetime(reservation.reservation_datetime)
     
     # 顧客の存在確認と所有権チェック
-    customer = db.table("customers").select("*").eq("id", reservation.customer_id).eq("shop_id", current_shop["id"]).execute()
-    if not customer.data:
+    customer = await repos.customers.get(reservation.customer_id, CUSTOMER_CONTACT_COLUMNS)
+    if not customer:
         raise HTTPException(status_code=404, detail="顧客が見つかりません")
     
     # サービスの存在確認と所有権チェック
-    service = db.table("services").select("*").eq("id", reservation.service_id).eq("shop_id", current_shop["id"]).execute()
-    if not service.data:
+    service = await repos.services.get(reservation.service_id, SERVICE_NAME_COLUMNS)
+    if not service:
         raise HTTPException(status_code=404, detail="サービスが見つかりません")
     
     # スタイリストの存在確認と所有権チェック（指定されている場合）
+    stylist = None
     if reservation.stylist_id:
-        stylist = db.table("stylists").select("*").eq("id", reservation.stylist_id).eq("shop_id", current_shop["id"]).execute()
-        if not stylist.data:
+        stylist = await repos.stylists.get(reservation.stylist_id, STYLIST_NAME_COLUMNS)
+        if not stylist:
             raise HTTPException(status_code=404, detail="スタイリストが見つかりません")
     
     # 重複予約のチェック（同じ店舗内で）
-    existing = db.table("reservations").select("*").eq(
-        "reservation_datetime", reservation.reservation_datetime.isoformat()
-    ).eq("status", ReservationStatus.CONFIRMED.value).eq("shop_id", current_shop["id"]).execute()
-    
-    if existing.data:
+    if row_exists(
+        db, "reservations",
+        reservation_datetime=reservation.reservation_datetime.isoformat(),
+        status=ReservationStatus.CONFIRMED.value,
+        shop_id=current_shop["id"]
+    ):
         raise HTTPException(status_code=400, detail="この時間帯は既に予約が入っています")
     
     # 予約の作成
@@ -106,11 +180,11 @@ async def create_reservation(
     try:
         email_service = get_email_service()
         email_service.send_reservation_confirmation(
-            customer_email=customer.data[0]["email"],
-            customer_name=customer.data[0].get("name", "お客様"),
+            customer_email=customer["email"],
+            customer_name=customer.get("name", "お客様"),
             reservation_datetime=reservation.reservation_datetime,
-            service_name=service.data[0]["name"],
-            stylist_name=stylist.data[0]["name"] if reservation.stylist_id and stylist.data else None,
+            service_name=service["name"],
+            stylist_name=stylist["name"] if stylist else None,
             reservation_id=reservation_response.id
         )
         logger.info(f"予約 {reservation_response.id} の確認メールを送信しました")
@@ -118,6 +192,8 @@ async def create_reservation(
         logger.error(f"予約確認メールの送信に失敗しました: {str(e)}")
         # メール送信失敗は予約作成を阻害しない
     
+    catalog_cache.invalidate(current_shop["id"])
+    
     return reservation_response
 
 
@@ -168,36 +244,27 @@ async def list_reservations(
 @router.get("/{reservation_id}", response_model=ReservationWithDetails)
 async def get_reservation(
     reservation_id: str,
-    current_shop: dict = Depends(get_current_shop),
-    db: Client = Depends(get_db)
+    repos: ShopRepositories = Depends(get_repositories)
 ):
     """予約詳細を取得"""
-    result = db.table("reservations").select("*").eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
+    reservation = await repos.reservations.get(reservation_id, RESERVATION_DETAIL_COLUMNS)
     
-    if not result.data:
+    if not reservation:
         raise HTTPException(status_code=404, detail="予約が見つかりません")
     
-    reservation = result.data[0]
-    
     # 関連データの取得
     customer = None
     stylist = None
     service = None
     
     if reservation.get("customer_id"):
-        customer_result = db.table("customers").select("*").eq("id", reservation["customer_id"]).execute()
-        if customer_result.data:
-            customer = customer_result.data[0]
+        customer = await repos.customers.get(reservation["customer_id"], CUSTOMER_DETAIL_COLUMNS)
     
     if reservation.get("stylist_id"):
-        stylist_result = db.table("stylists").select("*").eq("id", reservation["stylist_id"]).execute()
-        if stylist_result.data:
-            stylist = stylist_result.data[0]
+        stylist = await repos.stylists.get(reservation["stylist_id"], STYLIST_DETAIL_COLUMNS)
     
     if reservation.get("service_id"):
-        service_result = db.table("services").select("*").eq("id", reservation["service_id"]).execute()
-        if service_result.data:
-            service = service_result.data[0]
+        service = await repos.services.get(reservation["service_id"], SERVICE_DETAIL_COLUMNS)
     
     return ReservationWithDetails(
         **reservation,
@@ -215,8 +282,8 @@ async def update_reservation(
     db: Client = Depends(get_db)
 ):
     """予約を更新"""
-    # 予約の存在確認と所有権チェック
-    existing = db.table("reservations").select("*").eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
+    # 予約の存在確認と所有権チェック（来店統計の更新に使う列のみ取得）
+    existing = db.table("reservations").select(RESERVATION_STATUS_COLUMNS).eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
     if not existing.data:
         raise HTTPException(status_code=404, detail="予約が見つかりません")
     
@@ -228,13 +295,12 @@ async def update_reservation(
     update_data = reservation_update.dict(exclude_unset=True)
     update_data["updated_at"] = datetime.now().isoformat()
     
-    # 予約の更新
-    result = db.table("reservations").update(update_data).eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
+    # 予約の更新（読み込んだ時点からステータスが変わっていない場合のみ）
+    updated = update_reservation_if_unchanged(db, current_shop["id"], existing.data[0], update_data)
     
-    if not result.data:
-        raise HTTPException(status_code=500, detail="予約の更新に失敗しました")
+    catalog_cache.invalidate(current_shop["id"])
     
-    return ReservationResponse(**result.data[0])
+    return ReservationResponse(**updated)
 
 
 @router.post("/{reservation_id}/confirm", response_model=ReservationResponse)
@@ -290,8 +356,8 @@ async def cancel_reservation(
     db: Client = Depends(get_db)
 ):
     """予約をキャンセル"""
-    # 予約の存在確認と所有権チェック
-    existing = db.table("reservations").select("*").eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
+    # 予約の存在確認と所有権チェック（来店統計の更新に使う列のみ取得）
+    existing = db.table("reservations").select(RESERVATION_STATUS_COLUMNS).eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
     if not existing.data:
         raise HTTPException(status_code=404, detail="予約が見つかりません")
     
@@ -312,13 +378,13 @@ async def cancel_reservation(
         "*, customers(*), services(*)"
     ).eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
     
-    # 予約のキャンセル
-    result = db.table("reservations").update({
+    # 予約のキャンセル（読み込んだ時点からステータスが変わっていない場合のみ）
+    cancelled = update_reservation_if_unchanged(db, current_shop["id"], reservation, {
         "status": ReservationStatus.CANCELLED.value,
         "cancellation_reason": reason,
         "cancelled_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat()
-    }).eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
+    })
     
     # キャンセル確認メールを送信
     try:
@@ -340,7 +406,9 @@ async def cancel_reservation(
     except Exception as e:
         logger.error(f"キャンセル確認メールの送信に失敗しました: {str(e)}")
     
-    return ReservationResponse(**result.data[0])
+    catalog_cache.invalidate(current_shop["id"])
+    
+    return ReservationResponse(**cancelled)
 
 
 @router.delete("/{reservation_id}", response_model=MessageResponse)
@@ -350,13 +418,18 @@ async def delete_reservation(
     db: Client = Depends(get_db)
 ):
     """予約を削除（論理削除）"""
-    result = db.table("reservations").update({
+    existing = db.table("reservations").select(
+        "id, customer_id, status, reservation_datetime"
+    ).eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
+    if not existing.data:
+        raise HTTPException(status_code=404, detail="予約が見つかりません")
+    
+    update_reservation_if_unchanged(db, current_shop["id"], existing.data[0], {
         "status": ReservationStatus.CANCELLED.value,
         "updated_at": datetime.now().isoformat()
-    }).eq("id", reservation_id).eq("shop_id", current_shop["id"]).execute()
+    })
     
-    if not result.data:
-        raise HTTPException(status_code=404, detail="予約が見つかりません")
+    catalog_cache.invalidate(current_shop["id"])
     
     return MessageResponse(message="予約を削除しました")
 
@@ -366,9 +439,13 @@ async def get_available_slots(
     date: str = Query(..., description="日付 (YYYY-MM-DD)"),
     service_id: Optional[str] = None,
     stylist_id: Optional[str] = None,
-    db: Client = Depends(get_db)
+    repository: AnalyticsRepository = Depends(get_analytics_repository)
 ):
-    """指定日の利用可能な時間枠を取得"""
+    """
+    指定日の利用可能な時間枠を取得
+
+    営業時間内の有効な予約を1回のクエリで取得し、開始日時が一致する時間枠を埋まっているとみなす。
+    """
     try:
         target_date = datetime.fromisoformat(date)
     except ValueError:
@@ -384,25 +461,18 @@ async def get_available_slots(
     current_time = target_date.replace(hour=start_hour, minute=0, second=0, microsecond=0)
     end_time = target_date.replace(hour=end_hour, minute=0, second=0, microsecond=0)
     
+    # 既存の予約をまとめて取得
+    booked = set(await repository.booked_reservation_times(
+        current_time, end_time, service_id=service_id, stylist_id=stylist_id
+    ))
+    
     while current_time < end_time:
         slot_end = current_time + timedelta(minutes=slot_duration)
         
-        # 既存の予約をチェック
-        query = db.table("reservations").select("*").eq(
-            "reservation_datetime", current_time.isoformat()
-        ).in_("status", [ReservationStatus.PENDING.value, ReservationStatus.CONFIRMED.value])
-        
-        if service_id:
-            query = query.eq("service_id", service_id)
-        if stylist_id:
-            query = query.eq("stylist_id", stylist_id)
-        
-        existing = query.execute()
-        
         slots.append({
             "start_time": current_time.isoformat(),
             "end_time": slot_end.isoformat(),
-            "available": len(existing.data) == 0
+            "available": as_utc(current_time) not in booked
         })
         
         current_time = slot_end
@@ -1,16 +1,22 @@
 """
 サービス管理APIルート
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import Optional
 from datetime import datetime
-from supabase import Client
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.auth import get_current_shop
+from api.catalog_cache import catalog_cache
+from api.http_cache import (
+    PRIVATE_CACHE_CONTROL,
+    apply_cache_headers,
+    get_table_validator,
+    not_modified_response
+)
 from api.schemas import (
     ServiceCreate,
     ServiceUpdate,
@@ -37,11 +43,15 @@ async def create_service(
     if not result.data:
         raise HTTPException(status_code=500, detail="サービスの作成に失敗しました")
     
+    catalog_cache.invalidate(current_shop["id"])
+    
     return ServiceResponse(**result.data[0])
 
 
 @router.get("/", response_model=PaginatedResponse)
 async def list_services(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
     category: Optional[str] = None,
@@ -50,6 +60,13 @@ async def list_services(
     db: Client = Depends(get_db)
 ):
     """サービス一覧を取得"""
+    # 本体を取得する前にバリデータを求める（取得中に更新されても古いETagが付くだけで安全）
+    validator = get_table_validator(db, "services", current_shop["id"], request)
+    cached = not_modified_response(request, validator, PRIVATE_CACHE_CONTROL)
+    if cached:
+        return cached
+    apply_cache_headers(response, validator, PRIVATE_CACHE_CONTROL)
+    
     query = db.table("services").select("*").eq("shop_id", current_shop["id"])
     
     if category:
@@ -100,8 +117,7 @@ async def update_service(
 ):
     """サービス情報を更新"""
     # サービスの存在確認と所有権チェック
-    existing = db.table("services").select("*").eq("id", service_id).eq("shop_id", current_shop["id"]).execute()
-    if not existing.data:
+    if not row_exists(db, "services", id=service_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="サービスが見つかりません")
     
     update_data = service_update.dict(exclude_unset=True)
@@ -112,6 +128,8 @@ async def update_service(
     if not result.data:
         raise HTTPException(status_code=500, detail="サービス情報の更新に失敗しました")
     
+    catalog_cache.invalidate(current_shop["id"])
+    
     return ServiceResponse(**result.data[0])
 
 
@@ -130,15 +148,25 @@ async def delete_service(
     if not result.data:
         raise HTTPException(status_code=404, detail="サービスが見つかりません")
     
+    catalog_cache.invalidate(current_shop["id"])
+    
     return MessageResponse(message="サービスを削除しました")
 
 
 @router.get("/categories/list")
 async def list_categories(
+    request: Request,
+    response: Response,
     current_shop: dict = Depends(get_current_shop),
     db: Client = Depends(get_db)
 ):
     """サービスカテゴリ一覧を取得"""
+    validator = get_table_validator(db, "services", current_shop["id"], request, resource="categories")
+    cached = not_modified_response(request, validator, PRIVATE_CACHE_CONTROL)
+    if cached:
+        return cached
+    apply_cache_headers(response, validator, PRIVATE_CACHE_CONTROL)
+    
     result = db.table("services").select("category").eq("shop_id", current_shop["id"]).execute()
     
     categories = set()
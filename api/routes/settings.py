@@ -1,17 +1,27 @@
 """
 店舗設定管理APIルート
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import Optional
+from datetime import datetime
 from pydantic import BaseModel
-from supabase import Client
 import sys
 import os
 import json
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db
 from api.logger import logger
+from api.catalog_cache import catalog_cache
+from api.http_cache import (
+    CacheValidator,
+    apply_cache_headers,
+    build_etag,
+    not_modified_response,
+    parse_timestamp,
+    public_cache_control
+)
+from config import settings
 
 router = APIRouter()
 
@@ -79,13 +89,29 @@ class ShopSettingsUpdate(BaseModel):
 
 
 @router.get("/", response_model=ShopSettings)
-async def get_settings(db: Client = Depends(get_db)):
+async def get_settings(
+    request: Request,
+    response: Response,
+    db: Client = Depends(get_db)
+):
     """店舗設定を取得"""
     try:
         # settingsテーブルから取得（存在しない場合はデフォルト値を返す）
         result = db.table("settings").select("*").eq("key", "shop_settings").execute()
         
         if result.data and len(result.data) > 0:
+            # 保存されている値そのものからETagを求め、変更がなければパースせずに304を返す
+            row = result.data[0]
+            validator = CacheValidator(
+                build_etag("settings", row.get("value", "")),
+                parse_timestamp(row.get("updated_at"))
+            )
+            cache_control = public_cache_control(settings.CATALOG_CACHE_MAX_AGE)
+            cached = not_modified_response(request, validator, cache_control)
+            if cached:
+                return cached
+            apply_cache_headers(response, validator, cache_control)
+            
             settings_data = json.loads(result.data[0].get("value", "{}"))
             return ShopSettings(**settings_data)
         else:
@@ -119,9 +145,11 @@ async def update_settings(
             
             # データベースを更新
             db.table("settings").update({
-                "value": json.dumps(updated_settings, ensure_ascii=False)
+                "value": json.dumps(updated_settings, ensure_ascii=False),
+                "updated_at": datetime.now().isoformat()
             }).eq("key", "shop_settings").execute()
             
+            catalog_cache.clear()
             return ShopSettings(**updated_settings)
         else:
             # 新規作成
@@ -135,6 +163,7 @@ async def update_settings(
                 "value": json.dumps(default_data, ensure_ascii=False)
             }).execute()
             
+            catalog_cache.clear()
             return ShopSettings(**default_data)
     except Exception as e:
         logger.error(f"設定更新エラー: {str(e)}")
@@ -152,7 +181,8 @@ async def reset_settings(db: Client = Depends(get_db)):
         
         if existing_result.data and len(existing_result.data) > 0:
             db.table("settings").update({
-                "value": json.dumps(default_data, ensure_ascii=False)
+                "value": json.dumps(default_data, ensure_ascii=False),
+                "updated_at": datetime.now().isoformat()
             }).eq("key", "shop_settings").execute()
         else:
             db.table("settings").insert({
@@ -160,6 +190,7 @@ async def reset_settings(db: Client = Depends(get_db)):
                 "value": json.dumps(default_data, ensure_ascii=False)
             }).execute()
         
+        catalog_cache.clear()
         return ShopSettings(**default_data)
     except Exception as e:
         logger.error(f"設定リセットエラー: {str(e)}")
@@ -1,16 +1,22 @@
 """
 スタイリスト管理APIルート
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import Optional
 from datetime import datetime
-from supabase import Client
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from api.database import get_db
+from api.database import Client, get_db, row_exists
 from api.auth import get_current_shop
+from api.catalog_cache import catalog_cache
+from api.http_cache import (
+    PRIVATE_CACHE_CONTROL,
+    apply_cache_headers,
+    get_table_validator,
+    not_modified_response
+)
 from api.schemas import (
     StylistCreate,
     StylistUpdate,
@@ -37,11 +43,15 @@ async def create_stylist(
     if not result.data:
         raise HTTPException(status_code=500, detail="スタイリストの作成に失敗しました")
     
+    catalog_cache.invalidate(current_shop["id"])
+    
     return StylistResponse(**result.data[0])
 
 
 @router.get("/", response_model=PaginatedResponse)
 async def list_stylists(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
     is_active: Optional[bool] = None,
@@ -50,6 +60,13 @@ async def list_stylists(
     db: Client = Depends(get_db)
 ):
     """スタイリスト一覧を取得"""
+    # 本体を取得する前にバリデータを求める（取得中に更新されても古いETagが付くだけで安全）
+    validator = get_table_validator(db, "stylists", current_shop["id"], request)
+    cached = not_modified_response(request, validator, PRIVATE_CACHE_CONTROL)
+    if cached:
+        return cached
+    apply_cache_headers(response, validator, PRIVATE_CACHE_CONTROL)
+    
     query = db.table("stylists").select("*").eq("shop_id", current_shop["id"])
     
     if is_active is not None:
@@ -104,8 +121,7 @@ async def update_stylist(
 ):
     """スタイリスト情報を更新"""
     # スタイリストの存在確認と所有権チェック
-    existing = db.table("stylists").select("*").eq("id", stylist_id).eq("shop_id", current_shop["id"]).execute()
-    if not existing.data:
+    if not row_exists(db, "stylists", id=stylist_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="スタイリストが見つかりません")
     
     update_data = stylist_update.dict(exclude_unset=True)
@@ -116,6 +132,8 @@ async def update_stylist(
     if not result.data:
         raise HTTPException(status_code=500, detail="スタイリスト情報の更新に失敗しました")
     
+    catalog_cache.invalidate(current_shop["id"])
+    
     return StylistResponse(**result.data[0])
 
 
@@ -134,6 +152,8 @@ async def delete_stylist(
     if not result.data:
         raise HTTPException(status_code=404, detail="スタイリストが見つかりません")
     
+    catalog_cache.invalidate(current_shop["id"])
+    
     return MessageResponse(message="スタイリストを削除しました")
 
 
@@ -149,8 +169,7 @@ async def get_stylist_reservations(
 ):
     """スタイリストの予約一覧を取得"""
     # スタイリストの存在確認と所有権チェック
-    stylist = db.table("stylists").select("*").eq("id", stylist_id).eq("shop_id", current_shop["id"]).execute()
-    if not stylist.data:
+    if not row_exists(db, "stylists", id=stylist_id, shop_id=current_shop["id"]):
         raise HTTPException(status_code=404, detail="スタイリストが見つかりません")
     
     # 予約の取得
@@ -3,9 +3,9 @@ APIリクエスト/レスポンススキーマ定義
 """
 from pydantic import BaseModel, EmailStr, Field, validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from api.models import (
-    ReservationStatus, OrderStatus, CouponType, CampaignStatus
+    ReservationStatus, OrderStatus, CouponType, CampaignStatus, PromotionKind
 )
 
 
@@ -49,6 +49,22 @@ class CustomerResponse(CustomerBase):
     updated_at: Optional[datetime] = None
 
 
+class CustomerSummaryResponse(BaseModel):
+    """顧客サマリーレスポンススキーマ（顧客カード表示用）"""
+    customer: CustomerResponse
+    recent_reservations: List[dict]
+    recent_orders: List[dict]
+    total_visits: int
+    last_visit: Optional[datetime] = None
+    order_count: int
+    lifetime_spend: int
+    last_order_at: Optional[datetime] = None
+    total_reservations: int
+    upcoming_reservations: int
+    cancelled_reservations: int
+    no_show_reservations: int
+
+
 # ==================== スタイリストスキーマ ====================
 class StylistBase(BaseModel):
     """スタイリストベーススキーマ"""
@@ -235,6 +251,7 @@ class OrderBase(BaseModel):
 class OrderCreate(OrderBase):
     """注文作成スキーマ"""
     coupon_code: Optional[str] = None
+    campaign_id: Optional[str] = None
 
 
 class OrderUpdate(BaseModel):
@@ -258,6 +275,8 @@ class OrderResponse(BaseModel):
     payment_id: Optional[str] = None
     notes: Optional[str] = None
     items: Optional[List[dict]] = None
+    coupon_id: Optional[str] = None
+    campaign_id: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -333,6 +352,34 @@ class CouponValidateResponse(BaseModel):
     message: Optional[str] = None
 
 
+# ==================== 割引検索スキーマ ====================
+class PromotionBasketRequest(BaseModel):
+    """最適な割引の検索リクエストスキーマ"""
+    items: List[OrderItemCreate] = []
+    service_ids: Optional[List[str]] = None
+    customer_id: Optional[str] = None
+    # 省略時は items の合計金額
+    total_amount: Optional[int] = Field(None, ge=0)
+
+
+class PromotionCandidate(BaseModel):
+    """適用できる割引スキーマ"""
+    kind: PromotionKind
+    id: str
+    code: Optional[str] = None
+    name: str
+    discount_amount: int
+    message: Optional[str] = None
+
+
+class BestPromotionResponse(BaseModel):
+    """最適な割引の検索レスポンススキーマ"""
+    best: Optional[PromotionCandidate] = None
+    total_amount: int
+    final_amount: int
+    evaluated: int
+
+
 # ==================== キャンペーンスキーマ ====================
 class CampaignBase(BaseModel):
     """キャンペーンベーススキーマ"""
@@ -380,6 +427,48 @@ class CampaignResponse(CampaignBase):
     updated_at: Optional[datetime] = None
 
 
+class PromotionDailyStats(BaseModel):
+    """クーポン・キャンペーンの日次集計スキーマ"""
+    stat_date: date
+    orders: int = 0
+    revenue: int = 0
+    discount_amount: int = 0
+    cancelled_orders: int = 0
+    refunded_orders: int = 0
+    refunded_amount: int = 0
+
+
+class CampaignStatisticsResponse(BaseModel):
+    """キャンペーン統計レスポンススキーマ（合計は期間内の日次集計の合計）"""
+    campaign_id: str
+    name: str
+    status: CampaignStatus
+    start_date: datetime
+    end_date: datetime
+    total_orders: int
+    total_revenue: int
+    total_discount: int
+    cancelled_orders: int
+    refunded_orders: int
+    refunded_amount: int
+    net_revenue: int
+    daily: List[PromotionDailyStats]
+
+
+class CampaignNotificationJobResponse(BaseModel):
+    """キャンペーン通知の送信ジョブ（進捗）レスポンススキーマ"""
+    id: str
+    campaign_id: str
+    status: str
+    sent_count: int = 0
+    failed_count: int = 0
+    skipped_count: int = 0
+    last_error: Optional[str] = None
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 # ==================== ストレージスキーマ ====================
 class FileUploadResponse(BaseModel):
     """ファイルアップロードレスポンススキーマ"""
@@ -1,44 +1,65 @@
 """
 Supabaseクライアント設定
 """
-from supabase import create_client, Client
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional
 import sys
 import os
 
 # プロジェクトルートをパスに追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
+from api.db_instrumentation import InstrumentedClient
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 
 class SupabaseClient:
-    """Supabaseクライアントのシングルトン"""
+    """
+    Supabaseクライアントのシングルトン
+
+    PostgRESTへの接続はプール・タイムアウト・再試行を設定したトランスポート（api.http_transport）を使い、
+    DB呼び出しを計測するため、InstrumentedClientでラップして返す。
+    SUPABASE_BACKEND=memory の場合は通常・サービスロールともに同じインメモリクライアントを返す
+    """
     
-    _instance: Optional[Client] = None
-    _service_instance: Optional[Client] = None
+    _instance: Optional["Client"] = None
+    _service_instance: Optional["Client"] = None
     
     @classmethod
-    def get_client(cls) -> Client:
-        """通常のSupabaseクライアントを取得"""
+    def get_client(cls) -> "Client":
+        """通常のSupabaseクライアントを取得（初回呼び出し時に作成）"""
         if cls._instance is None:
+            if settings.SUPABASE_BACKEND == "memory":
+                from api.memory_client import MemorySupabaseClient
+                from api.memory_functions import register_memory_functions
+                cls._instance = InstrumentedClient(
+                    register_memory_functions(MemorySupabaseClient.from_schema_files())
+                )
+                return cls._instance
             if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
                 raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set")
-            cls._instance = create_client(
+            from api.http_transport import create_tuned_client
+            cls._instance = InstrumentedClient(create_tuned_client(
                 settings.SUPABASE_URL,
                 settings.SUPABASE_KEY
-            )
+            ))
         return cls._instance
     
     @classmethod
-    def get_service_client(cls) -> Client:
+    def get_service_client(cls) -> "Client":
         """サービスロール用のSupabaseクライアントを取得（管理者権限）"""
         if cls._service_instance is None:
+            if settings.SUPABASE_BACKEND == "memory":
+                cls._service_instance = cls.get_client()
+                return cls._service_instance
             if not settings.SUPABASE_URL or not settings.SUPABASE_SERVICE_KEY:
                 raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            cls._service_instance = create_client(
+            from api.http_transport import create_tuned_client
+            cls._service_instance = InstrumentedClient(create_tuned_client(
                 settings.SUPABASE_URL,
                 settings.SUPABASE_SERVICE_KEY
-            )
+            ))
         return cls._service_instance
     
     @classmethod
@@ -48,12 +69,20 @@ class SupabaseClient:
         cls._service_instance = None
 
 
-# グローバルなクライアントインスタンス
-supabase: Client = SupabaseClient.get_client()
-
-
+class LazyClient:
+    """
+    初回の属性アクセスでクライアントを作成するプロキシ
 
+    import時に接続設定の検証やsupabaseパッケージの読み込みを行わないため、
+    コールドスタートではクライアントを使う最初のリクエストまで作成を遅らせる
+    """
 
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
 
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._factory(), name)
 
 
+# グローバルなクライアントインスタンス（reset後は次の利用時に作り直される）
+supabase: "Client" = LazyClient(SupabaseClient.get_client)
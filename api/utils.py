@@ -2,8 +2,8 @@
 ユーティリティ関数
 共通で使用するヘルパー関数
 """
-from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Tuple, Union
 from config import settings
 
 
@@ -109,6 +109,20 @@ def generate_time_slots(
     return slots
 
 
+def as_utc(value: Union[str, datetime]) -> datetime:
+    """
+    日時をUTCのaware datetimeに揃える
+
+    PostgRESTは文字列、asyncpgはdatetimeで返すため、比較の前に揃える。
+    タイムゾーンのない日時はUTCとして扱う（PostgRESTに渡した場合と同じ解釈）。
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
 def format_datetime_jp(dt: datetime) -> str:
     """
     日時を日本語形式でフォーマット
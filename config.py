@@ -72,10 +72,40 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     SUPABASE_SERVICE_KEY: Optional[str] = os.getenv("SUPABASE_SERVICE_KEY")
     SUPABASE_DB_URL: Optional[str] = os.getenv("SUPABASE_DB_URL")
+    # "memory" の場合は外部接続なしのインメモリクライアントを使用（テスト・ベンチマーク用）
+    SUPABASE_BACKEND: str = os.getenv("SUPABASE_BACKEND", "supabase")
+    
+    # PostgRESTへのHTTP接続設定
+    SUPABASE_HTTP2: bool = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+    SUPABASE_POOL_MAX_CONNECTIONS: int = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "100"))
+    # キープアライブで保持する接続数と、未使用の接続を閉じるまでの秒数
+    SUPABASE_POOL_MAX_KEEPALIVE: int = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+    SUPABASE_POOL_KEEPALIVE_EXPIRY: float = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+    # 1リクエストごとのタイムアウト（秒）
+    SUPABASE_CONNECT_TIMEOUT: float = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+    SUPABASE_READ_TIMEOUT: float = float(os.getenv("SUPABASE_READ_TIMEOUT", "10"))
+    SUPABASE_WRITE_TIMEOUT: float = float(os.getenv("SUPABASE_WRITE_TIMEOUT", "10"))
+    SUPABASE_POOL_TIMEOUT: float = float(os.getenv("SUPABASE_POOL_TIMEOUT", "5"))
+    # 一時的な障害の再試行回数と、バックオフの基準・上限秒数
+    SUPABASE_MAX_RETRIES: int = int(os.getenv("SUPABASE_MAX_RETRIES", "2"))
+    SUPABASE_RETRY_BACKOFF: float = float(os.getenv("SUPABASE_RETRY_BACKOFF", "0.1"))
+    SUPABASE_RETRY_BACKOFF_MAX: float = float(os.getenv("SUPABASE_RETRY_BACKOFF_MAX", "2"))
+    # 1リクエストの再試行で待つ合計秒数の上限
+    # asyncのルートから呼ばれたクエリの待機はイベントループ全体を止めるため、イベントループ上では短い上限を使う
+    SUPABASE_RETRY_BUDGET: float = float(os.getenv("SUPABASE_RETRY_BUDGET", "4"))
+    SUPABASE_RETRY_BUDGET_EVENT_LOOP: float = float(os.getenv("SUPABASE_RETRY_BUDGET_EVENT_LOOP", "0.3"))
     
     # データベース設定
     DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL") or os.getenv("SUPABASE_DB_URL")
-    
+    # DATABASE_URLが設定されている場合、集計などの重いクエリはasyncpgの接続プールで直接実行する
+    DATABASE_POOL_MIN_SIZE: int = int(os.getenv("DATABASE_POOL_MIN_SIZE", "1"))
+    DATABASE_POOL_MAX_SIZE: int = int(os.getenv("DATABASE_POOL_MAX_SIZE", "10"))
+    # 接続ごとのプリペアドステートメントのキャッシュ数（pgbouncerのトランザクションモード経由の場合は0）
+    DATABASE_STATEMENT_CACHE_SIZE: int = int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", "100"))
+    DATABASE_COMMAND_TIMEOUT: float = float(os.getenv("DATABASE_COMMAND_TIMEOUT", "10"))
+    # 接続に失敗した後、PostgRESTにフォールバックしたまま再接続を試みない秒数
+    DATABASE_RETRY_INTERVAL: float = float(os.getenv("DATABASE_RETRY_INTERVAL", "30"))
+
     # API設定
     API_V1_PREFIX: str = "/api/v1"
     PROJECT_NAME: str = "Yoyaku Reservation System"
@@ -89,6 +119,54 @@ class Settings(BaseSettings):
         "http://127.0.0.1:8000",
     ]
     
+    # レスポンス圧縮設定（このバイト数未満のレスポンスは圧縮しない）
+    COMPRESSION_MINIMUM_SIZE: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+    
+    # HTTPキャッシュ設定（公開カタログ系レスポンスのmax-age秒数）
+    CATALOG_CACHE_MAX_AGE: int = int(os.getenv("CATALOG_CACHE_MAX_AGE", "60"))
+    # 公開カタログのインメモリキャッシュ有効秒数（他プロセスでの更新に追従する上限）
+    CATALOG_CACHE_TTL_SECONDS: int = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300"))
+    CATALOG_AVAILABILITY_DAYS: int = 7
+    # 店舗単位のインメモリキャッシュが保持する店舗数の上限（超えた場合は使われていない順に捨てる）
+    TENANT_CACHE_MAX_ENTRIES: int = int(os.getenv("TENANT_CACHE_MAX_ENTRIES", "1000"))
+    # 存在しない店舗の結果を保持する数の上限（実在する店舗とは別に数え、実在する店舗を追い出さない）
+    TENANT_CACHE_MAX_NEGATIVE_ENTRIES: int = int(os.getenv("TENANT_CACHE_MAX_NEGATIVE_ENTRIES", "200"))
+    
+    # クーポン・キャンペーンのルールのインメモリキャッシュ有効秒数（他プロセスでの更新に追従する上限）
+    PROMOTION_CACHE_TTL_SECONDS: int = int(os.getenv("PROMOTION_CACHE_TTL_SECONDS", "60"))
+    # クーポンコードの索引（正規化したコード → クーポンID）の有効秒数（存在しないコードの結果を保持する上限を兼ねる）
+    COUPON_CODE_INDEX_TTL_SECONDS: int = int(os.getenv("COUPON_CODE_INDEX_TTL_SECONDS", "30"))
+    # この秒数の間に存在しないクーポンコードをこの回数試したクライアントを制限する
+    COUPON_LOOKUP_MAX_MISSES: int = int(os.getenv("COUPON_LOOKUP_MAX_MISSES", "10"))
+    COUPON_LOOKUP_WINDOW_SECONDS: int = int(os.getenv("COUPON_LOOKUP_WINDOW_SECONDS", "300"))
+    # X-Forwarded-For を読む接続元のプロキシ（IPアドレス・CIDRのカンマ区切り）
+    # 未設定の場合は接続元のアドレスを使う。"*" はヘッダーを上書きするプラットフォーム（Vercelなど）の背後で使う
+    TRUSTED_PROXIES: str = os.getenv("TRUSTED_PROXIES", "")
+    
+    # キャンペーンスケジューラー設定（APIプロセス内でキャンペーンの開始・終了を実行する）
+    CAMPAIGN_SCHEDULER_ENABLED: bool = os.getenv("CAMPAIGN_SCHEDULER_ENABLED", "true").lower() == "true"
+    # 他プロセスでの変更を反映するため、キャンペーンを読み込み直す間隔（秒）
+    CAMPAIGN_SCHEDULER_RESYNC_SECONDS: int = int(os.getenv("CAMPAIGN_SCHEDULER_RESYNC_SECONDS", "300"))
+    # クーポン・キャンペーンの日次集計で日付を区切るタイムゾーン
+    PROMOTION_STATS_TIMEZONE: str = os.getenv("PROMOTION_STATS_TIMEZONE", "Asia/Tokyo")
+    
+    # キャンペーン通知の一斉送信設定
+    # 1回に読み込む顧客数（進捗と再開位置はこの件数ごとに記録する）
+    CAMPAIGN_NOTIFY_CHUNK_SIZE: int = int(os.getenv("CAMPAIGN_NOTIFY_CHUNK_SIZE", "500"))
+    # 同時に使うSMTP接続の数と、1秒あたりの送信数の上限
+    CAMPAIGN_NOTIFY_POOL_SIZE: int = int(os.getenv("CAMPAIGN_NOTIFY_POOL_SIZE", "4"))
+    CAMPAIGN_NOTIFY_RATE_PER_SECOND: float = float(os.getenv("CAMPAIGN_NOTIFY_RATE_PER_SECOND", "10"))
+    # 1つの接続で送る通数（超えたらつなぎ直す）
+    CAMPAIGN_NOTIFY_MESSAGES_PER_CONNECTION: int = int(os.getenv("CAMPAIGN_NOTIFY_MESSAGES_PER_CONNECTION", "100"))
+    # 通知に記載する日時のタイムゾーン
+    CAMPAIGN_NOTIFY_TIMEZONE: str = os.getenv("CAMPAIGN_NOTIFY_TIMEZONE", "Asia/Tokyo")
+    
+    # クーポンの使用枠キャッシュ設定
+    # 残り回数を保持する秒数（他プロセスでの使用分を反映するまでの上限）
+    COUPON_TOKEN_TTL_SECONDS: float = float(os.getenv("COUPON_TOKEN_TTL_SECONDS", "5"))
+    # この秒数の間にこの回数以上使われたコードだけ残り回数を保持する
+    COUPON_TOKEN_HOT_THRESHOLD: int = int(os.getenv("COUPON_TOKEN_HOT_THRESHOLD", "3"))
+    
     # セキュリティ設定
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     ALGORITHM: str = "HS256"
@@ -112,6 +190,15 @@ class Settings(BaseSettings):
     STORAGE_BUCKET: str = os.getenv("SUPABASE_STORAGE_BUCKET") or os.getenv("STORAGE_BUCKET", "uploads")
     MAX_FILE_SIZE_MB: int = 10
     
+    # DBクエリ計測設定
+    # この時間（ミリ秒）以上かかったクエリを警告ログに出力
+    DB_SLOW_QUERY_MS: int = int(os.getenv("DB_SLOW_QUERY_MS", "200"))
+    # 1リクエストで同じテーブルへのクエリがこの回数を超えたらN+1として警告
+    DB_N_PLUS_ONE_THRESHOLD: int = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "5"))
+    
+    # エクスポート設定
+    EXPORT_CHUNK_SIZE: int = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+    
     # メール設定
     SMTP_HOST: Optional[str] = os.getenv("SMTP_HOST")
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
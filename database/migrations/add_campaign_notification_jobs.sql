@@ -0,0 +1,27 @@
+-- キャンペーン通知の一斉送信ジョブ
+-- 送信対象の顧客をページ単位で読み、ページを送り終えるたびに進捗と再開位置（cursor）を記録する。
+-- 中断・失敗したジョブは cursor の次の顧客から再開する（記録前に中断したページは再送される）
+
+CREATE TABLE IF NOT EXISTS campaign_notification_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    shop_id VARCHAR(255) NOT NULL,
+    campaign_id UUID NOT NULL REFERENCES campaigns(id) ON DELETE CASCADE,
+    status VARCHAR(20) DEFAULT 'running' CHECK (status IN ('running', 'completed', 'failed')),
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    customer_ids JSONB,
+    cursor JSONB,
+    sent_count INTEGER DEFAULT 0,
+    failed_count INTEGER DEFAULT 0,
+    skipped_count INTEGER DEFAULT 0,
+    last_error TEXT,
+    started_at TIMESTAMPTZ DEFAULT NOW(),
+    finished_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_campaign_notification_jobs_campaign_id
+    ON campaign_notification_jobs(campaign_id, created_at DESC);
+
+COMMENT ON TABLE campaign_notification_jobs IS 'キャンペーン通知の一斉送信ジョブ（進捗と再開位置）';
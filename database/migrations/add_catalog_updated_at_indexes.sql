@@ -0,0 +1,5 @@
+-- カタログ系エンドポイントのETag生成用インデックス
+-- 店舗ごとの最終更新日時（updated_atの最大値）をインデックスの先頭1件から取得する
+CREATE INDEX IF NOT EXISTS idx_services_shop_updated_at ON services(shop_id, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_products_shop_updated_at ON products(shop_id, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_stylists_shop_updated_at ON stylists(shop_id, updated_at DESC);
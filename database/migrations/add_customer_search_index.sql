@@ -0,0 +1,89 @@
+-- 顧客検索用のトライグラムインデックスと検索関数
+-- 名前・フリガナ・メールアドレス・電話番号の部分一致/あいまい検索を高速化する
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- 部分一致（ILIKE '%...%'）とあいまい一致（%演算子）の両方で使えるGINインデックス
+CREATE INDEX IF NOT EXISTS idx_customers_name_trgm
+    ON customers USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_name_kana_trgm
+    ON customers USING gin (name_kana gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_email_trgm
+    ON customers USING gin (email gin_trgm_ops);
+
+-- 電話番号はハイフンや括弧を除いた数字のみで検索する
+CREATE INDEX IF NOT EXISTS idx_customers_phone_digits_trgm
+    ON customers USING gin ((regexp_replace(coalesce(phone, ''), '[^0-9]', '', 'g')) gin_trgm_ops);
+
+-- LIKE検索用に小文字化してワイルドカード文字をエスケープする
+CREATE OR REPLACE FUNCTION customer_search_pattern(p_query TEXT)
+RETURNS TEXT AS $$
+    SELECT replace(replace(replace(lower(trim(p_query)), '\', '\\'), '%', '\%'), '_', '\_');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 顧客検索関数
+-- 前方一致を最優先し、その後トライグラム類似度の高い順に返す
+CREATE OR REPLACE FUNCTION search_customers(
+    p_shop_id VARCHAR,
+    p_query TEXT,
+    p_limit INTEGER DEFAULT 10,
+    p_include_inactive BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (
+    id UUID,
+    name VARCHAR,
+    name_kana VARCHAR,
+    email VARCHAR,
+    phone VARCHAR,
+    is_active BOOLEAN,
+    total_visits INTEGER,
+    last_visit TIMESTAMPTZ,
+    score REAL
+) AS $$
+    SELECT
+        c.id,
+        c.name,
+        c.name_kana,
+        c.email,
+        c.phone,
+        c.is_active,
+        c.total_visits,
+        c.last_visit,
+        (
+            GREATEST(
+                similarity(coalesce(c.name, ''), lower(trim(p_query))),
+                similarity(coalesce(c.name_kana, ''), lower(trim(p_query))),
+                similarity(c.email, lower(trim(p_query))),
+                CASE WHEN regexp_replace(p_query, '[^0-9]', '', 'g') <> ''
+                    THEN similarity(
+                        regexp_replace(coalesce(c.phone, ''), '[^0-9]', '', 'g'),
+                        regexp_replace(p_query, '[^0-9]', '', 'g')
+                    )
+                    ELSE 0
+                END
+            )
+            + CASE WHEN c.name ILIKE customer_search_pattern(p_query) || '%'
+                     OR c.name_kana ILIKE customer_search_pattern(p_query) || '%'
+                     OR c.email ILIKE customer_search_pattern(p_query) || '%'
+                THEN 1 ELSE 0
+              END
+        )::REAL
+    FROM customers c
+    WHERE trim(p_query) <> ''
+      AND c.shop_id = p_shop_id
+      AND (p_include_inactive OR c.is_active)
+      AND (
+            c.name ILIKE '%' || customer_search_pattern(p_query) || '%'
+         OR c.name_kana ILIKE '%' || customer_search_pattern(p_query) || '%'
+         OR c.email ILIKE '%' || customer_search_pattern(p_query) || '%'
+         OR (
+                regexp_replace(p_query, '[^0-9]', '', 'g') <> ''
+            AND regexp_replace(coalesce(c.phone, ''), '[^0-9]', '', 'g')
+                LIKE '%' || regexp_replace(p_query, '[^0-9]', '', 'g') || '%'
+         )
+         OR c.name % lower(trim(p_query))
+         OR c.name_kana % lower(trim(p_query))
+      )
+    ORDER BY 9 DESC, c.last_visit DESC NULLS LAST, c.id
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
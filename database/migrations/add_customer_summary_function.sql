@@ -0,0 +1,62 @@
+-- 顧客カード（顧客360ビュー）用の集約関数
+-- プロフィール・直近の予約/注文・累計購入額・来店統計を1回の呼び出しで返す
+
+-- 顧客ごとの直近履歴を並び順どおりにインデックスから読み出すための複合インデックス
+CREATE INDEX IF NOT EXISTS idx_reservations_customer_datetime
+    ON reservations(customer_id, reservation_datetime DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_customer_created_at
+    ON orders(customer_id, created_at DESC);
+
+CREATE OR REPLACE FUNCTION get_customer_summary(
+    p_shop_id VARCHAR,
+    p_customer_id UUID,
+    p_limit INTEGER DEFAULT 5
+)
+RETURNS SETOF JSONB AS $$
+    SELECT jsonb_build_object(
+        'customer', to_jsonb(c) || jsonb_build_object('total_visits', coalesce(c.total_visits, 0)),
+        'recent_reservations', coalesce((
+            SELECT jsonb_agg(to_jsonb(r) ORDER BY r.reservation_datetime DESC)
+            FROM (
+                SELECT *
+                FROM reservations
+                WHERE customer_id = c.id AND shop_id = p_shop_id
+                ORDER BY reservation_datetime DESC
+                LIMIT p_limit
+            ) r
+        ), '[]'::jsonb),
+        'recent_orders', coalesce((
+            SELECT jsonb_agg(to_jsonb(o) ORDER BY o.created_at DESC)
+            FROM (
+                SELECT *
+                FROM orders
+                WHERE customer_id = c.id AND shop_id = p_shop_id
+                ORDER BY created_at DESC
+                LIMIT p_limit
+            ) o
+        ), '[]'::jsonb),
+        'order_stats', (
+            SELECT jsonb_build_object(
+                'order_count', count(*),
+                'lifetime_spend', coalesce(sum(final_amount) FILTER (WHERE status IN ('paid', 'completed')), 0),
+                'last_order_at', max(created_at)
+            )
+            FROM orders
+            WHERE customer_id = c.id AND shop_id = p_shop_id
+        ),
+        'reservation_stats', (
+            SELECT jsonb_build_object(
+                'total_reservations', count(*),
+                'upcoming_reservations', count(*) FILTER (
+                    WHERE status IN ('pending', 'confirmed') AND reservation_datetime > NOW()
+                ),
+                'cancelled_reservations', count(*) FILTER (WHERE status = 'cancelled'),
+                'no_show_reservations', count(*) FILTER (WHERE status = 'no_show')
+            )
+            FROM reservations
+            WHERE customer_id = c.id AND shop_id = p_shop_id
+        )
+    )
+    FROM customers c
+    WHERE c.id = p_customer_id AND c.shop_id = p_shop_id;
+$$ LANGUAGE sql STABLE;
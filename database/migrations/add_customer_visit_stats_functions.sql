@@ -0,0 +1,66 @@
+-- 顧客の来店統計（total_visits / last_visit）を維持するための関数
+
+-- 予約ステータスの遷移に応じて来店統計を増減する
+-- p_delta > 0: 予約が完了になった（来店回数を加算し、最終来店日時を更新）
+-- p_delta <= 0: 完了が取り消された、または完了済み予約の日時が変わった（最終来店日時を再計算）
+CREATE OR REPLACE FUNCTION adjust_customer_visit_stats(
+    p_customer_id UUID,
+    p_delta INTEGER,
+    p_visit_at TIMESTAMPTZ
+)
+RETURNS TABLE (total_visits INTEGER, last_visit TIMESTAMPTZ) AS $$
+BEGIN
+    IF p_delta > 0 THEN
+        RETURN QUERY
+        UPDATE customers c
+        SET total_visits = coalesce(c.total_visits, 0) + p_delta,
+            last_visit = GREATEST(coalesce(c.last_visit, p_visit_at), p_visit_at)
+        WHERE c.id = p_customer_id
+        RETURNING c.total_visits, c.last_visit;
+    ELSE
+        RETURN QUERY
+        UPDATE customers c
+        SET total_visits = GREATEST(coalesce(c.total_visits, 0) + p_delta, 0),
+            last_visit = (
+                SELECT max(r.reservation_datetime)
+                FROM reservations r
+                WHERE r.customer_id = p_customer_id
+                  AND r.status = 'completed'
+            )
+        WHERE c.id = p_customer_id
+        RETURNING c.total_visits, c.last_visit;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 全顧客の来店統計を完了済み予約から一括で再計算する
+-- 予約テーブルを1回だけ集計し、値が変わる顧客のみ更新する
+-- p_shop_idを指定した場合はその店舗の顧客のみ対象
+CREATE OR REPLACE FUNCTION backfill_customer_visit_stats(p_shop_id VARCHAR DEFAULT NULL)
+RETURNS TABLE (updated_count INTEGER) AS $$
+    WITH stats AS (
+        SELECT
+            customer_id,
+            count(*)::INTEGER AS visits,
+            max(reservation_datetime) AS last_visit
+        FROM reservations
+        WHERE status = 'completed'
+          AND (p_shop_id IS NULL OR shop_id = p_shop_id)
+        GROUP BY customer_id
+    ),
+    updated AS (
+        UPDATE customers c
+        SET total_visits = coalesce(s.visits, 0),
+            last_visit = s.last_visit
+        FROM customers target
+        LEFT JOIN stats s ON s.customer_id = target.id
+        WHERE c.id = target.id
+          AND (p_shop_id IS NULL OR c.shop_id = p_shop_id)
+          AND (
+                c.total_visits IS DISTINCT FROM coalesce(s.visits, 0)
+             OR c.last_visit IS DISTINCT FROM s.last_visit
+          )
+        RETURNING c.id
+    )
+    SELECT count(*)::INTEGER FROM updated;
+$$ LANGUAGE sql;
@@ -0,0 +1,9 @@
+-- 直接接続（asyncpg）で実行する集計クエリ用のインデックス
+-- 人気サービスの集計（完了・確定の予約をサービスごとに数える）をインデックスだけで行う
+CREATE INDEX IF NOT EXISTS idx_reservations_popular_service
+    ON reservations(service_id)
+    WHERE status IN ('completed', 'confirmed');
+-- 空き枠の取得（期間内の有効な予約）
+CREATE INDEX IF NOT EXISTS idx_reservations_active_datetime
+    ON reservations(reservation_datetime)
+    WHERE status IN ('pending', 'confirmed');
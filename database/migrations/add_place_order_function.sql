@@ -0,0 +1,183 @@
+-- 注文作成を1トランザクション・1回の呼び出しで行う関数
+-- 顧客・予約・商品・サービスの所有権チェック、在庫の確認と引き当て、クーポンの検証と使用記録、注文の作成をまとめて行う
+--
+-- 検証エラーは例外として送出し、それまでの変更はすべてロールバックされる。
+-- 例外のHINTにエラーの種別を入れる（APIはHINTでHTTPステータスを決め、MESSAGEをそのまま返す）
+--   customer_not_found / reservation_not_found / product_not_found / service_not_found
+--   insufficient_stock / coupon_not_found / coupon_inactive / coupon_expired
+--   coupon_usage_limit / coupon_min_purchase / campaign_not_found / campaign_inactive
+--
+-- キャンペーンの対象顧客・条件はAPIで判定し、割引金額を p_campaign_discount で渡す
+-- （関数ではキャンペーンが店舗のもので実施中であることだけを確認する）。
+-- 適用したクーポン・キャンペーンのIDは注文の coupon_id / campaign_id に記録する
+-- （列は add_promotion_daily_stats.sql で追加）。
+
+-- 引数を追加する前の関数を削除（CREATE OR REPLACEでは別の関数として残るため）
+DROP FUNCTION IF EXISTS place_order(VARCHAR, UUID, JSONB, UUID, VARCHAR, VARCHAR, TEXT);
+
+CREATE OR REPLACE FUNCTION place_order(
+    p_shop_id VARCHAR,
+    p_customer_id UUID,
+    p_items JSONB,
+    p_reservation_id UUID DEFAULT NULL,
+    p_coupon_code VARCHAR DEFAULT NULL,
+    p_payment_method VARCHAR DEFAULT NULL,
+    p_notes TEXT DEFAULT NULL,
+    p_campaign_id UUID DEFAULT NULL,
+    p_campaign_discount INTEGER DEFAULT 0
+)
+RETURNS SETOF orders AS $$
+DECLARE
+    v_item JSONB;
+    v_quantity INTEGER;
+    v_product products%ROWTYPE;
+    v_coupon coupons%ROWTYPE;
+    v_campaign campaigns%ROWTYPE;
+    v_total INTEGER := 0;
+    v_coupon_discount INTEGER := 0;
+    v_discount INTEGER := 0;
+    v_order orders%ROWTYPE;
+BEGIN
+    PERFORM 1 FROM customers WHERE id = p_customer_id AND shop_id = p_shop_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION '顧客が見つかりません' USING HINT = 'customer_not_found';
+    END IF;
+
+    IF p_reservation_id IS NOT NULL THEN
+        PERFORM 1 FROM reservations WHERE id = p_reservation_id AND shop_id = p_shop_id;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION '予約が見つかりません' USING HINT = 'reservation_not_found';
+        END IF;
+    END IF;
+
+    -- 注文に含まれる商品の行を商品IDの順にロックする
+    -- （同時の注文で在庫を二重に引き当てず、ロック順の違いによるデッドロックも起こさない）
+    PERFORM 1
+    FROM products
+    WHERE shop_id = p_shop_id
+      AND id IN (
+          SELECT (item->>'product_id')::UUID
+          FROM jsonb_array_elements(p_items) AS item
+          WHERE item->>'product_id' IS NOT NULL
+      )
+    ORDER BY id
+    FOR UPDATE;
+
+    FOR v_item IN SELECT * FROM jsonb_array_elements(p_items) LOOP
+        v_quantity := (v_item->>'quantity')::INTEGER;
+        v_total := v_total + v_quantity * (v_item->>'unit_price')::INTEGER;
+
+        IF v_item->>'product_id' IS NOT NULL THEN
+            SELECT * INTO v_product
+            FROM products
+            WHERE id = (v_item->>'product_id')::UUID AND shop_id = p_shop_id;
+            IF NOT FOUND THEN
+                RAISE EXCEPTION '商品 % が見つかりません', v_item->>'product_id'
+                    USING HINT = 'product_not_found';
+            END IF;
+            -- 在庫を管理している商品のみ引き当てる（同じ商品の行が複数あれば合計で判定される）
+            IF v_product.stock_quantity IS NOT NULL THEN
+                IF v_product.stock_quantity < v_quantity THEN
+                    RAISE EXCEPTION '商品 % の在庫が不足しています', v_item->>'name'
+                        USING HINT = 'insufficient_stock';
+                END IF;
+                UPDATE products
+                SET stock_quantity = stock_quantity - v_quantity,
+                    updated_at = NOW()
+                WHERE id = v_product.id;
+            END IF;
+        END IF;
+
+        IF v_item->>'service_id' IS NOT NULL THEN
+            PERFORM 1 FROM services
+            WHERE id = (v_item->>'service_id')::UUID AND shop_id = p_shop_id;
+            IF NOT FOUND THEN
+                RAISE EXCEPTION 'サービス % が見つかりません', v_item->>'service_id'
+                    USING HINT = 'service_not_found';
+            END IF;
+        END IF;
+    END LOOP;
+
+    IF p_coupon_code IS NOT NULL THEN
+        -- 行はロックせずに読む（使用回数の上限は最後の条件付きの加算で保証する）
+        SELECT * INTO v_coupon
+        FROM coupons
+        WHERE code = p_coupon_code AND shop_id = p_shop_id;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'クーポンが見つかりません' USING HINT = 'coupon_not_found';
+        END IF;
+        IF NOT coalesce(v_coupon.is_active, FALSE) THEN
+            RAISE EXCEPTION 'このクーポンは無効です' USING HINT = 'coupon_inactive';
+        END IF;
+        IF NOW() < v_coupon.valid_from OR NOW() > v_coupon.valid_until THEN
+            RAISE EXCEPTION 'このクーポンの有効期限が切れています' USING HINT = 'coupon_expired';
+        END IF;
+        -- 上限に達していれば在庫を引き当てる前に失敗させる（読み取り時点の値での事前チェック）
+        IF v_coupon.usage_limit IS NOT NULL AND coalesce(v_coupon.usage_count, 0) >= v_coupon.usage_limit THEN
+            RAISE EXCEPTION 'このクーポンの使用回数制限に達しています' USING HINT = 'coupon_usage_limit';
+        END IF;
+        IF v_coupon.min_purchase_amount IS NOT NULL AND v_total < v_coupon.min_purchase_amount THEN
+            RAISE EXCEPTION 'このクーポンは%円以上の購入でご利用いただけます', v_coupon.min_purchase_amount
+                USING HINT = 'coupon_min_purchase';
+        END IF;
+
+        -- api.utils.calculate_discount と同じ計算（max_discount_amountが0の場合は上限なし）
+        v_coupon_discount := CASE v_coupon.coupon_type
+            WHEN 'percentage' THEN LEAST(
+                floor(v_total * v_coupon.discount_value / 100.0)::INTEGER,
+                coalesce(nullif(v_coupon.max_discount_amount, 0), v_total)
+            )
+            WHEN 'fixed_amount' THEN v_coupon.discount_value
+            ELSE 0
+        END;
+        v_coupon_discount := LEAST(v_coupon_discount, v_total);
+    END IF;
+
+    IF p_campaign_id IS NOT NULL THEN
+        SELECT * INTO v_campaign
+        FROM campaigns
+        WHERE id = p_campaign_id AND shop_id = p_shop_id;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'キャンペーンが見つかりません' USING HINT = 'campaign_not_found';
+        END IF;
+        IF v_campaign.status <> 'active' OR NOT coalesce(v_campaign.is_active, FALSE)
+           OR NOW() < v_campaign.start_date OR NOW() > v_campaign.end_date THEN
+            RAISE EXCEPTION 'キャンペーンは現在アクティブではありません' USING HINT = 'campaign_inactive';
+        END IF;
+    END IF;
+
+    v_discount := LEAST(v_coupon_discount + GREATEST(coalesce(p_campaign_discount, 0), 0), v_total);
+
+    INSERT INTO orders (
+        shop_id, customer_id, reservation_id, items,
+        total_amount, discount_amount, final_amount,
+        status, payment_method, notes, coupon_id, campaign_id
+    )
+    VALUES (
+        p_shop_id, p_customer_id, p_reservation_id, p_items,
+        v_total, v_discount, GREATEST(v_total - v_discount, 0),
+        'pending', p_payment_method, p_notes,
+        CASE WHEN v_coupon_discount > 0 THEN v_coupon.id END, p_campaign_id
+    )
+    RETURNING * INTO v_order;
+
+    IF v_coupon_discount > 0 THEN
+        -- 上限未満の場合だけ加算する1文の更新で使用回数を確定する
+        -- （同時の注文は行ロックの後に更新後の値で条件を再評価するため、上限を超えて使用されない）
+        -- 行ロックの保持を短くするため、トランザクションの最後に行う
+        UPDATE coupons
+        SET usage_count = coalesce(usage_count, 0) + 1,
+            updated_at = NOW()
+        WHERE id = v_coupon.id
+          AND (usage_limit IS NULL OR coalesce(usage_count, 0) < usage_limit);
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'このクーポンの使用回数制限に達しています' USING HINT = 'coupon_usage_limit';
+        END IF;
+
+        INSERT INTO coupon_usages (shop_id, coupon_id, customer_id, order_id, discount_amount)
+        VALUES (p_shop_id, v_coupon.id, p_customer_id, v_order.id, v_coupon_discount);
+    END IF;
+
+    RETURN NEXT v_order;
+END;
+$$ LANGUAGE plpgsql;
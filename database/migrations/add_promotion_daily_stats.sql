@@ -0,0 +1,186 @@
+-- クーポン・キャンペーンの日次集計
+-- 注文に適用したクーポン・キャンペーンのIDを記録し、支払い・キャンセル・返金のたびに
+-- クーポン・キャンペーンごと・日ごとの集計行を同じトランザクションで加算する（統計は集計行だけを読む）
+
+-- 注文に適用したクーポン・キャンペーン
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS coupon_id UUID REFERENCES coupons(id) ON DELETE SET NULL;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS campaign_id UUID REFERENCES campaigns(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_orders_coupon_id ON orders(coupon_id) WHERE coupon_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_orders_campaign_id ON orders(campaign_id) WHERE campaign_id IS NOT NULL;
+
+-- 既存の注文のクーポンはクーポン使用履歴から埋める
+UPDATE orders o
+SET coupon_id = cu.coupon_id
+FROM coupon_usages cu
+WHERE cu.order_id = o.id AND o.coupon_id IS NULL;
+
+-- ============================================
+-- クーポン・キャンペーンの日次集計テーブル (promotion_daily_stats)
+-- ============================================
+-- orders / revenue / discount_amount: その日に支払われた注文
+-- cancelled_orders / refunded_orders / refunded_amount: その日に取り消された支払い済みの注文
+CREATE TABLE IF NOT EXISTS promotion_daily_stats (
+    shop_id VARCHAR(255) NOT NULL,
+    promotion_type VARCHAR(20) NOT NULL CHECK (promotion_type IN ('coupon', 'campaign')),
+    promotion_id UUID NOT NULL,
+    stat_date DATE NOT NULL,
+    orders INTEGER DEFAULT 0,
+    revenue BIGINT DEFAULT 0,
+    discount_amount BIGINT DEFAULT 0,
+    cancelled_orders INTEGER DEFAULT 0,
+    refunded_orders INTEGER DEFAULT 0,
+    refunded_amount BIGINT DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (promotion_type, promotion_id, stat_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_promotion_daily_stats_shop_id ON promotion_daily_stats(shop_id);
+
+COMMENT ON TABLE promotion_daily_stats IS 'クーポン・キャンペーンの日次集計テーブル';
+
+-- 既存の支払い済みの注文を最終更新日で集計する
+INSERT INTO promotion_daily_stats (shop_id, promotion_type, promotion_id, stat_date, orders, revenue, discount_amount)
+SELECT shop_id, promotion_type, promotion_id, stat_date, count(*), sum(final_amount), sum(discount_amount)
+FROM (
+    SELECT shop_id, 'coupon' AS promotion_type, coupon_id AS promotion_id,
+           (updated_at AT TIME ZONE 'Asia/Tokyo')::DATE AS stat_date, final_amount, discount_amount
+    FROM orders
+    WHERE coupon_id IS NOT NULL AND status IN ('paid', 'processing', 'completed')
+    UNION ALL
+    SELECT shop_id, 'campaign', campaign_id,
+           (updated_at AT TIME ZONE 'Asia/Tokyo')::DATE, final_amount, discount_amount
+    FROM orders
+    WHERE campaign_id IS NOT NULL AND status IN ('paid', 'processing', 'completed')
+) paid
+GROUP BY shop_id, promotion_type, promotion_id, stat_date
+ON CONFLICT (promotion_type, promotion_id, stat_date) DO NOTHING;
+
+-- 注文の売上を集計行に加算する（p_sign: 1 = 支払い、-1 = 支払い済みの注文の取り消し）
+CREATE OR REPLACE FUNCTION apply_promotion_daily_stats(
+    p_order orders,
+    p_sign INTEGER,
+    p_status VARCHAR,
+    p_stat_date DATE
+)
+RETURNS VOID AS $$
+DECLARE
+    v_promotion RECORD;
+BEGIN
+    FOR v_promotion IN
+        SELECT 'coupon' AS promotion_type, p_order.coupon_id AS promotion_id WHERE p_order.coupon_id IS NOT NULL
+        UNION ALL
+        SELECT 'campaign', p_order.campaign_id WHERE p_order.campaign_id IS NOT NULL
+    LOOP
+        INSERT INTO promotion_daily_stats AS s (
+            shop_id, promotion_type, promotion_id, stat_date,
+            orders, revenue, discount_amount, cancelled_orders, refunded_orders, refunded_amount
+        )
+        VALUES (
+            p_order.shop_id, v_promotion.promotion_type, v_promotion.promotion_id, p_stat_date,
+            CASE WHEN p_sign > 0 THEN 1 ELSE 0 END,
+            CASE WHEN p_sign > 0 THEN p_order.final_amount ELSE 0 END,
+            CASE WHEN p_sign > 0 THEN p_order.discount_amount ELSE 0 END,
+            CASE WHEN p_sign < 0 AND p_status <> 'refunded' THEN 1 ELSE 0 END,
+            CASE WHEN p_sign < 0 AND p_status = 'refunded' THEN 1 ELSE 0 END,
+            CASE WHEN p_sign < 0 THEN p_order.final_amount ELSE 0 END
+        )
+        ON CONFLICT (promotion_type, promotion_id, stat_date) DO UPDATE SET
+            orders = s.orders + EXCLUDED.orders,
+            revenue = s.revenue + EXCLUDED.revenue,
+            discount_amount = s.discount_amount + EXCLUDED.discount_amount,
+            cancelled_orders = s.cancelled_orders + EXCLUDED.cancelled_orders,
+            refunded_orders = s.refunded_orders + EXCLUDED.refunded_orders,
+            refunded_amount = s.refunded_amount + EXCLUDED.refunded_amount,
+            updated_at = NOW();
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 注文のステータスを変更し、クーポン・キャンペーンの集計を更新する
+-- 注文の行をロックして変更前のステータスを読むため、同じ変更が同時に行われても二重に集計されない。
+-- 支払い済み（paid / processing / completed）になったときに加算し、そこから外れたときに取り消しとして記録する。
+-- キャンセル・返金済みの注文は変更できず、返金は支払い済みの注文だけに行える
+-- （同じ注文のキャンセルと支払いを繰り返して集計が増え続けることはない）。
+-- キャンセルしたときは同じトランザクションで商品の在庫を戻す（stock_quantity = stock_quantity + 数量）。
+-- 例外のHINT: order_not_found / order_status_final / order_not_paid
+CREATE OR REPLACE FUNCTION set_order_status(
+    p_shop_id VARCHAR,
+    p_order_id UUID,
+    p_status VARCHAR,
+    p_payment_method VARCHAR DEFAULT NULL,
+    p_payment_id VARCHAR DEFAULT NULL,
+    p_timezone VARCHAR DEFAULT 'Asia/Tokyo'
+)
+RETURNS SETOF orders AS $$
+DECLARE
+    v_previous VARCHAR;
+    v_was_paid BOOLEAN;
+    v_is_paid BOOLEAN;
+    v_order orders%ROWTYPE;
+BEGIN
+    SELECT status INTO v_previous
+    FROM orders
+    WHERE id = p_order_id AND shop_id = p_shop_id
+    FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION '注文が見つかりません' USING HINT = 'order_not_found';
+    END IF;
+
+    v_was_paid := v_previous IN ('paid', 'processing', 'completed');
+    v_is_paid := p_status IN ('paid', 'processing', 'completed');
+    IF v_previous IN ('cancelled', 'refunded') THEN
+        RAISE EXCEPTION 'キャンセル・返金済みの注文のステータスは変更できません' USING HINT = 'order_status_final';
+    END IF;
+    IF p_status = 'refunded' AND NOT v_was_paid THEN
+        RAISE EXCEPTION '支払い前の注文は返金できません' USING HINT = 'order_not_paid';
+    END IF;
+
+    UPDATE orders
+    SET status = p_status,
+        payment_method = coalesce(p_payment_method, payment_method),
+        payment_id = coalesce(p_payment_id, payment_id),
+        updated_at = NOW()
+    WHERE id = p_order_id
+    RETURNING * INTO v_order;
+
+    IF p_status = 'cancelled' THEN
+        -- place_order と同じく商品の行を商品IDの順にロックしてから在庫を戻す
+        PERFORM 1
+        FROM products
+        WHERE shop_id = p_shop_id
+          AND id IN (
+              SELECT (item->>'product_id')::UUID
+              FROM jsonb_array_elements(coalesce(v_order.items, '[]'::JSONB)) AS item
+              WHERE item->>'product_id' IS NOT NULL
+          )
+        ORDER BY id
+        FOR UPDATE;
+
+        -- 在庫を管理している商品のみ戻す（同じ商品の行が複数あれば合計で戻す）
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity + returned.quantity,
+            updated_at = NOW()
+        FROM (
+            SELECT (item->>'product_id')::UUID AS product_id, sum((item->>'quantity')::INTEGER) AS quantity
+            FROM jsonb_array_elements(coalesce(v_order.items, '[]'::JSONB)) AS item
+            WHERE item->>'product_id' IS NOT NULL
+            GROUP BY 1
+        ) returned
+        WHERE p.id = returned.product_id
+          AND p.shop_id = p_shop_id
+          AND p.stock_quantity IS NOT NULL;
+    END IF;
+
+    IF v_was_paid <> v_is_paid THEN
+        PERFORM apply_promotion_daily_stats(
+            v_order,
+            CASE WHEN v_is_paid THEN 1 ELSE -1 END,
+            p_status,
+            (NOW() AT TIME ZONE p_timezone)::DATE
+        );
+    END IF;
+
+    RETURN NEXT v_order;
+END;
+$$ LANGUAGE plpgsql;
@@ -10,8 +10,13 @@ import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from api.supabase_client import supabase
-from api.models import CampaignStatus
+from api.models import CampaignStatus, PromotionKind
+from api.promotions import Basket, compile_campaign
+from api.promotion_stats import load_promotion_daily_stats, summarize_promotion_stats
+from marketing.campaign_notifier import CampaignNotifier
+from marketing.campaign_scheduler import CampaignScheduler, campaign_scheduler
 from config import settings
+from api.logger import logger
 
 
 class CampaignManager:
@@ -21,13 +26,22 @@ class CampaignManager:
         """初期化"""
         self.db = db or supabase
     
-    def get_active_campaigns(self) -> List[Dict]:
-        """アクティブなキャンペーンを取得"""
+    def get_active_campaigns(self, shop_id: Optional[str] = None) -> List[Dict]:
+        """アクティブなキャンペーンを取得（shop_idを指定した場合はその店舗のみ）"""
+        if shop_id is not None and self.db is supabase:
+            # APIプロセスではスケジューラーが保持している実施中の一覧を使う
+            campaigns = campaign_scheduler.active_campaigns(shop_id)
+            if campaigns is not None:
+                return campaigns
+        
         now = datetime.now().isoformat()
         
-        result = self.db.table("campaigns").select("*").eq(
+        query = self.db.table("campaigns").select("*").eq(
             "status", CampaignStatus.ACTIVE.value
-        ).eq("is_active", True).lte("start_date", now).gte("end_date", now).execute()
+        ).eq("is_active", True).lte("start_date", now).gte("end_date", now)
+        if shop_id is not None:
+            query = query.eq("shop_id", shop_id)
+        result = query.execute()
         
         return result.data or []
     
@@ -48,53 +62,21 @@ class CampaignManager:
         if not campaign.data:
             return False, "キャンペーンが見つかりません", None
         
-        campaign_data = campaign.data[0]
-        
-        # ステータスチェック
-        if campaign_data["status"] != CampaignStatus.ACTIVE.value or not campaign_data.get("is_active"):
-            return False, "キャンペーンは現在アクティブではありません", None
-        
-        # 期間チェック
-        now = datetime.now()
-        start_date = datetime.fromisoformat(campaign_data["start_date"])
-        end_date = datetime.fromisoformat(campaign_data["end_date"])
-        
-        if now < start_date or now > end_date:
-            return False, "キャンペーンの期間外です", None
-        
-        # 対象顧客チェック
-        target_audience = campaign_data.get("target_audience")
-        if target_audience:
-            # 新規顧客のみ
-            if target_audience.get("new_customers_only"):
-                customer = self.db.table("customers").select("*").eq("id", customer_id).execute()
-                if customer.data and customer.data[0].get("total_visits", 0) > 0:
-                    return False, "このキャンペーンは新規顧客限定です", None
-            
-            # 特定の顧客グループ
-            if target_audience.get("customer_ids"):
-                if customer_id not in target_audience["customer_ids"]:
-                    return False, "このキャンペーンの対象外です", None
-        
-        # 条件チェック
-        conditions = campaign_data.get("conditions")
-        if conditions:
-            # 最低購入金額
-            min_amount = conditions.get("min_purchase_amount")
-            if min_amount and order_amount < min_amount:
-                return False, f"最低購入金額 {min_amount}円以上でご利用いただけます", None
-        
-        # 割引金額の計算
-        discount_amount = 0
-        discount_type = campaign_data.get("discount_type")
-        discount_value = campaign_data.get("discount_value")
-        
-        if discount_type == "percentage" and discount_value:
-            discount_amount = int(order_amount * discount_value / 100)
-        elif discount_type == "fixed_amount" and discount_value:
-            discount_amount = discount_value
-        
-        return True, "キャンペーンが適用されました", discount_amount
+        rule = compile_campaign(campaign.data[0])
+        
+        # 新規顧客限定のキャンペーンのみ来店回数を取得
+        customer_visits = None
+        if rule.needs_customer_history:
+            customer = self.db.table("customers").select("total_visits").eq("id", customer_id).execute()
+            if customer.data:
+                customer_visits = customer.data[0].get("total_visits") or 0
+        
+        result = rule.evaluate(Basket(order_amount, customer_id=customer_id, customer_visits=customer_visits))
+        
+        if not result.eligible:
+            return False, result.message, None
+        
+        return True, result.message, result.discount_amount
     
     def apply_campaign_discount(
         self,
@@ -117,32 +99,31 @@ class CampaignManager:
         
         return True, discount_amount, message
     
-    def update_campaign_status(self):
-        """キャンペーンのステータスを自動更新"""
-        now = datetime.now().isoformat()
+    def update_campaign_status(self) -> int:
+        """
+        キャンペーンのステータスを自動更新
         
-        # 開始日時を過ぎたドラフトキャンペーンをアクティブに
-        self.db.table("campaigns").update({
-            "status": CampaignStatus.ACTIVE.value,
-            "updated_at": now
-        }).eq("status", CampaignStatus.DRAFT.value).lte("start_date", now).execute()
-        
-        # 終了日時を過ぎたアクティブキャンペーンを終了に
-        self.db.table("campaigns").update({
-            "status": CampaignStatus.ENDED.value,
-            "is_active": False,
-            "updated_at": now
-        }).eq("status", CampaignStatus.ACTIVE.value).lt("end_date", now).execute()
+        開始・終了日時を過ぎたキャンペーンだけを1件ずつ条件付きで遷移させる
+        （常駐のスケジューラーと同時に実行しても同じ遷移が二重に行われることはない）
+        
+        Returns:
+            状態を変更したキャンペーンの数
+        """
+        scheduler = CampaignScheduler(lambda: self.db, settings.CAMPAIGN_SCHEDULER_RESYNC_SECONDS)
+        scheduler.load()
+        return scheduler.run_due()
     
     def get_campaign_statistics(self, campaign_id: str) -> Dict:
-        """キャンペーンの統計情報を取得"""
+        """キャンペーンの統計を取得（注文の支払い・キャンセル・返金時に更新される日次集計の合計）"""
         campaign = self.db.table("campaigns").select("*").eq("id", campaign_id).execute()
         
         if not campaign.data:
             return {}
         
-        # 注文数と売上を集計（簡易版）
-        # 実際の実装では、注文テーブルにキャンペーンIDを保存する必要があります
+        daily = load_promotion_daily_stats(
+            self.db, campaign.data[0].get("shop_id"), PromotionKind.CAMPAIGN.value, campaign_id
+        )
+        totals = summarize_promotion_stats(daily)
         
         return {
             "campaign_id": campaign_id,
@@ -150,27 +131,31 @@ class CampaignManager:
             "status": campaign.data[0].get("status"),
             "start_date": campaign.data[0].get("start_date"),
             "end_date": campaign.data[0].get("end_date"),
-            # 実際の実装では、注文データから集計
-            "total_orders": 0,
-            "total_revenue": 0,
-            "total_discount": 0
+            "total_orders": totals["orders"],
+            "total_revenue": totals["revenue"],
+            "total_discount": totals["discount_amount"],
+            "net_revenue": totals["net_revenue"],
+            "daily": daily
         }
     
-    def send_campaign_notification(self, campaign_id: str, customer_ids: List[str]) -> bool:
+    def send_campaign_notification(self, campaign_id: str, customer_ids: Optional[List[str]] = None) -> bool:
         """
-        キャンペーンの通知を送信
+        キャンペーンの通知をメールで一斉送信
         
-        実際の実装では、メール送信やプッシュ通知などを実装
-        """
-        campaign = self.db.table("campaigns").select("*").eq("id", campaign_id).execute()
+        customer_ids を省略した場合はキャンペーンの target_audience の顧客に送る。
+        進捗は送信ジョブ（campaign_notification_jobs）に記録され、失敗した場合は
+        scripts/send_campaign_notification.py --resume で続きから送信できる。
         
-        if not campaign.data:
+        Returns:
+            すべての送信対象への送信を終えた場合True
+        """
+        try:
+            job = CampaignNotifier(self.db).start(campaign_id, customer_ids)
+        except ValueError as e:
+            logger.error(f"キャンペーン通知を送信できません: {str(e)}", extra={"campaign_id": campaign_id})
             return False
         
-        # ここでメール送信やプッシュ通知のロジックを実装
-        # 現在はプレースホルダー
-        
-        return True
+        return job["status"] == "completed"
     
     def create_automated_campaign(
         self,
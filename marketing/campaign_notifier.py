@@ -0,0 +1,453 @@
+"""
+キャンペーン通知の一斉送信
+送信対象の顧客をキーセットページネーションでページごとに読み、受信者ごとの本文をコンパイル済みのテンプレートで組み立て、
+接続を使い回すSMTPの送信プールからレートを制限して送る。
+
+メモリに載るのは1ページ分の顧客とメールだけのため、送信対象が数万人でも使用量は一定に保たれる。
+ページを送り終えるたびに進捗と再開位置をジョブ（campaign_notification_jobs）に記録し、
+中断・失敗したジョブは resume() で続きから送信する（記録前に中断したページは再送される）。
+"""
+import html
+import smtplib
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.mime.multipart import MIMEMultipart
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from api.database import Client, iter_keyset_pages
+from api.email_service import EmailService, get_email_service
+from api.logger import logger
+from api.utils import as_utc, format_currency, format_datetime_jp
+
+AUDIENCE_COLUMNS = "id, name, email, total_visits, last_visit, created_at"
+
+# セグメントの条件
+VIP_MIN_VISITS = 10
+DORMANT_DAYS = 90
+
+# テンプレートで使える差し込み項目
+TEMPLATE_FIELDS = ("name", "campaign_name", "description", "discount", "start_date", "end_date")
+
+DEFAULT_SUBJECT = "【キャンペーンのお知らせ】{campaign_name}"
+DEFAULT_BODY = """{name}様
+
+いつもご利用いただき、誠にありがとうございます。
+「{campaign_name}」を開催いたします。
+
+{description}
+
+特典: {discount}
+期間: {start_date} 〜 {end_date}
+
+皆様のご来店を心よりお待ちしております。"""
+
+HTML_LAYOUT = """
+<html>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+    <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+        <p>{body}</p>
+        <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
+        <p style="font-size: 12px; color: #999;">このメールは自動送信されています。</p>
+    </div>
+</body>
+</html>
+"""
+
+
+# ==================== 送信対象 ====================
+
+def _segment_predicates(now: datetime) -> Dict[str, Callable[[dict], bool]]:
+    """セグメント名 → 顧客の行に対する条件"""
+    dormant_before = now - timedelta(days=DORMANT_DAYS)
+    return {
+        # 来店のない顧客
+        "new": lambda customer: (customer.get("total_visits") or 0) == 0,
+        # 2回以上来店した顧客
+        "repeat": lambda customer: (customer.get("total_visits") or 0) >= 2,
+        # 来店回数の多い顧客
+        "vip": lambda customer: (customer.get("total_visits") or 0) >= VIP_MIN_VISITS,
+        # 最終来店から一定期間来店していない顧客
+        "dormant": lambda customer: bool(customer.get("last_visit")) and as_utc(customer["last_visit"]) < dormant_before
+    }
+
+
+class Audience:
+    """
+    キャンペーンの送信対象
+
+    - customer_ids（引数で指定した顧客、なければ target_audience の customer_ids）: 対象をこの顧客に限る
+    - new_customers_only: 来店のない顧客に限る（データベースで絞り込む）
+    - segments: いずれかのセグメントに該当する顧客に限る（ページごとにメモリ上で判定する）
+    """
+
+    def __init__(
+        self,
+        target_audience: Optional[dict],
+        customer_ids: Optional[List[str]] = None,
+        now: Optional[datetime] = None
+    ):
+        target_audience = target_audience or {}
+        customer_ids = customer_ids or target_audience.get("customer_ids")
+        # 顧客を指定した場合はIDの順に送る（再開位置は最後に送ったID）
+        self.customer_ids = sorted(set(customer_ids)) if customer_ids else None
+        self.new_customers_only = bool(target_audience.get("new_customers_only"))
+
+        predicates = _segment_predicates(now or datetime.now(timezone.utc))
+        segments = target_audience.get("segments") or []
+        unknown = [segment for segment in segments if segment not in predicates]
+        if unknown:
+            raise ValueError(f"不明なセグメントです: {', '.join(unknown)}")
+        self._segments = [predicates[segment] for segment in segments]
+
+    def _query(self, db: Client, shop_id: str):
+        query = db.table("customers").select(AUDIENCE_COLUMNS).eq("shop_id", shop_id).eq("is_active", True)
+        if self.new_customers_only:
+            query = query.eq("total_visits", 0)
+        return query
+
+    def _matches(self, customer: dict) -> bool:
+        return not self._segments or any(predicate(customer) for predicate in self._segments)
+
+    def pages(
+        self,
+        db: Client,
+        shop_id: str,
+        chunk_size: int,
+        cursor: Optional[list] = None
+    ) -> Iterator[Tuple[List[dict], list]]:
+        """
+        送信対象の顧客をページごとに取得
+
+        Yields:
+            (送信対象の顧客, このページの後から再開するための位置)
+        """
+        if self.customer_ids is not None:
+            remaining = [
+                customer_id for customer_id in self.customer_ids
+                if not cursor or customer_id > cursor[-1]
+            ]
+            for start in range(0, len(remaining), chunk_size):
+                chunk = remaining[start:start + chunk_size]
+                rows = self._query(db, shop_id).in_("id", chunk).execute().data or []
+                yield [row for row in rows if self._matches(row)], [chunk[-1]]
+            return
+
+        start_after = tuple(cursor) if cursor else None
+        pages = iter_keyset_pages(lambda: self._query(db, shop_id), "created_at", chunk_size, start_after)
+        for rows in pages:
+            yield [row for row in rows if self._matches(row)], [rows[-1]["created_at"], rows[-1]["id"]]
+
+
+# ==================== テンプレート ====================
+
+class NotificationTemplate:
+    """
+    差し込み項目（{name} など）を含む件名・本文のテンプレート
+
+    作成時に一度だけ解析して固定の文字列と差し込み項目の並びにし、受信者ごとの組み立ては連結だけで行う。
+    使えない項目を含む場合は送信を始める前に ValueError になる。
+    """
+
+    def __init__(self, source: str):
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(source):
+            if field is not None and (field not in TEMPLATE_FIELDS or format_spec or conversion):
+                raise ValueError(
+                    f"使用できない差し込み項目です: {{{field}}}（使用できる項目: {', '.join(TEMPLATE_FIELDS)}）"
+                )
+            self._parts.append((literal, field))
+
+    def render(self, values: Dict[str, str]) -> str:
+        return "".join(
+            literal + (values.get(field, "") if field else "")
+            for literal, field in self._parts
+        )
+
+
+def render_html(text: str) -> str:
+    """テキストの本文をHTMLのメール本文にする"""
+    return HTML_LAYOUT.format(body=html.escape(text).replace("\n", "<br>\n"))
+
+
+def campaign_values(campaign: dict) -> Dict[str, str]:
+    """キャンペーン共通の差し込み項目の値"""
+    tz = ZoneInfo(settings.CAMPAIGN_NOTIFY_TIMEZONE)
+    discount_value = campaign.get("discount_value") or 0
+    if campaign.get("discount_type") == "percentage":
+        discount = f"{discount_value}%OFF"
+    elif discount_value:
+        discount = f"{format_currency(discount_value)}OFF"
+    else:
+        discount = ""
+    return {
+        "campaign_name": campaign.get("name") or "",
+        "description": campaign.get("description") or "",
+        "discount": discount,
+        "start_date": format_datetime_jp(as_utc(campaign["start_date"]).astimezone(tz)),
+        "end_date": format_datetime_jp(as_utc(campaign["end_date"]).astimezone(tz))
+    }
+
+
+# ==================== 送信 ====================
+
+class RateLimiter:
+    """送信レートの制限（トークンバケット、複数のスレッドから呼べる）"""
+
+    def __init__(self, rate_per_second: float, burst: Optional[float] = None):
+        self.rate = rate_per_second
+        self.burst = burst if burst is not None else max(1.0, rate_per_second)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """1通分の送信枠が空くまで待つ"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 枠を先に確保してから待つ（後から来たスレッドはさらに後ろの枠を待つ）
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _quit(connection: smtplib.SMTP) -> None:
+    try:
+        connection.quit()
+    except Exception:
+        connection.close()
+
+
+class SMTPSenderPool:
+    """
+    SMTP接続を使い回す送信プール
+
+    ワーカースレッドごとにログイン済みの接続を保持し、messages_per_connection 通ごとにつなぎ直す。
+    送信中に切断された場合は1回だけつなぎ直して再送する。
+    受信者ごとのエラー（宛先の拒否など）は失敗として数え、認証エラーなど送信を続けられないエラーは送出する。
+    """
+
+    def __init__(
+        self,
+        email_service: EmailService,
+        size: int,
+        rate_limiter: RateLimiter,
+        messages_per_connection: int
+    ):
+        self.email_service = email_service
+        self.rate_limiter = rate_limiter
+        self.messages_per_connection = messages_per_connection
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="campaign-notify")
+        self._local = threading.local()
+        self._connections: Set[smtplib.SMTP] = set()
+        self._lock = threading.Lock()
+
+    def _connection(self) -> smtplib.SMTP:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.sent >= self.messages_per_connection:
+            self._discard()
+            connection = None
+        if connection is None:
+            connection = self.email_service.connect()
+            self._local.connection = connection
+            self._local.sent = 0
+            with self._lock:
+                self._connections.add(connection)
+        return connection
+
+    def _discard(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            self._local.connection = None
+            with self._lock:
+                self._connections.discard(connection)
+            _quit(connection)
+
+    def _send(self, message: MIMEMultipart) -> bool:
+        self.rate_limiter.acquire()
+        for attempt in range(2):
+            try:
+                self._connection().send_message(message)
+                self._local.sent += 1
+                return True
+            except smtplib.SMTPServerDisconnected:
+                self._discard()
+                if attempt:
+                    raise
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                logger.warning(
+                    "キャンペーン通知の送信に失敗しました: %s", e,
+                    extra={"to_email": message["To"]}
+                )
+                return False
+        return False
+
+    def send_all(self, messages: List[MIMEMultipart]) -> Tuple[int, int]:
+        """
+        メールをまとめて送信（すべて送り終えるまで待つ）
+
+        Returns:
+            (送信した数, 失敗した数)
+        """
+        results = list(self._executor.map(self._send, messages))
+        sent = sum(1 for result in results if result)
+        return sent, len(results) - sent
+
+    def close(self) -> None:
+        """ワーカーを止めて接続を閉じる"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            _quit(connection)
+
+
+# ==================== ジョブ ====================
+
+class CampaignNotifier:
+    """キャンペーン通知の一斉送信ジョブの実行"""
+
+    def __init__(
+        self,
+        db: Client,
+        email_service: Optional[EmailService] = None,
+        chunk_size: Optional[int] = None,
+        pool_size: Optional[int] = None,
+        rate_per_second: Optional[float] = None,
+        messages_per_connection: Optional[int] = None
+    ):
+        self.db = db
+        self.email_service = email_service or get_email_service()
+        self.chunk_size = chunk_size or settings.CAMPAIGN_NOTIFY_CHUNK_SIZE
+        self.pool_size = pool_size or settings.CAMPAIGN_NOTIFY_POOL_SIZE
+        self.rate_per_second = rate_per_second or settings.CAMPAIGN_NOTIFY_RATE_PER_SECOND
+        self.messages_per_connection = messages_per_connection or settings.CAMPAIGN_NOTIFY_MESSAGES_PER_CONNECTION
+
+    def _campaign(self, campaign_id: str, shop_id: Optional[str] = None) -> dict:
+        query = self.db.table("campaigns").select("*").eq("id", campaign_id)
+        if shop_id is not None:
+            query = query.eq("shop_id", shop_id)
+        result = query.limit(1).execute()
+        if not result.data:
+            raise ValueError("キャンペーンが見つかりません")
+        return result.data[0]
+
+    def start(
+        self,
+        campaign_id: str,
+        customer_ids: Optional[List[str]] = None,
+        subject: Optional[str] = None,
+        body: Optional[str] = None
+    ) -> dict:
+        """
+        送信ジョブを作成して送信
+
+        テンプレートと送信対象の条件は、ジョブを作成する前に検証する（不正な場合は ValueError）。
+
+        Returns:
+            送信を終えた（または失敗した）ジョブの行
+        """
+        campaign = self._campaign(campaign_id)
+        subject = subject or DEFAULT_SUBJECT
+        body = body or DEFAULT_BODY
+        NotificationTemplate(subject)
+        NotificationTemplate(body)
+        Audience(campaign.get("target_audience"), customer_ids)
+
+        job = self.db.table("campaign_notification_jobs").insert({
+            "shop_id": campaign.get("shop_id"),
+            "campaign_id": campaign_id,
+            "subject": subject,
+            "body": body,
+            "customer_ids": customer_ids or None
+        }).execute().data[0]
+        return self._run(job, campaign)
+
+    def resume(self, job_id: str) -> dict:
+        """中断・失敗したジョブを再開位置の次の顧客から送信"""
+        result = self.db.table("campaign_notification_jobs").select("*").eq("id", job_id).limit(1).execute()
+        if not result.data:
+            raise ValueError("送信ジョブが見つかりません")
+        job = result.data[0]
+        if job["status"] == "completed":
+            return job
+        return self._run(job, self._campaign(job["campaign_id"], job.get("shop_id")))
+
+    def _update_job(self, job: dict, changes: dict) -> dict:
+        changes["updated_at"] = datetime.now(timezone.utc).isoformat()
+        result = self.db.table("campaign_notification_jobs").update(changes).eq("id", job["id"]).execute()
+        return result.data[0] if result.data else {**job, **changes}
+
+    def _run(self, job: dict, campaign: dict) -> dict:
+        if not self.email_service.enabled:
+            return self._fail(job, "メール送信が無効です（SMTPの設定を確認してください）")
+
+        subject_template = NotificationTemplate(job["subject"])
+        body_template = NotificationTemplate(job["body"])
+        audience = Audience(campaign.get("target_audience"), job.get("customer_ids"))
+        values = campaign_values(campaign)
+        counts = {
+            "sent_count": job.get("sent_count") or 0,
+            "failed_count": job.get("failed_count") or 0,
+            "skipped_count": job.get("skipped_count") or 0
+        }
+        job = self._update_job(job, {"status": "running", "last_error": None})
+
+        pool = SMTPSenderPool(
+            self.email_service,
+            self.pool_size,
+            RateLimiter(self.rate_per_second),
+            self.messages_per_connection
+        )
+        try:
+            for customers, cursor in audience.pages(self.db, job["shop_id"], self.chunk_size, job.get("cursor")):
+                messages = []
+                for customer in customers:
+                    if not customer.get("email"):
+                        counts["skipped_count"] += 1
+                        continue
+                    recipient_values = {**values, "name": customer.get("name") or "お客様"}
+                    text = body_template.render(recipient_values)
+                    messages.append(self.email_service.build_message(
+                        customer["email"],
+                        subject_template.render(recipient_values),
+                        render_html(text),
+                        text
+                    ))
+                sent, failed = pool.send_all(messages)
+                counts["sent_count"] += sent
+                counts["failed_count"] += failed
+                job = self._update_job(job, {**counts, "cursor": cursor})
+                logger.info(
+                    "キャンペーン通知を送信中です",
+                    extra={"job_id": job["id"], "campaign_id": job["campaign_id"], **counts}
+                )
+        except Exception as e:
+            return self._fail(job, f"{type(e).__name__}: {e}")
+        finally:
+            pool.close()
+
+        job = self._update_job(job, {"status": "completed", "finished_at": datetime.now(timezone.utc).isoformat()})
+        logger.info(
+            "キャンペーン通知の送信が完了しました",
+            extra={"job_id": job["id"], "campaign_id": job["campaign_id"], **counts}
+        )
+        return job
+
+    def _fail(self, job: dict, error: str) -> dict:
+        logger.error(
+            f"キャンペーン通知の送信に失敗しました: {error}",
+            extra={"job_id": job["id"], "campaign_id": job["campaign_id"]}
+        )
+        return self._update_job(job, {"status": "failed", "last_error": error})
@@ -0,0 +1,320 @@
+"""
+キャンペーンスケジューラー
+未開始・実施中のキャンペーンの開始・終了日時を最小ヒープに保持し、日時になったキャンペーンだけを
+個別に状態遷移させる（全店舗のキャンペーンへの一括更新を定期実行しない）
+
+実施中のキャンペーンは店舗ごとの一覧として保持し、アクティブなキャンペーン一覧APIはこの一覧を返す。
+他のプロセスでの変更は resync_seconds ごとの再読み込みで反映する。
+遷移の更新は状態と日時を条件にしているため、複数のプロセスが同じ遷移を実行しても結果は変わらない。
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from api.database import Client
+from api.logger import logger
+from api.models import CampaignStatus
+from api.promotions import promotion_cache
+from api.utils import as_utc
+
+START = "start"
+END = "end"
+
+# (日時, 登録順, 遷移, キャンペーンID)
+Event = Tuple[datetime, int, str, str]
+
+
+class CampaignScheduler:
+    """
+    キャンペーンの開始・終了のスケジューラー
+
+    - ヒープの先頭（最も近い日時）だけを見て、日時になった遷移を実行する
+    - キャンペーンの更新で日時が変わった場合は新しいイベントを追加し、古いイベントは実行時に読み捨てる
+    - load() が一度も成功していない場合、active_campaigns() はNoneを返す（呼び出し側でデータベースから取得する）
+    - 実施中の一覧は active_max_age 秒ごとに店舗単位でデータベースから読み直す
+      （他のプロセスで停止・終了・編集されたキャンペーンを再読み込みの間隔より早く反映する）
+    """
+
+    def __init__(
+        self,
+        db_factory: Callable[[], Client],
+        resync_seconds: float,
+        active_max_age: Optional[float] = None
+    ):
+        self._db_factory = db_factory
+        self.resync_seconds = resync_seconds
+        self.active_max_age = active_max_age
+        self._heap: List[Event] = []
+        self._sequence = itertools.count()
+        # キャンペーンID → 行（未開始・実施中のもの）
+        self._campaigns: Dict[str, dict] = {}
+        # 店舗ID → キャンペーンID → 実施中のキャンペーンの行
+        self._active: Dict[str, Dict[str, dict]] = {}
+        # 実施中の一覧を読み込んだ時刻（time.monotonic()、店舗単位で読み直した場合は店舗ごと）
+        self._loaded_at = 0.0
+        self._active_loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    # ==================== 状態の管理 ====================
+
+    def load(self) -> None:
+        """
+        未開始・実施中のキャンペーンを読み込み、ヒープと実施中の一覧を作り直す
+
+        終了日時を過ぎたものも読み込む（前回の実行から再起動・cronの実行までの間に終了日時を迎えたものは
+        過去の日時の終了イベントになり、次の run_due() ですぐに終了する）
+        """
+        now = datetime.now(timezone.utc)
+        result = self._db_factory().table("campaigns").select("*").in_(
+            "status", [CampaignStatus.DRAFT.value, CampaignStatus.ACTIVE.value]
+        ).eq("is_active", True).execute()
+
+        with self._lock:
+            self._heap = []
+            self._campaigns = {}
+            self._active = {}
+            for row in result.data or []:
+                self._track(row, now)
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+            self._active_loaded_at = {}
+        self._notify()
+
+    def track(self, row: dict) -> None:
+        """
+        作成・更新されたキャンペーンの行を反映
+
+        キャンペーンAPIの書き込みの後に呼び、開始・終了のイベントと実施中の一覧を更新する。
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            self._forget(row["id"])
+            self._track(row, datetime.now(timezone.utc))
+        self._notify()
+
+    def _track(self, row: dict, now: datetime) -> None:
+        if not row.get("is_active"):
+            return
+        status = row.get("status")
+        start = as_utc(row["start_date"])
+        end = as_utc(row["end_date"])
+        if status == CampaignStatus.DRAFT.value:
+            self._campaigns[row["id"]] = row
+            self._push(start, START, row["id"])
+        elif status == CampaignStatus.ACTIVE.value:
+            self._campaigns[row["id"]] = row
+            self._push(end, END, row["id"])
+            if start <= now <= end:
+                self._active.setdefault(row["shop_id"], {})[row["id"]] = row
+            elif now < start:
+                # 開始日時前に有効化されたキャンペーンは開始日時に一覧へ加える
+                self._push(start, START, row["id"])
+
+    def _forget(self, campaign_id: str) -> None:
+        row = self._campaigns.pop(campaign_id, None)
+        if row is not None:
+            self._active.get(row["shop_id"], {}).pop(campaign_id, None)
+
+    def _push(self, when: datetime, action: str, campaign_id: str) -> None:
+        heapq.heappush(self._heap, (when, next(self._sequence), action, campaign_id))
+
+    def _notify(self) -> None:
+        # load() はスレッドから呼ばれるため、イベントループ経由で起こす
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def active_campaigns(self, shop_id: str) -> Optional[List[dict]]:
+        """
+        店舗の実施中のキャンペーン（読み込み前はNone）
+
+        一覧が active_max_age 秒より古い場合は店舗の分をデータベースから読み直し、
+        終了のイベントの実行前でも期間外になったものは返さない
+        """
+        with self._lock:
+            if not self._loaded:
+                return None
+            loaded_at = self._active_loaded_at.get(shop_id, self._loaded_at)
+            stale = self.active_max_age is not None and time.monotonic() - loaded_at > self.active_max_age
+            rows = list(self._active.get(shop_id, {}).values())
+        if stale:
+            rows = self._reload_active(shop_id)
+        now = datetime.now(timezone.utc)
+        return [row for row in rows if as_utc(row["start_date"]) <= now <= as_utc(row["end_date"])]
+
+    def _reload_active(self, shop_id: str) -> List[dict]:
+        """店舗の実施中のキャンペーンをデータベースから読み直す"""
+        now = datetime.now(timezone.utc).isoformat()
+        loaded_at = time.monotonic()
+        result = self._db_factory().table("campaigns").select("*").eq("shop_id", shop_id).eq(
+            "status", CampaignStatus.ACTIVE.value
+        ).eq("is_active", True).lte("start_date", now).gte("end_date", now).execute()
+        rows = result.data or []
+        with self._lock:
+            self._active[shop_id] = {row["id"]: row for row in rows}
+            self._active_loaded_at[shop_id] = loaded_at
+        return rows
+
+    def next_run_at(self) -> Optional[datetime]:
+        """次に遷移を実行する日時"""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    # ==================== 遷移の実行 ====================
+
+    def run_due(self, now: Optional[datetime] = None) -> int:
+        """
+        日時になった開始・終了を実行
+
+        Returns:
+            状態を変更したキャンペーンの数
+        """
+        now = now or datetime.now(timezone.utc)
+        changed = 0
+        # 開始と同時に終了日時も過ぎているキャンペーンは、開始後に追加される終了イベントも続けて実行する
+        while True:
+            due = self._pop_due(now)
+            if not due:
+                return changed
+            changed += self._run_events(due, now)
+
+    def _pop_due(self, now: datetime) -> List[Tuple[str, dict]]:
+        """日時になったイベントをヒープから取り出す"""
+        due: List[Tuple[str, dict]] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, _, action, campaign_id = heapq.heappop(self._heap)
+                row = self._campaigns.get(campaign_id)
+                # 更新で日時・状態が変わったキャンペーンの古いイベントは読み捨てる
+                if row is None:
+                    continue
+                if action == START and as_utc(row["start_date"]) != when:
+                    continue
+                if action == END and as_utc(row["end_date"]) != when:
+                    continue
+                due.append((action, row))
+        return due
+
+    def _run_events(self, due: List[Tuple[str, dict]], now: datetime) -> int:
+        changed = 0
+        for action, row in due:
+            updated = self._transition(action, row, now)
+            if updated is not None:
+                changed += 1
+            with self._lock:
+                if self._campaigns.get(row["id"]) is not row:
+                    # 遷移の実行中にAPIから更新された場合はその内容を優先する
+                    continue
+                self._forget(row["id"])
+                self._track(updated or self._expected(action, row), now)
+            promotion_cache.invalidate(row["shop_id"])
+        return changed
+
+    def _transition(self, action: str, row: dict, now: datetime) -> Optional[dict]:
+        """1件のキャンペーンの状態を遷移させる（既に遷移済みの場合はNone）"""
+        db = self._db_factory()
+        if action == START:
+            if row["status"] != CampaignStatus.DRAFT.value:
+                return None
+            result = db.table("campaigns").update({
+                "status": CampaignStatus.ACTIVE.value,
+                "updated_at": now.isoformat()
+            }).eq("id", row["id"]).eq("status", CampaignStatus.DRAFT.value).lte(
+                "start_date", now.isoformat()
+            ).execute()
+        else:
+            result = db.table("campaigns").update({
+                "status": CampaignStatus.ENDED.value,
+                "is_active": False,
+                "updated_at": now.isoformat()
+            }).eq("id", row["id"]).in_(
+                "status", [CampaignStatus.DRAFT.value, CampaignStatus.ACTIVE.value]
+            ).lte("end_date", now.isoformat()).execute()
+        if result.data:
+            logger.info(
+                "キャンペーンの状態を更新しました",
+                extra={"campaign_id": row["id"], "shop_id": row["shop_id"], "status": result.data[0]["status"]}
+            )
+            return result.data[0]
+        return None
+
+    @staticmethod
+    def _expected(action: str, row: dict) -> dict:
+        """他のプロセスで遷移済みだった場合に、遷移後の状態として扱う行"""
+        if action == START:
+            return {**row, "status": CampaignStatus.ACTIVE.value}
+        return {**row, "status": CampaignStatus.ENDED.value, "is_active": False}
+
+    # ==================== バックグラウンド実行 ====================
+
+    async def _run(self) -> None:
+        next_resync = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if loop.time() >= next_resync:
+                    await asyncio.to_thread(self.load)
+                    next_resync = loop.time() + self.resync_seconds
+                await asyncio.to_thread(self.run_due)
+            except Exception as e:
+                logger.error(f"キャンペーンスケジューラーでエラーが発生しました: {str(e)}")
+                next_resync = loop.time() + min(self.resync_seconds, 60)
+
+            timeout = next_resync - loop.time()
+            next_run_at = self.next_run_at()
+            if next_run_at is not None:
+                timeout = min(timeout, (next_run_at - datetime.now(timezone.utc)).total_seconds())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """バックグラウンドでの実行を開始（実行中のイベントループから呼ぶ）"""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """バックグラウンドでの実行を停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+            self._loop = None
+
+
+def _default_db() -> Client:
+    from api.supabase_client import supabase
+    return supabase
+
+
+# APIプロセスで使うスケジューラー
+# 実施中の一覧はクーポン・キャンペーンのルールのキャッシュと同じ秒数で読み直す
+campaign_scheduler = CampaignScheduler(
+    _default_db,
+    settings.CAMPAIGN_SCHEDULER_RESYNC_SECONDS,
+    active_max_age=settings.PROMOTION_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,38 @@
+"""
+顧客来店統計バックフィルスクリプト
+完了済み予約から全顧客の total_visits / last_visit を一括で再計算
+"""
+import sys
+import os
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.supabase_client import supabase
+from api.logger import logger
+
+
+def backfill_customer_visits(shop_id: str = None):
+    """
+    顧客の来店統計を再計算
+
+    予約テーブルをデータベース側で1回だけ集計して更新するため、
+    顧客ごとのクエリは発生しない。
+
+    Args:
+        shop_id: 対象の店舗ID（省略時は全店舗）
+    """
+    target = f"店舗 {shop_id}" if shop_id else "全店舗"
+    logger.info(f"顧客来店統計のバックフィルを開始します（{target}）")
+
+    try:
+        result = supabase.rpc("backfill_customer_visit_stats", {"p_shop_id": shop_id}).execute()
+        updated_count = result.data[0]["updated_count"] if result.data else 0
+        logger.info(f"顧客来店統計のバックフィルが完了しました: 更新 {updated_count}件")
+    except Exception as e:
+        logger.error(f"顧客来店統計のバックフィル中にエラーが発生しました: {str(e)}")
+
+
+if __name__ == "__main__":
+    shop = sys.argv[1] if len(sys.argv) > 1 else None
+    backfill_customer_visits(shop)
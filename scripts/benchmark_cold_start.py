@@ -0,0 +1,213 @@
+"""
+コールドスタートのベンチマーク
+新しいPythonプロセスで `-X importtime` を有効にしてVercelのエントリーポイント（api.index）を読み込み、
+モジュールごとの読み込み時間と最初のリクエスト（/health）までの時間を計測します
+
+読み込みと最初のリクエストの合計（中央値）が目標値を超えた場合、または
+コールドスタートで読み込まないはずの重いモジュールが読み込まれた場合は終了コード1を返します
+
+使い方:
+    python scripts/benchmark_cold_start.py
+    python scripts/benchmark_cold_start.py --runs 10 --top 30 --budget-ms 1500 --output cold_start.json
+"""
+import sys
+import os
+import argparse
+import json
+import statistics
+import subprocess
+import time
+from typing import Dict, List, Tuple
+
+# プロジェクトルートをパスに追加
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+# 読み込みと最初のリクエストの合計時間の目標値（ミリ秒）
+COLD_START_BUDGET_MS = 1800
+
+# コールドスタートで読み込まない（初回利用時まで遅延する）モジュール
+DEFERRED_MODULES = (
+    "supabase",
+    "postgrest",
+    "jose",
+    "passlib",
+    "asyncpg",
+    "ai.recommendation_engine",
+    "marketing",
+)
+
+RESULT_MARKER = "COLD_START_RESULT "
+
+# 子プロセスで実行するコード（アプリを読み込み、ASGIで/healthを1回呼び出す）
+CHILD_CODE = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+from api.index import app
+imported = time.perf_counter()
+
+async def first_request():
+    messages = []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/health", "raw_path": b"/health",
+        "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        messages.append(message)
+    await app(scope, receive, send)
+    return messages[0]["status"]
+
+status = asyncio.run(first_request())
+done = time.perf_counter()
+print(%r + json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (done - imported) * 1000,
+    "status": status,
+    "deferred_loaded": [name for name in %r if name in sys.modules],
+}), flush=True)
+""" % (RESULT_MARKER, DEFERRED_MODULES)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """
+    `-X importtime` の出力を解析
+
+    Returns:
+        (モジュール名, 階層の深さ, 自身の時間[us], 累積時間[us]) のリスト
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = fields
+        # モジュール名の前の空白（先頭の1文字を除く）2文字ごとに1階層
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        modules.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def run_once(python: str) -> dict:
+    """新しいプロセスでアプリを読み込み、計測結果を返す"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = PROJECT_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [python, "-X", "importtime", "-c", CHILD_CODE],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    result_line = next(
+        (line for line in completed.stdout.splitlines() if line.startswith(RESULT_MARKER)), None
+    )
+    if completed.returncode != 0 or result_line is None:
+        errors = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError("アプリの読み込みに失敗しました:\n" + "\n".join(errors[-20:]))
+
+    result = json.loads(result_line[len(RESULT_MARKER):])
+    result["process_ms"] = wall_ms
+    result["modules"] = parse_importtime(completed.stderr)
+    return result
+
+
+def summarize_modules(runs: List[dict]) -> Dict[str, dict]:
+    """モジュールごとの自身・累積時間の中央値（ミリ秒）"""
+    samples: Dict[str, dict] = {}
+    for run in runs:
+        for name, depth, self_us, cumulative_us in run["modules"]:
+            entry = samples.setdefault(name, {"depth": depth, "self": [], "cumulative": []})
+            entry["self"].append(self_us / 1000)
+            entry["cumulative"].append(cumulative_us / 1000)
+    return {
+        name: {
+            "depth": entry["depth"],
+            "self_ms": statistics.median(entry["self"]),
+            "cumulative_ms": statistics.median(entry["cumulative"]),
+        }
+        for name, entry in samples.items()
+    }
+
+
+def summarize_packages(modules: Dict[str, dict]) -> List[Tuple[str, float]]:
+    """トップレベルのパッケージごとの自身の時間の合計（ミリ秒、降順）"""
+    totals: Dict[str, float] = {}
+    for name, entry in modules.items():
+        package = name.split(".", 1)[0]
+        totals[package] = totals.get(package, 0.0) + entry["self_ms"]
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def print_report(summary: dict, modules: Dict[str, dict], top: int):
+    print("=" * 72)
+    print(f"  コールドスタート（{summary['runs']}回の中央値）")
+    print("=" * 72)
+    print(f"プロセス全体:          {summary['process_ms']:>8.1f} ms")
+    print(f"api.index の読み込み:  {summary['import_ms']:>8.1f} ms")
+    print(f"最初のリクエスト:      {summary['first_request_ms']:>8.1f} ms")
+    print(f"読み込み＋初回:        {summary['cold_start_ms']:>8.1f} ms  （目標 {summary['budget_ms']} ms）")
+
+    print(f"\n累積時間の上位{top}モジュール")
+    print(f"{'累積(ms)':>10}{'自身(ms)':>10}  モジュール")
+    ranked = sorted(modules.items(), key=lambda item: item[1]["cumulative_ms"], reverse=True)
+    for name, entry in ranked[:top]:
+        print(f"{entry['cumulative_ms']:>10.1f}{entry['self_ms']:>10.1f}  {'  ' * entry['depth']}{name}")
+
+    print(f"\n自身の時間の上位{top}モジュール")
+    ranked = sorted(modules.items(), key=lambda item: item[1]["self_ms"], reverse=True)
+    for name, entry in ranked[:top]:
+        print(f"{entry['self_ms']:>10.1f}  {name}")
+
+    print("\nパッケージ別（自身の時間の合計）")
+    for package, total in summarize_packages(modules)[:top]:
+        print(f"{total:>10.1f}  {package}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="コールドスタート（モジュール読み込み時間）のベンチマーク")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数（中央値を採用）")
+    parser.add_argument("--top", type=int, default=25, help="表示するモジュール数")
+    parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS,
+                        help="読み込み＋最初のリクエストの目標時間（ミリ秒）")
+    parser.add_argument("--python", default=sys.executable, help="計測に使うPythonインタプリタ")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.python) for _ in range(args.runs)]
+    modules = summarize_modules(runs)
+    summary = {
+        "runs": args.runs,
+        "budget_ms": args.budget_ms,
+        "process_ms": statistics.median(run["process_ms"] for run in runs),
+        "import_ms": statistics.median(run["import_ms"] for run in runs),
+        "first_request_ms": statistics.median(run["first_request_ms"] for run in runs),
+        "cold_start_ms": statistics.median(run["import_ms"] + run["first_request_ms"] for run in runs),
+    }
+    print_report(summary, modules, args.top)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "modules": modules}, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を保存しました: {args.output}")
+
+    failed = False
+    deferred_loaded = sorted({name for run in runs for name in run["deferred_loaded"]})
+    if deferred_loaded:
+        print(f"\n[NG] コールドスタートで遅延対象のモジュールが読み込まれています: {', '.join(deferred_loaded)}")
+        failed = True
+    if summary["cold_start_ms"] > args.budget_ms:
+        print(f"\n[NG] 目標時間を超えています: {summary['cold_start_ms']:.1f} ms > {args.budget_ms} ms")
+        failed = True
+    if not failed:
+        print(f"\n[OK] 目標時間内です: {summary['cold_start_ms']:.1f} ms <= {args.budget_ms} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+重いクエリのベンチマーク（PostgREST経由と直接接続の比較）
+空き枠・人気サービス・人気商品・顧客サマリーの同じワークロードを、
+PostgREST経由（SUPABASE_URL）とasyncpgの接続プール経由（DATABASE_URL）の両方で実行し、
+クエリごとのレイテンシと結果の一致を比較します
+
+DATABASE_URLが未設定の場合はPostgREST経由のみ計測します。
+--backend memory を指定するとインメモリクライアントを使い、外部サービスなしでPostgREST経由の処理を計測します。
+
+使い方:
+    # データを投入して両方の経路を計測
+    python scripts/benchmark_db_paths.py --customers 10000 --reservations 100000
+
+    # 投入済みのデータで計測し、結果を保存
+    python scripts/benchmark_db_paths.py --skip-seed --iterations 200 --output db_paths.json
+"""
+import sys
+import os
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from scripts.benchmark_load import BENCHMARK_SHOP_ID, get_backend, load_context, percentile, seed_data
+
+# (クエリ名, 実行する関数, 比較用に結果を正規化する関数)
+Query = Tuple[str, Callable[[Any], Awaitable[Any]], Callable[[Any], Any]]
+
+
+class PostgrestOnlyPool:
+    """常にPostgRESTへフォールバックさせるための接続プールの代わり"""
+
+    async def fetch(self, name: str, sql: str, *args: Any):
+        return None
+
+
+def _ids(rows: List[dict]) -> List[str]:
+    return [row["id"] for row in rows]
+
+
+def _summary_key(summary: dict) -> Any:
+    if not summary:
+        return None
+    return (summary.get("order_stats"), summary.get("reservation_stats"),
+            [r["id"] for r in summary.get("recent_reservations") or []])
+
+
+def build_workload(ctx, iterations: int, rng: random.Random, include_summary: bool = True) -> List[Query]:
+    """
+    両方の経路で同じ順序・同じ引数で実行するクエリ列
+
+    インメモリクライアントにはget_customer_summary関数がないため、include_summary=Falseで顧客サマリーを除く
+    """
+    workload: List[Query] = []
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(iterations):
+        day = today + timedelta(days=rng.randrange(0, 14))
+        start, end = day.replace(hour=9), day.replace(hour=20)
+        stylist_id = rng.choice(ctx.stylist_ids + [None])
+        customer_id = rng.choice(ctx.customer_ids)
+        workload.extend([
+            ("booked_reservation_times",
+             lambda repo, s=start, e=end, st=stylist_id: repo.booked_reservation_times(s, e, stylist_id=st),
+             sorted),
+            ("popular_services", lambda repo: repo.popular_services(5), _ids),
+            ("popular_products", lambda repo: repo.popular_products(5), _ids),
+        ])
+        if include_summary:
+            workload.append((
+                "customer_summary",
+                lambda repo, c=customer_id: repo.customer_summary(ctx.shop_id, c, 5),
+                _summary_key
+            ))
+    return workload
+
+
+async def run_path(repository, workload: List[Query]) -> Tuple[Dict[str, List[float]], List[Any]]:
+    """ワークロードを順に実行し、クエリごとの所要時間（ミリ秒）と正規化した結果を返す"""
+    durations: Dict[str, List[float]] = {}
+    results = []
+    for name, run, normalize in workload:
+        started = time.perf_counter()
+        result = await run(repository)
+        durations.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+        results.append(normalize(result))
+    return durations, results
+
+
+def summarize(durations: Dict[str, List[float]]) -> Dict[str, dict]:
+    return {
+        name: {
+            "count": len(samples),
+            "mean_ms": statistics.fmean(samples),
+            "p50_ms": percentile(samples, 0.50),
+            "p95_ms": percentile(samples, 0.95),
+            "max_ms": max(samples),
+        }
+        for name, samples in durations.items()
+    }
+
+
+def print_report(paths: Dict[str, Dict[str, dict]]):
+    print("=" * 78)
+    print(f"{'クエリ':<28}{'経路':<12}{'件数':>6}{'平均(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+    print("-" * 78)
+    names = sorted({name for summary in paths.values() for name in summary})
+    for name in names:
+        for path, summary in paths.items():
+            if name in summary:
+                s = summary[name]
+                print(f"{name:<28}{path:<12}{s['count']:>6}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}")
+    print("=" * 78)
+
+
+async def main_async(args) -> int:
+    if args.backend == "memory" and args.skip_seed:
+        print("--backend memory は --skip-seed と併用できません")
+        return 2
+
+    db = get_backend(args.backend)
+    from api.pg_pool import postgres_pool
+    from api.repositories import AnalyticsRepository
+    rng = random.Random(args.seed)
+
+    if args.skip_seed:
+        ctx = load_context(db, args.shop_id)
+    else:
+        print(f"データを投入しています（顧客 {args.customers}件 / 予約 {args.reservations}件）...")
+        started = time.perf_counter()
+        ctx = seed_data(db, args.shop_id, args.customers, args.reservations, rng)
+        print(f"投入完了: {time.perf_counter() - started:.1f}秒")
+
+    include_summary = args.backend != "memory"
+    workload = build_workload(ctx, args.iterations, rng, include_summary)
+    warmup = build_workload(ctx, args.warmup, random.Random(args.seed + 1), include_summary)
+
+    repositories = {"postgrest": AnalyticsRepository(db, pool=PostgrestOnlyPool())}
+    if await postgres_pool.get_pool() is not None:
+        repositories["postgres"] = AnalyticsRepository(db, pool=postgres_pool)
+    else:
+        print("DATABASE_URLが未設定か接続できないため、PostgREST経由のみ計測します")
+
+    paths: Dict[str, Dict[str, dict]] = {}
+    outputs: Dict[str, List[Any]] = {}
+    try:
+        for path, repository in repositories.items():
+            await run_path(repository, warmup)
+            durations, outputs[path] = await run_path(repository, workload)
+            paths[path] = summarize(durations)
+    finally:
+        await postgres_pool.close()
+
+    print_report(paths)
+
+    mismatches = 0
+    if len(outputs) == 2:
+        for (name, _, _), left, right in zip(workload, outputs["postgrest"], outputs["postgres"]):
+            if left != right:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"[NG] 結果が一致しません: {name}")
+        if not mismatches:
+            print("両方の経路で結果が一致しました")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "iterations": args.iterations,
+                "statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE,
+                "paths": paths,
+                "mismatches": mismatches
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+    return 1 if mismatches else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="重いクエリのPostgREST経由と直接接続の比較")
+    parser.add_argument("--backend", choices=["supabase", "memory"], default="supabase",
+                        help="supabase: SUPABASE_URLのPostgREST / memory: インメモリクライアント")
+    parser.add_argument("--shop-id", default=BENCHMARK_SHOP_ID, help="ベンチマーク用の店舗ID")
+    parser.add_argument("--customers", type=int, default=10_000, help="投入する顧客数")
+    parser.add_argument("--reservations", type=int, default=100_000, help="投入する予約数")
+    parser.add_argument("--skip-seed", action="store_true", help="データ投入を行わず既存データを使用")
+    parser.add_argument("--iterations", type=int, default=100, help="ワークロードの繰り返し回数")
+    parser.add_argument("--warmup", type=int, default=5, help="計測前のウォームアップ回数")
+    parser.add_argument("--seed", type=int, default=42, help="乱数シード（同じ値なら同じクエリ列）")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main_async(parse_args())))
@@ -0,0 +1,425 @@
+"""
+負荷試験ベンチマーク
+店舗データ（顧客1万件・予約10万件）を投入し、空き状況・予約作成・一覧取得・注文作成を
+混在させたリクエストを固定の同時実行数で送り、ルートごとのスループットとレイテンシを計測します
+
+バックエンドは環境変数 SUPABASE_URL / SUPABASE_KEY のPostgREST（ローカルのSupabase/PostgREST
+コンテナを想定）を使用します。本番環境のプロジェクトに対して実行しないでください。
+--backend memory を指定するとインメモリクライアントを使い、外部サービスなしで実行します。
+
+使い方:
+    # データを投入してアプリをプロセス内で計測
+    python scripts/benchmark_load.py --requests 2000 --concurrency 16
+
+    # 外部サービスなしで計測（インメモリクライアント）
+    python scripts/benchmark_load.py --backend memory
+
+    # 起動済みのサーバーに対して計測し、結果を保存
+    python scripts/benchmark_load.py --base-url http://localhost:8000 --skip-seed --output results.json
+
+    # 前回の結果と比較し、悪化していれば終了コード1
+    python scripts/benchmark_load.py --skip-seed --baseline results.json --max-regression 0.2
+"""
+import sys
+import os
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from config import settings
+
+API_V1 = settings.API_V1_PREFIX
+BENCHMARK_SHOP_ID = "benchmark_shop"
+SEED_BATCH_SIZE = 1000
+
+LAST_NAMES = ["佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤"]
+FIRST_NAMES = ["陽菜", "結衣", "蓮", "湊", "葵", "陽翔", "凛", "樹", "美咲", "大翔"]
+SERVICE_MENU = [
+    ("カット", "cut", 60, 4400), ("カット＋カラー", "color", 120, 9900),
+    ("カラー", "color", 90, 6600), ("パーマ", "perm", 120, 8800),
+    ("トリートメント", "care", 30, 3300), ("ヘッドスパ", "care", 45, 4400),
+    ("縮毛矯正", "perm", 180, 16500), ("前髪カット", "cut", 15, 1100),
+]
+
+
+class BenchmarkContext:
+    """シナリオが参照する投入済みデータのID"""
+
+    def __init__(self, shop_id: str):
+        self.shop_id = shop_id
+        self.customer_ids: List[str] = []
+        self.service_ids: List[str] = []
+        self.stylist_ids: List[str] = []
+        self.products: List[dict] = []
+        self.headers: Dict[str, str] = {}
+
+
+# ==================== データ投入 ====================
+
+def _insert_batches(db, table: str, rows: List[dict]) -> None:
+    for start in range(0, len(rows), SEED_BATCH_SIZE):
+        db.table(table).insert(rows[start:start + SEED_BATCH_SIZE]).execute()
+
+
+def seed_data(db, shop_id: str, customers: int, reservations: int, rng: random.Random) -> BenchmarkContext:
+    """
+    ベンチマーク用の店舗データを投入
+
+    予約は過去180日〜今後14日の営業時間内に分布させ、過去分は大半を来店済みとする。
+    IDはクライアント側で採番し、投入後の読み直しを行わない。
+    """
+    ctx = BenchmarkContext(shop_id)
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    created_at = now.isoformat()
+
+    db.table("shops").upsert({
+        "id": shop_id,
+        "name": "ベンチマーク店",
+        "email": f"{shop_id}@example.com",
+        "admin_email": f"{shop_id}@example.com",
+        # ログインは行わずトークンを直接発行するため、照合できないダミー値を入れる
+        "password_hash": "!benchmark",
+        "is_active": True
+    }).execute()
+
+    stylists = [{
+        "id": str(uuid.uuid4()), "shop_id": shop_id, "name": f"スタイリスト{i + 1}",
+        "specialty": rng.choice(["cut", "color", "perm"]), "is_active": True
+    } for i in range(8)]
+    services = [{
+        "id": str(uuid.uuid4()), "shop_id": shop_id, "name": name, "category": category,
+        "duration_minutes": duration, "price": price, "display_order": i, "is_active": True
+    } for i, (name, category, duration, price) in enumerate(SERVICE_MENU)]
+    products = [{
+        "id": str(uuid.uuid4()), "shop_id": shop_id, "name": f"ヘアケア商品{i + 1}",
+        "category": rng.choice(["shampoo", "treatment", "styling"]),
+        "price": rng.choice([1650, 2750, 3850, 4950]), "stock_quantity": 1_000_000, "is_active": True
+    } for i in range(30)]
+    _insert_batches(db, "stylists", stylists)
+    _insert_batches(db, "services", services)
+    _insert_batches(db, "products", products)
+
+    customer_rows = []
+    for i in range(customers):
+        name = f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}"
+        customer_rows.append({
+            "id": str(uuid.uuid4()), "shop_id": shop_id, "name": name,
+            "email": f"customer{i}@{shop_id}.example.com",
+            "phone": f"090{rng.randrange(10**8):08d}",
+            "total_visits": 0, "is_active": True, "created_at": created_at
+        })
+    _insert_batches(db, "customers", customer_rows)
+
+    reservation_rows = []
+    for _ in range(reservations):
+        service = rng.choice(services)
+        start = (now - timedelta(days=rng.randrange(-14, 180))).replace(
+            hour=rng.randrange(9, 19), minute=rng.choice([0, 30])
+        )
+        if start < now:
+            status = rng.choices(["completed", "cancelled", "no_show"], weights=[85, 10, 5])[0]
+        else:
+            status = rng.choices(["confirmed", "pending", "cancelled"], weights=[70, 20, 10])[0]
+        reservation_rows.append({
+            "id": str(uuid.uuid4()), "shop_id": shop_id,
+            "customer_id": rng.choice(customer_rows)["id"],
+            "stylist_id": rng.choice(stylists)["id"],
+            "service_id": service["id"],
+            "reservation_datetime": start.isoformat(),
+            "duration_minutes": service["duration_minutes"],
+            "status": status
+        })
+    _insert_batches(db, "reservations", reservation_rows)
+
+    ctx.customer_ids = [row["id"] for row in customer_rows]
+    ctx.service_ids = [row["id"] for row in services]
+    ctx.stylist_ids = [row["id"] for row in stylists]
+    ctx.products = products
+    return ctx
+
+
+def load_context(db, shop_id: str) -> BenchmarkContext:
+    """投入済みのデータからIDを読み込む（--skip-seed時）"""
+    ctx = BenchmarkContext(shop_id)
+    ctx.customer_ids = [row["id"] for row in db.table("customers").select("id").eq("shop_id", shop_id).limit(10000).execute().data]
+    ctx.service_ids = [row["id"] for row in db.table("services").select("id").eq("shop_id", shop_id).execute().data]
+    ctx.stylist_ids = [row["id"] for row in db.table("stylists").select("id").eq("shop_id", shop_id).execute().data]
+    ctx.products = db.table("products").select("id, name, price").eq("shop_id", shop_id).execute().data
+    if not ctx.customer_ids or not ctx.service_ids:
+        raise SystemExit(f"店舗 {shop_id} のデータがありません。--skip-seed を外して投入してください")
+    return ctx
+
+
+# ==================== シナリオ ====================
+
+Request = Tuple[str, str, str, Optional[dict]]  # (シナリオ名, メソッド, パス, JSON本体)
+
+
+def _future_slot(rng: random.Random, days: int) -> datetime:
+    day = datetime.now() + timedelta(days=rng.randrange(1, days + 1))
+    return day.replace(hour=rng.randrange(10, 19), minute=rng.choice([0, 30]), second=0, microsecond=0)
+
+
+def scenario_availability(ctx: BenchmarkContext, rng: random.Random) -> Request:
+    date = (datetime.now() + timedelta(days=rng.randrange(0, 7))).date().isoformat()
+    stylist = rng.choice(ctx.stylist_ids)
+    return ("availability", "GET", f"{API_V1}/reservations/availability/slots?date={date}&stylist_id={stylist}", None)
+
+
+def scenario_catalog(ctx: BenchmarkContext, rng: random.Random) -> Request:
+    return ("catalog", "GET", f"{API_V1}/public/{ctx.shop_id}/catalog", None)
+
+
+def scenario_list_reservations(ctx: BenchmarkContext, rng: random.Random) -> Request:
+    start = (datetime.now() - timedelta(days=rng.randrange(0, 30))).date()
+    end = start + timedelta(days=7)
+    return ("list_reservations", "GET",
+            f"{API_V1}/reservations/?start_date={start}T00:00:00&end_date={end}T00:00:00&page_size=20", None)
+
+
+def scenario_list_customers(ctx: BenchmarkContext, rng: random.Random) -> Request:
+    return ("list_customers", "GET", f"{API_V1}/customers/?page={rng.randrange(1, 50)}&page_size=20", None)
+
+
+def scenario_list_services(ctx: BenchmarkContext, rng: random.Random) -> Request:
+    return ("list_services", "GET", f"{API_V1}/services/", None)
+
+
+def scenario_booking(ctx: BenchmarkContext, rng: random.Random) -> Request:
+    return ("booking", "POST", f"{API_V1}/reservations/", {
+        "customer_id": rng.choice(ctx.customer_ids),
+        "stylist_id": rng.choice(ctx.stylist_ids),
+        "service_id": rng.choice(ctx.service_ids),
+        "reservation_datetime": _future_slot(rng, 30).isoformat(),
+        "duration_minutes": 60
+    })
+
+
+def scenario_create_order(ctx: BenchmarkContext, rng: random.Random) -> Request:
+    items = [{
+        "product_id": product["id"], "name": product["name"],
+        "quantity": rng.randrange(1, 3), "unit_price": product["price"]
+    } for product in rng.sample(ctx.products, rng.randrange(1, 4))]
+    return ("create_order", "POST", f"{API_V1}/orders/", {
+        "customer_id": rng.choice(ctx.customer_ids),
+        "items": items,
+        "payment_method": "cash"
+    })
+
+
+# (シナリオ, 重み) 予約ページの閲覧が大半を占め、書き込みは一部という想定
+TRAFFIC_MIX: List[Tuple[Callable[[BenchmarkContext, random.Random], Request], int]] = [
+    (scenario_availability, 20),
+    (scenario_catalog, 20),
+    (scenario_list_reservations, 15),
+    (scenario_list_customers, 10),
+    (scenario_list_services, 15),
+    (scenario_booking, 12),
+    (scenario_create_order, 8),
+]
+
+
+# ==================== 実行と集計 ====================
+
+def percentile(samples: List[float], q: float) -> float:
+    """最近接順位法によるパーセンタイル"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_traffic(
+    client: httpx.AsyncClient,
+    ctx: BenchmarkContext,
+    total_requests: int,
+    concurrency: int,
+    seed: int
+) -> Tuple[Dict[str, dict], float]:
+    """固定の同時実行数でリクエストを送り、シナリオごとの結果を集計"""
+    scenarios = [scenario for scenario, _ in TRAFFIC_MIX]
+    weights = [weight for _, weight in TRAFFIC_MIX]
+    results: Dict[str, dict] = {}
+    remaining = total_requests
+
+    async def worker(worker_id: int):
+        nonlocal remaining
+        rng = random.Random(seed * 1000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            name, method, path, body = rng.choices(scenarios, weights=weights)[0](ctx, rng)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=ctx.headers)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            elapsed = time.perf_counter() - start
+            entry = results.setdefault(name, {"latencies": [], "errors": 0, "statuses": {}})
+            entry["latencies"].append(elapsed)
+            entry["statuses"][str(status)] = entry["statuses"].get(str(status), 0) + 1
+            # 予約の重複などの4xxは想定内の応答として扱い、5xxと通信エラーのみをエラーとする
+            if status == 0 or status >= 500:
+                entry["errors"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def summarize(results: Dict[str, dict], wall_time: float) -> Dict[str, dict]:
+    """シナリオごとのスループット・エラー数・パーセンタイル（ミリ秒）"""
+    summary = {}
+    for name, entry in sorted(results.items()):
+        latencies = entry["latencies"]
+        summary[name] = {
+            "requests": len(latencies),
+            "errors": entry["errors"],
+            "statuses": entry["statuses"],
+            "throughput_rps": len(latencies) / wall_time if wall_time else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies) * 1000 if latencies else 0.0,
+        }
+    return summary
+
+
+def print_report(summary: Dict[str, dict], wall_time: float, concurrency: int):
+    total = sum(item["requests"] for item in summary.values())
+    print("=" * 92)
+    print(f"  負荷試験結果  同時実行数: {concurrency}  合計: {total}件  所要時間: {wall_time:.1f}秒  "
+          f"全体: {total / wall_time:.1f} req/s")
+    print("=" * 92)
+    print(f"{'シナリオ':<20}{'件数':>8}{'エラー':>8}{'req/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for name, item in summary.items():
+        print(f"{name:<20}{item['requests']:>8}{item['errors']:>8}{item['throughput_rps']:>10.1f}"
+              f"{item['p50_ms']:>10.1f}{item['p95_ms']:>10.1f}{item['p99_ms']:>10.1f}{item['max_ms']:>10.1f}")
+        if set(item["statuses"]) - {"200", "201", "304"}:
+            print(f"{'':<20}ステータス内訳: {item['statuses']}")
+
+
+def check_regression(summary: Dict[str, dict], baseline_path: str, max_regression: float) -> List[str]:
+    """
+    基準結果と比較し、p95の悪化またはスループットの低下がmax_regressionを超えたシナリオを返す
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["scenarios"]
+
+    regressions = []
+    for name, current in summary.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f}ms → {current['p95_ms']:.1f}ms")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{name}: スループット {base['throughput_rps']:.1f} → {current['throughput_rps']:.1f} req/s"
+            )
+    return regressions
+
+
+def build_client(base_url: Optional[str]) -> httpx.AsyncClient:
+    """base_url指定時は起動済みサーバー、未指定時はアプリをプロセス内で直接呼び出す"""
+    if base_url:
+        return httpx.AsyncClient(base_url=base_url, timeout=30.0)
+    from api.main import app
+    # 未処理の例外も500として集計する
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=30.0)
+
+
+def get_backend(backend: str):
+    """
+    データ投入・読み込みに使うクライアント
+
+    アプリと同じクライアントを使うため、api配下を読み込む前にバックエンドを切り替える
+    """
+    settings.SUPABASE_BACKEND = backend
+    from api.supabase_client import supabase
+    return supabase
+
+
+async def main_async(args) -> int:
+    if args.backend == "memory" and (args.base_url or args.skip_seed):
+        print("--backend memory は --base-url / --skip-seed と併用できません")
+        return 2
+
+    db = get_backend(args.backend)
+    from api.auth import create_access_token
+    rng = random.Random(args.seed)
+
+    if args.skip_seed:
+        ctx = load_context(db, args.shop_id)
+    else:
+        print(f"データを投入しています（顧客 {args.customers}件 / 予約 {args.reservations}件）...")
+        started = time.perf_counter()
+        ctx = seed_data(db, args.shop_id, args.customers, args.reservations, rng)
+        print(f"投入完了: {time.perf_counter() - started:.1f}秒")
+
+    ctx.headers = {"Authorization": f"Bearer {create_access_token({'sub': ctx.shop_id}, timedelta(hours=12))}"}
+
+    async with build_client(args.base_url) as client:
+        if args.warmup:
+            await run_traffic(client, ctx, args.warmup, args.concurrency, args.seed + 1)
+        results, wall_time = await run_traffic(client, ctx, args.requests, args.concurrency, args.seed)
+
+    summary = summarize(results, wall_time)
+    print_report(summary, wall_time, args.concurrency)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "wall_time_seconds": wall_time,
+                "scenarios": summary
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+    if args.baseline:
+        regressions = check_regression(summary, args.baseline, args.max_regression)
+        if regressions:
+            print(f"\n性能の悪化を検出しました（許容: {args.max_regression:.0%}）:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"\n基準結果（{args.baseline}）からの悪化はありません")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="予約システムの負荷試験ベンチマーク")
+    parser.add_argument("--backend", choices=["supabase", "memory"], default="supabase",
+                        help="supabase: SUPABASE_URLのPostgREST / memory: インメモリクライアント")
+    parser.add_argument("--base-url", help="起動済みサーバーのURL（省略時はプロセス内で実行）")
+    parser.add_argument("--shop-id", default=BENCHMARK_SHOP_ID, help="ベンチマーク用の店舗ID")
+    parser.add_argument("--customers", type=int, default=10_000, help="投入する顧客数")
+    parser.add_argument("--reservations", type=int, default=100_000, help="投入する予約数")
+    parser.add_argument("--skip-seed", action="store_true", help="データ投入を行わず既存データを使用")
+    parser.add_argument("--requests", type=int, default=2000, help="計測するリクエスト数")
+    parser.add_argument("--warmup", type=int, default=100, help="計測前のウォームアップリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時実行数")
+    parser.add_argument("--seed", type=int, default=42, help="乱数シード（同じ値なら同じリクエスト列）")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較する基準結果のJSONファイル")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="許容する悪化率（0.2 = 20%%）")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main_async(parse_args())))
@@ -0,0 +1,185 @@
+"""
+最適な割引の検索APIのベンチマーク
+数百件のクーポン・キャンペーンを持つ店舗を投入し、POST /api/v1/promotions/best に
+ランダムな注文内容を送ってレイテンシを計測します（p95が目標時間を超えた場合は終了コード1）
+
+使い方:
+    # 外部サービスなしで計測（インメモリクライアント）
+    python scripts/benchmark_promotions.py --backend memory
+
+    # クーポン500件・キャンペーン200件で計測し、結果を保存
+    python scripts/benchmark_promotions.py --backend memory --coupons 500 --campaigns 200 --output promotions.json
+"""
+import sys
+import os
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.benchmark_load import (
+    API_V1,
+    BENCHMARK_SHOP_ID,
+    BenchmarkContext,
+    _insert_batches,
+    build_client,
+    get_backend,
+    percentile,
+    seed_data
+)
+
+# 最適な割引の検索の目標時間（p95）
+BEST_PROMOTION_BUDGET_MS = 20.0
+
+
+def _window(rng: random.Random, now: datetime) -> tuple:
+    """有効期間（8割が期間中、1割が開始前、1割が終了済み）"""
+    kind = rng.choices(["active", "future", "ended"], weights=[8, 1, 1])[0]
+    if kind == "future":
+        start = now + timedelta(days=rng.randrange(1, 30))
+    elif kind == "ended":
+        start = now - timedelta(days=rng.randrange(31, 90))
+        return start, start + timedelta(days=rng.randrange(1, 30))
+    else:
+        start = now - timedelta(days=rng.randrange(1, 30))
+    return start, start + timedelta(days=rng.randrange(31, 90))
+
+
+def seed_promotions(db, ctx: BenchmarkContext, coupons: int, campaigns: int, rng: random.Random) -> None:
+    """条件の異なるクーポン・キャンペーンを投入"""
+    now = datetime.now(timezone.utc)
+    coupon_rows = []
+    for i in range(coupons):
+        start, end = _window(rng, now)
+        percentage = rng.random() < 0.5
+        coupon_rows.append({
+            "id": str(uuid.uuid4()), "shop_id": ctx.shop_id,
+            "code": f"BENCH{i:05d}", "name": f"ベンチマーククーポン{i + 1}",
+            "coupon_type": "percentage" if percentage else "fixed_amount",
+            "discount_value": rng.choice([5, 10, 15, 20]) if percentage else rng.choice([300, 500, 1000]),
+            "min_purchase_amount": rng.choice([None, 3000, 5000, 10000]),
+            "max_discount_amount": rng.choice([None, 1000, 2000]) if percentage else None,
+            "valid_from": start.isoformat(), "valid_until": end.isoformat(),
+            "usage_limit": rng.choice([None, 100, 1000]), "usage_count": 0,
+            "is_active": True,
+            "applicable_services": rng.sample(ctx.service_ids, 2) if rng.random() < 0.3 else None
+        })
+    campaign_rows = []
+    for i in range(campaigns):
+        start, end = _window(rng, now)
+        target_audience = None
+        if rng.random() < 0.2:
+            target_audience = {"new_customers_only": True}
+        elif rng.random() < 0.2:
+            target_audience = {"customer_ids": rng.sample(ctx.customer_ids, 20)}
+        campaign_rows.append({
+            "id": str(uuid.uuid4()), "shop_id": ctx.shop_id,
+            "name": f"ベンチマークキャンペーン{i + 1}", "status": "active", "is_active": True,
+            "start_date": start.isoformat(), "end_date": end.isoformat(),
+            "discount_type": rng.choice(["percentage", "fixed_amount"]),
+            "discount_value": rng.choice([5, 10, 500, 800]),
+            "target_audience": target_audience,
+            "conditions": {"min_purchase_amount": rng.choice([3000, 8000])} if rng.random() < 0.5 else None
+        })
+    _insert_batches(db, "coupons", coupon_rows)
+    _insert_batches(db, "campaigns", campaign_rows)
+
+
+def random_basket(ctx: BenchmarkContext, rng: random.Random) -> dict:
+    """ランダムな注文内容（サービス1〜2件と商品0〜2件）"""
+    items = [{
+        "service_id": service_id, "name": "サービス", "quantity": 1,
+        "unit_price": rng.choice([4400, 6600, 9900])
+    } for service_id in rng.sample(ctx.service_ids, rng.randint(1, 2))]
+    items += [{
+        "product_id": product["id"], "name": product["name"], "quantity": 1, "unit_price": product["price"]
+    } for product in rng.sample(ctx.products, rng.randint(0, 2))]
+    return {"items": items, "customer_id": rng.choice(ctx.customer_ids)}
+
+
+async def main_async(args) -> int:
+    db = get_backend(args.backend)
+    from api.auth import create_access_token
+    rng = random.Random(args.seed)
+
+    print(f"データを投入しています（クーポン {args.coupons}件 / キャンペーン {args.campaigns}件）...")
+    ctx = seed_data(db, args.shop_id, args.customers, 0, rng)
+    seed_promotions(db, ctx, args.coupons, args.campaigns, rng)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': ctx.shop_id}, timedelta(hours=1))}"}
+
+    path = f"{API_V1}/promotions/best"
+    latencies: List[float] = []
+    found = 0
+    errors = 0
+    async with build_client(None) as client:
+        for i in range(args.warmup + args.requests):
+            body = random_basket(ctx, rng)
+            started = time.perf_counter()
+            response = await client.post(path, json=body, headers=headers)
+            elapsed = (time.perf_counter() - started) * 1000
+            if i < args.warmup:
+                continue
+            latencies.append(elapsed)
+            if response.status_code != 200:
+                errors += 1
+            elif response.json().get("best"):
+                found += 1
+
+    summary = {
+        "requests": args.requests,
+        "errors": errors,
+        "found": found,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": max(latencies),
+        "budget_ms": args.budget_ms
+    }
+    print(f"リクエスト: {args.requests}件  エラー: {errors}件  割引あり: {found}件")
+    print(f"平均 {summary['mean_ms']:.2f} ms  p50 {summary['p50_ms']:.2f} ms  "
+          f"p95 {summary['p95_ms']:.2f} ms  p99 {summary['p99_ms']:.2f} ms  max {summary['max_ms']:.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "coupons": args.coupons,
+                "campaigns": args.campaigns,
+                **summary
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+    if errors or summary["p95_ms"] > args.budget_ms:
+        print(f"\n[NG] 目標時間を超えたか、エラーがあります（p95 {summary['p95_ms']:.2f} ms / 目標 {args.budget_ms} ms）")
+        return 1
+    print(f"\n[OK] 目標時間内です: p95 {summary['p95_ms']:.2f} ms <= {args.budget_ms} ms")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="最適な割引の検索APIのベンチマーク")
+    parser.add_argument("--backend", choices=["supabase", "memory"], default="supabase",
+                        help="supabase: SUPABASE_URLのPostgREST / memory: インメモリクライアント")
+    parser.add_argument("--shop-id", default=BENCHMARK_SHOP_ID, help="ベンチマーク用の店舗ID")
+    parser.add_argument("--customers", type=int, default=1000, help="投入する顧客数")
+    parser.add_argument("--coupons", type=int, default=300, help="投入するクーポン数")
+    parser.add_argument("--campaigns", type=int, default=100, help="投入するキャンペーン数")
+    parser.add_argument("--requests", type=int, default=1000, help="計測するリクエスト数")
+    parser.add_argument("--warmup", type=int, default=20, help="計測前のウォームアップリクエスト数")
+    parser.add_argument("--budget-ms", type=float, default=BEST_PROMOTION_BUDGET_MS, help="p95の目標時間（ミリ秒）")
+    parser.add_argument("--seed", type=int, default=42, help="乱数シード")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main_async(parse_args())))
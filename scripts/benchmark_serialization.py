@@ -0,0 +1,129 @@
+"""
+レスポンスシリアライズ・圧縮ベンチマーク
+list_orders の100件ページ相当のPaginatedResponseについて、
+JSONResponse と ORJSONResponse のシリアライズ時間、および圧縮後の転送バイト数を比較します
+
+使い方:
+    python scripts/benchmark_serialization.py [繰り返し回数]
+"""
+import sys
+import os
+import gzip
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from api.schemas import PaginatedResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+PAGE_SIZE = 100
+
+
+def build_order_page(page_size: int = PAGE_SIZE) -> dict:
+    """list_ordersの1ページ分に相当するレスポンスを生成"""
+    random.seed(42)
+    now = datetime.now()
+    items = []
+    for i in range(page_size):
+        order_items = [
+            {
+                "product_id": str(uuid.uuid4()),
+                "service_id": None,
+                "name": f"ヘアケア商品 {j}",
+                "quantity": random.randint(1, 3),
+                "unit_price": random.choice([1500, 2800, 3500, 4200])
+            }
+            for j in range(random.randint(1, 5))
+        ]
+        total = sum(item["quantity"] * item["unit_price"] for item in order_items)
+        created_at = now - timedelta(hours=i)
+        items.append({
+            "id": str(uuid.uuid4()),
+            "customer_id": str(uuid.uuid4()),
+            "reservation_id": str(uuid.uuid4()) if i % 2 == 0 else None,
+            "total_amount": total,
+            "discount_amount": 0,
+            "final_amount": total,
+            "status": "paid",
+            "payment_method": "credit_card",
+            "payment_id": None,
+            "notes": "店頭で受け取り" if i % 3 == 0 else None,
+            "items": order_items,
+            "shop_id": "shop_benchmark",
+            "created_at": created_at.isoformat(),
+            "updated_at": created_at.isoformat()
+        })
+
+    response = PaginatedResponse(
+        items=items,
+        total=1000,
+        page=1,
+        page_size=page_size,
+        total_pages=10
+    )
+    return jsonable_encoder(response)
+
+
+def time_render(response_class, content: dict, iterations: int) -> tuple[float, bytes]:
+    """レスポンスクラスのrender()にかかる1回あたりの時間（ミリ秒）を計測"""
+    body = response_class(content).body
+    start = time.perf_counter()
+    for _ in range(iterations):
+        response_class(content)
+    elapsed = time.perf_counter() - start
+    return elapsed / iterations * 1000, body
+
+
+def main(iterations: int = 500):
+    """ベンチマークを実行"""
+    content = build_order_page()
+
+    print("=" * 60)
+    print(f"  list_orders {PAGE_SIZE}件ページのシリアライズ ({iterations}回平均)")
+    print("=" * 60)
+
+    results = {}
+    for name, response_class in [("JSONResponse", JSONResponse), ("ORJSONResponse", ORJSONResponse)]:
+        ms, body = time_render(response_class, content, iterations)
+        results[name] = (ms, body)
+        print(f"{name:<16} {ms:8.3f} ms/回  {len(body):>8,} bytes")
+
+    json_ms = results["JSONResponse"][0]
+    orjson_ms = results["ORJSONResponse"][0]
+    print(f"高速化率: {json_ms / orjson_ms:.1f}x")
+
+    body = results["ORJSONResponse"][1]
+    print()
+    print("=" * 60)
+    print("  転送バイト数")
+    print("=" * 60)
+    print(f"{'非圧縮':<16} {len(body):>8,} bytes")
+
+    start = time.perf_counter()
+    gzipped = gzip.compress(body, compresslevel=6)
+    gzip_ms = (time.perf_counter() - start) * 1000
+    print(f"{'gzip (level 6)':<16} {len(gzipped):>8,} bytes  ({len(gzipped) / len(body):.1%}, {gzip_ms:.2f} ms)")
+
+    if brotli is not None:
+        start = time.perf_counter()
+        compressed = brotli.compress(body, quality=4)
+        brotli_ms = (time.perf_counter() - start) * 1000
+        print(f"{'brotli (q 4)':<16} {len(compressed):>8,} bytes  ({len(compressed) / len(body):.1%}, {brotli_ms:.2f} ms)")
+    else:
+        print("brotli: 未インストールのためスキップ")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    main(count)
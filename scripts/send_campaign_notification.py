@@ -0,0 +1,82 @@
+"""
+キャンペーン通知の一斉送信スクリプト
+キャンペーンの送信対象の顧客にお知らせメールを送信し、進捗を送信ジョブに記録します
+
+使い方:
+    # キャンペーンの target_audience の顧客に送信
+    python scripts/send_campaign_notification.py --campaign-id <キャンペーンID>
+
+    # 件名・本文を指定し、1秒あたり5通に制限して送信
+    python scripts/send_campaign_notification.py --campaign-id <キャンペーンID> \\
+        --subject "{campaign_name}のご案内" --body-file body.txt --rate 5
+
+    # 中断・失敗したジョブを続きから送信
+    python scripts/send_campaign_notification.py --resume <ジョブID>
+"""
+import sys
+import os
+import argparse
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.supabase_client import supabase
+from api.logger import logger
+from marketing.campaign_notifier import CampaignNotifier, TEMPLATE_FIELDS
+
+
+def _read_lines(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="キャンペーン通知の一斉送信")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--campaign-id", help="送信するキャンペーンのID")
+    target.add_argument("--resume", metavar="JOB_ID", help="続きから送信するジョブのID")
+    parser.add_argument("--customer-ids-file", help="送信先の顧客IDを1行に1件ずつ書いたファイル（省略時はキャンペーンの対象顧客）")
+    parser.add_argument("--subject", help=f"件名のテンプレート（差し込み項目: {', '.join(TEMPLATE_FIELDS)}）")
+    parser.add_argument("--body-file", help="本文のテンプレートを書いたファイル")
+    parser.add_argument("--chunk-size", type=int, help="1回に読み込む顧客数")
+    parser.add_argument("--pool-size", type=int, help="同時に使うSMTP接続の数")
+    parser.add_argument("--rate", type=float, help="1秒あたりの送信数の上限")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    notifier = CampaignNotifier(
+        supabase,
+        chunk_size=args.chunk_size,
+        pool_size=args.pool_size,
+        rate_per_second=args.rate
+    )
+
+    try:
+        if args.resume:
+            job = notifier.resume(args.resume)
+        else:
+            body = None
+            if args.body_file:
+                with open(args.body_file, encoding="utf-8") as f:
+                    body = f.read()
+            customer_ids = _read_lines(args.customer_ids_file) if args.customer_ids_file else None
+            job = notifier.start(args.campaign_id, customer_ids, args.subject, body)
+    except ValueError as e:
+        logger.error(f"キャンペーン通知を送信できません: {str(e)}")
+        print(f"エラー: {e}")
+        return 1
+
+    print(f"ジョブ: {job['id']}  状態: {job['status']}")
+    print(f"送信: {job.get('sent_count') or 0}件  失敗: {job.get('failed_count') or 0}件  "
+          f"メールアドレスなし: {job.get('skipped_count') or 0}件")
+    if job["status"] != "completed":
+        print(f"エラー: {job.get('last_error')}")
+        print(f"続きから送信するには: python scripts/send_campaign_notification.py --resume {job['id']}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,19 @@
 """
 キャンペーンステータス更新スクリプト
 キャンペーンの開始・終了を自動的に更新
+
+--check を指定すると、インメモリのデータベースで前回の実行から終了日時を過ぎたキャンペーンが
+1回の実行で終了することを確認する（外部サービスは不要）
 """
 import sys
 import os
+import argparse
+from datetime import datetime, timedelta, timezone
 
 # プロジェクトルートをパスに追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from marketing.campaign_manager import get_campaign_manager
+from marketing.campaign_manager import CampaignManager, get_campaign_manager
 from api.logger import logger
 
 
@@ -18,17 +23,57 @@ def update_campaign_statuses():
     
     try:
         campaign_manager = get_campaign_manager()
-        campaign_manager.update_campaign_status()
-        logger.info("キャンペーンステータスの更新が完了しました")
+        changed = campaign_manager.update_campaign_status()
+        logger.info(f"キャンペーンステータスの更新が完了しました（{changed}件）")
     except Exception as e:
         logger.error(f"キャンペーンステータスの更新中にエラーが発生しました: {str(e)}")
 
 
-if __name__ == "__main__":
-    update_campaign_statuses()
-
-
-
-
+def check_ended_campaigns() -> bool:
+    """終了日時を過ぎた実施中・未開始のキャンペーンが1回の更新で終了するかを確認"""
+    from api.memory_client import MemorySupabaseClient
+    from api.memory_functions import register_memory_functions
+    
+    db = register_memory_functions(MemorySupabaseClient.from_schema_files())
+    now = datetime.now(timezone.utc)
+    db.table("shops").insert({"id": "check", "email": "check@example.com", "name": "check", "password_hash": "x"}).execute()
+    campaigns = {
+        "実施中で終了日時を過ぎたもの": ("active", now - timedelta(days=1), now - timedelta(minutes=3)),
+        "開始しないまま期間を過ぎたもの": ("draft", now - timedelta(days=1), now - timedelta(minutes=3)),
+        "実施中のもの": ("active", now - timedelta(days=1), now + timedelta(days=1)),
+    }
+    ids = {}
+    for name, (status, start, end) in campaigns.items():
+        ids[name] = db.table("campaigns").insert({
+            "shop_id": "check",
+            "name": name,
+            "status": status,
+            "is_active": True,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "discount_type": "percentage",
+            "discount_value": 10
+        }).execute().data[0]["id"]
+    
+    CampaignManager(db).update_campaign_status()
+    
+    ok = True
+    for name, expected in (
+        ("実施中で終了日時を過ぎたもの", "ended"),
+        ("開始しないまま期間を過ぎたもの", "ended"),
+        ("実施中のもの", "active"),
+    ):
+        row = db.table("campaigns").select("status, is_active").eq("id", ids[name]).execute().data[0]
+        passed = row["status"] == expected and row["is_active"] == (expected == "active")
+        ok = ok and passed
+        print(f"{'[OK]' if passed else '[NG]'} {name}: status={row['status']} is_active={row['is_active']}")
+    return ok
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="キャンペーンステータスの更新")
+    parser.add_argument("--check", action="store_true", help="インメモリのデータベースで終了処理を確認する")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check_ended_campaigns() else 1)
+    update_campaign_statuses()